@@ -2,6 +2,7 @@
 from .battle import router as battle_router
 from .chat import router as chat_router
 from .leaderboard import router as leaderboard_router
+from .admin import router as admin_router
 
-__all__ = ["battle_router", "chat_router", "leaderboard_router"]
+__all__ = ["battle_router", "chat_router", "leaderboard_router", "admin_router"]
 
@@ -0,0 +1,164 @@
+"""Admin 运维 API（请求头 X-Admin-Token 须与 config.ADMIN_TOKEN 相同）"""
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+
+from models.database import get_db
+from models.schemas import Vote
+from services.model_service import get_model_service
+from services.usage import UsageService, get_usage_ledger
+from services.vote_queue import get_vote_queue
+from services.rating_rebuild import rebuild_ratings, take_snapshot
+from services.bradley_terry import get_bradley_terry
+import config
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """
+    校验运维令牌：未配置 ADMIN_TOKEN 时一律 403（运维 API 未启用）
+    缺少令牌返回 401，令牌错误返回 403
+    """
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="运维 API 未启用（未配置 ADMIN_TOKEN）")
+    if not x_admin_token:
+        raise HTTPException(status_code=401, detail="缺少运维令牌（X-Admin-Token）")
+    if not secrets.compare_digest(x_admin_token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="运维令牌无效")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin_token)])
+model_service = get_model_service()
+
+
+class UpstreamStatusResponse(BaseModel):
+    """上游调用状态响应"""
+    concurrency: Dict[str, Dict]
+    breakers: Dict[str, Dict]
+    retries: Dict[str, int]
+    failovers: Dict[str, int]
+    hedging: Dict
+    rate_limits: Dict[str, Dict]
+    endpoints: Dict[str, Dict]
+
+
+@router.get("/upstream", response_model=UpstreamStatusResponse)
+async def get_upstream_status():
+    """
+    查看各模型的上游调用状态
+    - 自适应并发上限、在途请求数、排队数、累计拒绝数
+    - 熔断器状态、重试与端点切换次数、对冲请求统计
+    - RPM/TPM 限流状态，以及各端点的 EWMA 延迟与错误率
+    """
+    return UpstreamStatusResponse(
+        concurrency=model_service.get_concurrency_stats(),
+        breakers=model_service.get_breaker_stats(),
+        retries=model_service.get_retry_stats(),
+        failovers=model_service.get_failover_stats(),
+        hedging=model_service.get_hedge_stats(),
+        rate_limits=model_service.get_rate_limit_stats(),
+        endpoints=model_service.get_endpoint_stats()
+    )
+
+
+class UsageResponse(BaseModel):
+    """上游用量汇总响应"""
+    since: str
+    models: List[Dict]
+    total_cost: float
+    total_votes: int
+    cost_per_vote: Optional[float]
+    ledger: Dict
+
+
+@router.get("/usage", response_model=UsageResponse)
+async def get_usage(
+    hours: float = Query(24, gt=0, le=24 * 90),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    查看最近 hours 小时的上游用量（按模型）
+    - 调用数、失败数、输入/输出 token、平均首 token 延迟与总耗时、平均生成速度（tokens/s）
+    - 按 config.MODEL_PRICING 计算的费用，以及每票成本（费用 / 该模型参与的投票数）
+    - ledger: 后台写入器状态（待写入、已写入、丢弃条数，重试次数，重试后仍失败的条数）
+    """
+    rollup = await UsageService.rollup(db, hours)
+    return UsageResponse(**rollup, ledger=get_usage_ledger().stats())
+
+
+class VoteQueueResponse(BaseModel):
+    """投票排队模式状态响应"""
+    enabled: bool
+    pending: int
+    applied: int
+    batches: int
+    retries: int
+    failed: int
+    recovered: int
+    unapplied: int
+
+
+@router.get("/votes", response_model=VoteQueueResponse)
+async def get_vote_queue_status(db: AsyncSession = Depends(get_db)):
+    """
+    查看投票排队模式的状态
+    - pending: 本进程队列中等待应用的票数；applied / batches: 已应用的票数与批次数
+    - retries: 批次失败后的重试次数；failed: 重试后仍失败（留待定期补偿）的票数；recovered: 定期补偿应用的票数
+    - unapplied: votes 表中评分尚未应用的票数（含其他实例的队列与失败的批次）
+    """
+    result = await db.execute(
+        select(func.count()).select_from(Vote).where(Vote.rating_applied == 0)
+    )
+    return VoteQueueResponse(**get_vote_queue().stats(), unapplied=result.scalar_one())
+
+
+class RatingRebuildResponse(BaseModel):
+    """评分重建 / 快照响应"""
+    mode: Optional[str] = None
+    snapshot_id: int
+    based_on: Optional[int]
+    votes_until: str
+    replayed_votes: int
+    total_votes: int
+    models: Optional[int] = None
+    seconds: float
+
+
+@router.post("/ratings/rebuild", response_model=RatingRebuildResponse)
+async def rebuild_model_ratings(full: bool = Query(False)):
+    """
+    按 votes 重建评分表（model_ratings），并保存新的评分快照
+    - full=false：从最近的快照增量重放（没有快照时为全量）
+    - full=true：忽略快照，重放全部投票
+    """
+    return RatingRebuildResponse(**await rebuild_ratings(full=full))
+
+
+@router.post("/ratings/snapshot", response_model=RatingRebuildResponse)
+async def create_rating_snapshot():
+    """生成一个评分快照（不修改评分表）"""
+    return RatingRebuildResponse(**await take_snapshot())
+
+
+class BradleyTerrySummary(BaseModel):
+    """Bradley–Terry 排行榜计算摘要"""
+    updated_at: Optional[str]
+    votes: Optional[int] = None
+    models: Optional[int] = None
+    iterations: Optional[int] = None
+    bootstrap_rounds: Optional[int] = None
+    seconds: Optional[float] = None
+
+
+@router.post("/ratings/bradley-terry", response_model=BradleyTerrySummary)
+async def refresh_bradley_terry():
+    """
+    立即重新拟合 Bradley–Terry 评分与置信区间（否则每 config.BT_REFRESH_INTERVAL 秒自动刷新）
+    已有刷新在进行、或距上次刷新不到 config.BT_MANUAL_REFRESH_INTERVAL 秒时返回上一次的结果
+    """
+    return BradleyTerrySummary(
+        **await get_bradley_terry().refresh(min_interval=config.BT_MANUAL_REFRESH_INTERVAL)
+    )
@@ -1,19 +1,28 @@
 """Battle 对战模式 API"""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import exists, select, inspect, insert, update
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from typing import Dict, List, Optional, Tuple
 import random
 
 from models.database import get_db
-from models.schemas import Battle, Vote
-from services.model_service import ModelService
+from models.schemas import AbandonedTurn, Battle, Vote, generate_uuid
+from services.model_service import get_model_service
+from services.battle_token import (
+    InvalidBattleToken, issue_battle_token, is_battle_token, unverified_battle_id, verify_battle_token
+)
+from services.conversation import load_conversation, first_user_message_query
 from services.rating_service import RatingService
+from services.vote_queue import get_vote_queue
+from .sse import EventStreamResponse
+from .disconnect import ClientDisconnected
+from .turns import DualTurn
 import config
 
 router = APIRouter(prefix="/api/battle", tags=["battle"])
-model_service = ModelService()
+model_service = get_model_service()
 
 
 class StartBattleResponse(BaseModel):
@@ -29,10 +38,12 @@ class ChatRequest(BaseModel):
 
 
 class ChatResponse(BaseModel):
-    """聊天响应"""
+    """聊天响应（某一侧调用失败时该侧回复为空，error_a / error_b 为错误信息，本轮不写入对话历史）"""
     session_id: str
     response_a: str
     response_b: str
+    error_a: Optional[str] = None
+    error_b: Optional[str] = None
 
 
 class VoteRequest(BaseModel):
@@ -66,35 +77,116 @@ class RevealResponse(BaseModel):
     winner: Optional[str]
 
 
+def _new_battle(battle_id: str, model_a_id: str, model_b_id: str) -> Battle:
+    return Battle(
+        id=battle_id,
+        model_a_id=model_a_id,
+        model_b_id=model_b_id,
+        is_revealed=0
+    )
+
+
+async def _load_battle(db: AsyncSession, session_id: str) -> Battle:
+    """
+    按 session_id 取对战
+    session_id 为对战令牌且首次对话前尚未建记录时，返回一个未保存的 Battle（首次保存对话时写库）
+    令牌签名不匹配（如签名密钥已更换）时只查找已有的对战记录
+    """
+    claims = None
+    battle_id = session_id
+    if is_battle_token(session_id):
+        try:
+            claims = verify_battle_token(session_id)
+            battle_id = claims.battle_id
+        except InvalidBattleToken:
+            battle_id = unverified_battle_id(session_id)
+            if battle_id is None:
+                raise HTTPException(status_code=404, detail="对战会话不存在")
+    
+    result = await db.execute(
+        select(Battle).where(Battle.id == battle_id)
+    )
+    battle = result.scalar_one_or_none()
+    if battle:
+        return battle
+    
+    if claims is None:
+        raise HTTPException(status_code=404, detail="对战会话不存在")
+    if claims.expired:
+        raise HTTPException(status_code=404, detail="对战已过期，请开始新的对战")
+    return _new_battle(claims.battle_id, claims.model_a_id, claims.model_b_id)
+
+
+async def _battle_models(db: AsyncSession, session_id: str):
+    """
+    按 session_id 取 (对战 ID, 模型 A, 模型 B)
+    对战令牌直接从签名中取出，不查库；旧版的对战 ID、以及签名不匹配（如签名密钥已更换）的令牌查一次对战表
+    """
+    battle_id = session_id
+    if is_battle_token(session_id):
+        try:
+            claims = verify_battle_token(session_id)
+            return claims.battle_id, claims.model_a_id, claims.model_b_id
+        except InvalidBattleToken:
+            battle_id = unverified_battle_id(session_id)
+            if battle_id is None:
+                raise HTTPException(status_code=404, detail="对战会话不存在")
+    
+    result = await db.execute(
+        select(Battle.model_a_id, Battle.model_b_id).where(Battle.id == battle_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="对战会话不存在")
+    return battle_id, row.model_a_id, row.model_b_id
+
+
+async def _load_history(db: AsyncSession, session_id: str) -> Tuple[Battle, bool, List[Dict], int]:
+    """
+    按 session_id 取对战与对话历史，返回 (对战, 是否尚未建记录, 对话, 下一轮次)
+    对战令牌直接从签名中取出模型，只读一次消息表：对战记录随首轮消息一起写入，没有消息即尚未建记录
+    旧版的对战 ID、以及签名不匹配的令牌先查对战表
+    """
+    if is_battle_token(session_id):
+        try:
+            claims = verify_battle_token(session_id)
+        except InvalidBattleToken:
+            claims = None
+        if claims is not None:
+            battle = _new_battle(claims.battle_id, claims.model_a_id, claims.model_b_id)
+            conversation, turn = await load_conversation(db, claims.battle_id)
+            if conversation:
+                return battle, False, conversation, turn
+            if claims.expired:
+                raise HTTPException(status_code=404, detail="对战已过期，请开始新的对战")
+            return battle, True, [], 0
+    
+    battle = await _load_battle(db, session_id)
+    is_new = inspect(battle).transient
+    conversation, turn = ([], 0) if is_new else await load_conversation(db, battle.id)
+    return battle, is_new, conversation, turn
+
+
 @router.post("/start", response_model=StartBattleResponse)
-async def start_battle(db: AsyncSession = Depends(get_db)):
+async def start_battle():
     """
     开始新的对战会话
-    随机选择两个不同的模型
+    随机选择两个不同的模型，返回签名的对战令牌作为 session_id（不写库，首次对话时才创建对战记录）
     """
-    # 随机选择两个不同的模型
-    available_models = config.AVAILABLE_MODELS
-    if len(available_models) < 2:
+    # 随机选择两个不同的模型（跳过熔断中的模型）
+    if len(config.AVAILABLE_MODELS) < 2:
         raise HTTPException(status_code=500, detail="可用模型数量不足")
     
+    available_models = model_service.get_pairable_models()
+    if len(available_models) < 2:
+        raise HTTPException(status_code=503, detail="当前可用模型不足，请稍后再试")
+    
     selected_models = random.sample(available_models, 2)
     model_a = selected_models[0]
     model_b = selected_models[1]
     
-    # 创建对战会话
-    battle = Battle(
-        model_a_id=model_a["id"],
-        model_b_id=model_b["id"],
-        conversation=[],
-        is_revealed=0
-    )
-    
-    db.add(battle)
-    await db.commit()
-    await db.refresh(battle)
-    
     return StartBattleResponse(
-        session_id=battle.id,
+        session_id=issue_battle_token(model_a["id"], model_b["id"]),
         message="对战开始！请输入你的问题，两个匿名模型将同时回答。"
     )
 
@@ -102,47 +194,56 @@ async def start_battle(db: AsyncSession = Depends(get_db)):
 @router.post("/chat", response_model=ChatResponse)
 async def battle_chat(
     request: ChatRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
     在对战模式下发送消息
-    两个模型同时回复
+    两个模型同时回复；客户端中途断开时取消上游调用，本轮记为放弃
+    某一侧调用失败时返回该侧的错误，本轮同样记为放弃（不写入对话历史），这场对战之后不能投票
     """
-    # 获取对战会话
-    result = await db.execute(
-        select(Battle).where(Battle.id == request.session_id)
-    )
-    battle = result.scalar_one_or_none()
-    
-    if not battle:
-        raise HTTPException(status_code=404, detail="对战会话不存在")
-    
-    # 构建消息历史
-    messages = battle.conversation.copy() if battle.conversation else []
-    messages.append({"role": "user", "content": request.message})
-    
-    # 同时调用两个模型
-    response_a, response_b = await model_service.get_dual_completion(
-        battle.model_a_id,
-        battle.model_b_id,
-        messages
+    # 获取对战会话与对话历史（令牌的首轮对话时尚未建记录）
+    battle, is_new, conversation, turn = await _load_history(db, request.session_id)
+    dual = DualTurn.prepare(
+        "battle", battle.id, turn, battle.model_a_id, battle.model_b_id, conversation, request.message,
+        new_session=battle if is_new else None
     )
-    
-    # 更新对话历史
-    messages.append({"role": "assistant", "content": f"[Model A]: {response_a}"})
-    messages.append({"role": "assistant", "content": f"[Model B]: {response_b}"})
-    
-    battle.conversation = messages
-    battle.model_a_response = response_a
-    battle.model_b_response = response_b
-    
-    await db.commit()
+    try:
+        responses, errors = await dual.complete(http_request, db)
+    except ClientDisconnected:
+        # 499: 客户端已关闭连接（沿用 nginx 的约定），响应不会被读取
+        return Response(status_code=499)
     
     return ChatResponse(
-        session_id=battle.id,
-        response_a=response_a,
-        response_b=response_b
+        session_id=request.session_id,
+        response_a=responses.get("a", ""),
+        response_b=responses.get("b", ""),
+        error_a=errors.get("a"),
+        error_b=errors.get("b")
+    )
+
+
+@router.post("/chat/stream")
+async def battle_chat_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    在对战模式下发送消息（流式）
+    两个模型的增量输出合并为一个 SSE 响应：
+    - event: a / b      增量文本 {"delta": "..."}
+    - event: done       某一侧生成完毕 {"side": "a"}
+    - event: error      某一侧调用失败 {"side": "a", "message": "..."}
+    - event: end        两侧均结束 {"session_id": "...", "saved": true}
+    有一侧失败时本轮不写入对话历史（saved 为 false），记为放弃，这场对战之后不能投票；
+    客户端中途断开时关闭两侧上游流，本轮同样记为放弃
+    """
+    battle, is_new, conversation, turn = await _load_history(db, request.session_id)
+    dual = DualTurn.prepare(
+        "battle", battle.id, turn, battle.model_a_id, battle.model_b_id, conversation, request.message,
+        new_session=battle if is_new else None
     )
+    return EventStreamResponse(dual.events(request.session_id))
 
 
 @router.post("/vote", response_model=VoteResponse)
@@ -153,65 +254,92 @@ async def submit_vote(
     """
     提交投票并更新积分制评分
     投票后揭示模型身份
+
+    同一个事务：条件更新对战结果（只有尚未投票、没有调用失败轮次的对战会被更新）→ 插入投票记录 → 相对更新两个模型的评分
+    并发的重复投票只有一个能更新对战结果，votes.battle_id 的唯一约束兜底
+    排队模式（config.VOTE_QUEUE_ENABLED）下不在事务中更新评分，提交后交给后台批量应用
     """
-    # 获取对战会话
-    result = await db.execute(
-        select(Battle).where(Battle.id == request.session_id)
-    )
-    battle = result.scalar_one_or_none()
-    
-    if not battle:
-        raise HTTPException(status_code=404, detail="对战会话不存在")
-    
-    if battle.winner:
-        raise HTTPException(status_code=400, detail="该对战已经投过票了")
-    
     if request.winner not in ["model_a", "model_b", "tie"]:
         raise HTTPException(status_code=400, detail="无效的投票选项")
     
-    # 更新对战结果
-    battle.winner = request.winner
-    battle.is_revealed = 1
-    
-    # 记录投票
-    user_prompt = ""
-    if battle.conversation:
-        for msg in battle.conversation:
-            if msg.get("role") == "user":
-                user_prompt = msg.get("content", "")
-                break
-    
-    vote = Vote(
-        battle_id=battle.id,
-        winner=request.winner,
-        model_a_id=battle.model_a_id,
-        model_b_id=battle.model_b_id,
-        user_prompt=user_prompt
+    battle_id, model_a_id, model_b_id = await _battle_models(db, request.session_id)
+    
+    # 有一侧调用失败的轮次（用户看到了错误而不是回答）不能比较，整场对战不计票
+    failed_turn = exists().where(
+        AbandonedTurn.session_id == battle_id, AbandonedTurn.error.is_not(None)
     )
-    db.add(vote)
-    
-    # 更新评分（积分制）
-    new_rating_a, new_rating_b = await RatingService.update_ratings(
-        db,
-        battle.model_a_id,
-        battle.model_b_id,
-        request.winner,
-        source="battle",
+    
+    # 更新对战结果
+    result = await db.execute(
+        update(Battle)
+        .where(Battle.id == battle_id, Battle.winner.is_(None), ~failed_turn)
+        .values(winner=request.winner, is_revealed=1)
+        .execution_options(synchronize_session=False)
     )
+    if result.rowcount == 0:
+        await db.rollback()
+        voted = await db.execute(select(Battle.winner).where(Battle.id == battle_id))
+        winner = voted.one_or_none()
+        if winner is not None and winner.winner is not None:
+            raise HTTPException(status_code=400, detail="该对战已经投过票了")
+        if (await db.execute(select(failed_turn))).scalar():
+            raise HTTPException(status_code=400, detail="这场对战中有模型调用失败，不能投票，请开始新的对战")
+        raise HTTPException(status_code=400, detail="请先发送消息再投票")
     
-    await db.commit()
+    queued = config.VOTE_QUEUE_ENABLED
+    vote_id = generate_uuid()
+    try:
+        # 记录投票（user_prompt 在库内从 messages 表复制）
+        await db.execute(
+            insert(Vote).values(
+                id=vote_id,
+                battle_id=battle_id,
+                winner=request.winner,
+                model_a_id=model_a_id,
+                model_b_id=model_b_id,
+                user_prompt=first_user_message_query(battle_id),
+                rating_applied=0 if queued else 1
+            )
+        )
+        
+        if queued:
+            # 评分稍后批量累加，这里返回当前评分加上本票的积分
+            rating_a, rating_b = await RatingService.current_ratings(db, model_a_id, model_b_id)
+            new_rating_a, new_rating_b = RatingService.calculate_new_ratings(
+                rating_a, rating_b, request.winner
+            )
+        else:
+            # 更新评分（积分制）
+            new_rating_a, new_rating_b = await RatingService.update_ratings(
+                db,
+                model_a_id,
+                model_b_id,
+                request.winner,
+                source="battle",
+            )
+        
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="该对战已经投过票了")
+    
+    if queued:
+        get_vote_queue().submit(vote_id)
+    else:
+        # 本进程的排行榜缓存立即反映这张投票；其他实例的缓存最多滞后 LEADERBOARD_CACHE_TTL 秒
+        RatingService.invalidate_leaderboard()
     
     # 获取模型名称
-    model_a_info = model_service.get_model_info(battle.model_a_id)
-    model_b_info = model_service.get_model_info(battle.model_b_id)
+    model_a_info = model_service.get_model_info(model_a_id)
+    model_b_info = model_service.get_model_info(model_b_id)
     
     return VoteResponse(
         success=True,
         message="投票成功！感谢你的参与。",
-        model_a_id=battle.model_a_id,
-        model_a_name=model_a_info["name"] if model_a_info else battle.model_a_id,
-        model_b_id=battle.model_b_id,
-        model_b_name=model_b_info["name"] if model_b_info else battle.model_b_id,
+        model_a_id=model_a_id,
+        model_a_name=model_a_info["name"] if model_a_info else model_a_id,
+        model_b_id=model_b_id,
+        model_b_name=model_b_info["name"] if model_b_info else model_b_id,
         new_rating_a=new_rating_a,
         new_rating_b=new_rating_b
     )
@@ -226,13 +354,7 @@ async def reveal_models(
     揭示对战中的模型身份
     只有投票后才能查看
     """
-    result = await db.execute(
-        select(Battle).where(Battle.id == session_id)
-    )
-    battle = result.scalar_one_or_none()
-    
-    if not battle:
-        raise HTTPException(status_code=404, detail="对战会话不存在")
+    battle = await _load_battle(db, session_id)
     
     if not battle.is_revealed:
         raise HTTPException(status_code=403, detail="请先投票后再查看模型身份")
@@ -1,17 +1,21 @@
 """Chat 聊天模式 API（仅 Side-by-Side 对比模式）"""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel, ConfigDict
 from typing import List, Dict, Optional
 
 from models.database import get_db
-from models.schemas import ChatSession, ModelRating
-from services.model_service import ModelService
-import config
+from models.schemas import ChatSession
+from services.model_service import get_model_service
+from services.conversation import load_conversation
+from services.rating_service import RatingService
+from .sse import EventStreamResponse
+from .disconnect import ClientDisconnected
+from .turns import DualTurn
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
-model_service = ModelService()
+model_service = get_model_service()
 
 
 class SideBySideRequest(BaseModel):
@@ -35,6 +39,8 @@ class SideBySideResponse(BaseModel):
     model_b_name: str
     response_a: str
     response_b: str
+    error_a: Optional[str] = None  # 该侧调用失败时的错误信息（回复为空，本轮不写入会话历史）
+    error_b: Optional[str] = None
 
 
 class ModelsListResponse(BaseModel):
@@ -76,11 +82,13 @@ async def get_models():
 @router.post("/sidebyside", response_model=SideBySideResponse)
 async def side_by_side_chat(
     request: SideBySideRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
     并排对比模式
-    同时查看两个模型的回答（非匿名）
+    同时查看两个模型的回答（非匿名）；客户端中途断开时取消上游调用，本轮记为放弃
+    某一侧调用失败时返回该侧的错误，本轮同样记为放弃（不写入会话历史）
     """
     # 验证模型是否存在
     model_a_info = model_service.get_model_info(request.model_a_id)
@@ -99,49 +107,81 @@ async def side_by_side_chat(
         session = result.scalar_one_or_none()
         if not session:
             raise HTTPException(status_code=404, detail="会话不存在")
+        conversation, turn = await load_conversation(db, session.id)
     else:
         session = ChatSession(
             mode="sidebyside",
-            model_ids=[request.model_a_id, request.model_b_id],
-            conversation=[]
+            model_ids=[request.model_a_id, request.model_b_id]
         )
         db.add(session)
         await db.commit()
-        await db.refresh(session)
+        conversation, turn = [], 0
     
-    # 构建消息历史
-    messages = session.conversation.copy() if session.conversation else []
-    messages.append({"role": "user", "content": request.message})
-    
-    # 同时调用两个模型
-    response_a, response_b = await model_service.get_dual_completion(
-        request.model_a_id,
-        request.model_b_id,
-        messages
+    session_id = session.id
+    dual = DualTurn.prepare(
+        "sidebyside", session_id, turn, request.model_a_id, request.model_b_id, conversation, request.message
     )
-    
-    # 更新会话历史
-    messages.append({
-        "role": "assistant",
-        "content": f"[{model_a_info['name']}]: {response_a}"
-    })
-    messages.append({
-        "role": "assistant",
-        "content": f"[{model_b_info['name']}]: {response_b}"
-    })
-    session.conversation = messages
-    
-    await db.commit()
+    try:
+        responses, errors = await dual.complete(http_request, db)
+    except ClientDisconnected:
+        # 499: 客户端已关闭连接（沿用 nginx 的约定），响应不会被读取
+        return Response(status_code=499)
     
     return SideBySideResponse(
-        session_id=session.id,
+        session_id=session_id,
         model_a_id=request.model_a_id,
         model_a_name=model_a_info["name"],
         model_b_id=request.model_b_id,
         model_b_name=model_b_info["name"],
-        response_a=response_a,
-        response_b=response_b
+        response_a=responses.get("a", ""),
+        response_b=responses.get("b", ""),
+        error_a=errors.get("a"),
+        error_b=errors.get("b")
+    )
+
+
+@router.post("/sidebyside/stream")
+async def side_by_side_chat_stream(
+    request: SideBySideRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    并排对比模式（流式）
+    事件格式与 /api/battle/chat/stream 一致，额外在开头发送：
+    - event: session    {"session_id": "..."}
+    有一侧失败时本轮不写入会话历史（end 事件的 saved 为 false），记为放弃；
+    客户端中途断开时关闭两侧上游流，本轮同样记为放弃
+    """
+    model_a_info = model_service.get_model_info(request.model_a_id)
+    model_b_info = model_service.get_model_info(request.model_b_id)
+    
+    if not model_a_info:
+        raise HTTPException(status_code=404, detail=f"模型 {request.model_a_id} 不存在")
+    if not model_b_info:
+        raise HTTPException(status_code=404, detail=f"模型 {request.model_b_id} 不存在")
+    
+    # 获取或创建会话
+    if request.session_id:
+        result = await db.execute(
+            select(ChatSession).where(ChatSession.id == request.session_id)
+        )
+        session = result.scalar_one_or_none()
+        if not session:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        conversation, turn = await load_conversation(db, session.id)
+    else:
+        session = ChatSession(
+            mode="sidebyside",
+            model_ids=[request.model_a_id, request.model_b_id]
+        )
+        db.add(session)
+        await db.commit()
+        conversation, turn = [], 0
+    
+    dual = DualTurn.prepare(
+        "sidebyside", session.id, turn, request.model_a_id, request.model_b_id, conversation, request.message
     )
+    return EventStreamResponse(dual.events(session.id, announce_session=True))
 
 
 @router.post("/sidebyside/vote", response_model=SideBySideVoteResponse)
@@ -166,17 +206,9 @@ async def side_by_side_vote(
         raise HTTPException(status_code=404, detail=f"模型 {request.model_b_id} 不存在")
 
     # Side-by-Side 不计入评分：读取当前评分（用于展示，不做更新）
-    result_a = await db.execute(
-        select(ModelRating).where(ModelRating.model_id == request.model_a_id)
+    new_rating_a, new_rating_b = await RatingService.current_ratings(
+        db, request.model_a_id, request.model_b_id
     )
-    result_b = await db.execute(
-        select(ModelRating).where(ModelRating.model_id == request.model_b_id)
-    )
-    model_a_rating = result_a.scalar_one_or_none()
-    model_b_rating = result_b.scalar_one_or_none()
-
-    new_rating_a = float(model_a_rating.rating) if model_a_rating else float(config.INITIAL_RATING)
-    new_rating_b = float(model_b_rating.rating) if model_b_rating else float(config.INITIAL_RATING)
 
     return SideBySideVoteResponse(
         success=True,
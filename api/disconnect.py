@@ -0,0 +1,64 @@
+"""客户端断开与模型调用失败：断开时取消上游调用；两种情况下本轮都记为放弃，不写入对话历史"""
+import asyncio
+from typing import Awaitable, Dict, Optional, TypeVar
+
+import anyio
+from fastapi import Request
+
+from models.database import async_session_maker
+from models.schemas import AbandonedTurn
+import config
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """客户端在回复完成前断开了连接"""
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    等待 awaitable 完成，期间轮询客户端连接状态
+    客户端断开时取消 awaitable（连同其中的上游 HTTP 请求）并抛出 ClientDisconnected
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=config.DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+
+
+async def record_abandoned_turn(
+    mode: str,
+    session_id: str,
+    model_a_id: str,
+    model_b_id: str,
+    user_message: str,
+    partial_a: str = "",
+    partial_b: str = "",
+    errors: Optional[Dict[str, str]] = None,
+):
+    """
+    记录被放弃的一轮对话；在已被取消的请求中也能完成写入
+    errors: 调用失败的一侧及错误信息（{"a": "..."}），客户端断开时为空
+    """
+    with anyio.CancelScope(shield=True):
+        async with async_session_maker() as session:
+            session.add(AbandonedTurn(
+                mode=mode,
+                session_id=session_id,
+                model_a_id=model_a_id,
+                model_b_id=model_b_id,
+                user_message=user_message,
+                partial_a=partial_a,
+                partial_b=partial_b,
+                error="\n".join(f"{side}: {message}" for side, message in errors.items()) if errors else None,
+            ))
+            await session.commit()
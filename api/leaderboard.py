@@ -6,6 +6,7 @@ from typing import List, Dict
 
 from models.database import get_db
 from services.rating_service import RatingService
+from services.bradley_terry import get_bradley_terry
 
 router = APIRouter(prefix="/api/leaderboard", tags=["leaderboard"])
 
@@ -14,6 +15,11 @@ class LeaderboardResponse(BaseModel):
     """排行榜响应"""
     leaderboard: List[Dict]
     total_models: int
+    bradley_terry: Dict
+
+
+# 尚未计算 Bradley–Terry 评分的模型
+_NO_BT = {"bt_rank": None, "bt_rating": None, "bt_ci_lower": None, "bt_ci_upper": None}
 
 
 @router.get("", response_model=LeaderboardResponse)
@@ -23,12 +29,16 @@ async def get_leaderboard(
 ):
     """
     获取模型排行榜
-    基于积分制评分排序
+    基于积分制评分排序（缓存 config.LEADERBOARD_CACHE_TTL 秒）
+    每个模型同时附带后台计算的 Bradley–Terry 评分与 95% 置信区间（bt_rating、bt_ci_lower、bt_ci_upper、bt_rank）
     """
-    leaderboard = await RatingService.get_leaderboard(db, limit=limit)
+    leaderboard = await RatingService.get_leaderboard_cached(db, limit=limit)
+    bradley_terry = get_bradley_terry()
+    results = bradley_terry.results()
     
     return LeaderboardResponse(
-        leaderboard=leaderboard,
-        total_models=len(leaderboard)
+        leaderboard=[{**entry, **results.get(entry["model_id"], _NO_BT)} for entry in leaderboard],
+        total_models=len(leaderboard),
+        bradley_terry=bradley_terry.summary()
     )
 
@@ -0,0 +1,37 @@
+"""Server-Sent Events 工具函数"""
+import json
+from typing import Any, AsyncIterator, Dict
+
+import anyio
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# 禁用缓存与反向代理缓冲，保证增量内容即时到达浏览器
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """将事件编码为 text/event-stream 格式"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    SSE 响应
+    客户端断开时 Starlette 只停止迭代，这里随即关闭事件生成器，
+    使其中的清理逻辑（取消上游流、记录被放弃的轮次）立刻执行，而不是等到垃圾回收
+    """
+
+    def __init__(self, content: AsyncIterator[str]):
+        super().__init__(content, media_type="text/event-stream", headers=SSE_HEADERS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
@@ -0,0 +1,148 @@
+"""一轮双模型对话（对战与并排对比共用）：两侧同时调用，成功时追加到对话历史，客户端断开或有一侧失败时记为放弃"""
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import async_session_maker
+from services.context import fit_history
+from services.conversation import SIDES, save_turn, side_history
+from services.model_service import get_model_service
+from .disconnect import ClientDisconnected, cancel_on_disconnect, record_abandoned_turn
+from .sse import format_sse
+
+
+class DualTurn:
+    """
+    一轮双模型对话
+    mode: "battle" 或 "sidebyside"；new_session: 会话记录尚未写库时（对战令牌的首轮）与本轮消息一起写入
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        session_id: str,
+        turn: int,
+        model_a_id: str,
+        model_b_id: str,
+        user_message: str,
+        messages_a: List[Dict[str, str]],
+        messages_b: List[Dict[str, str]],
+        new_session=None,
+    ):
+        self.mode = mode
+        self.session_id = session_id
+        self.turn = turn
+        self.model_a_id = model_a_id
+        self.model_b_id = model_b_id
+        self.user_message = user_message
+        self.messages_a = messages_a
+        self.messages_b = messages_b
+        self.new_session = new_session
+
+    @classmethod
+    def prepare(
+        cls,
+        mode: str,
+        session_id: str,
+        turn: int,
+        model_a_id: str,
+        model_b_id: str,
+        conversation: List[Dict],
+        user_message: str,
+        new_session=None,
+    ) -> "DualTurn":
+        """
+        按会话历史构建本轮：每个模型只看到自己一侧的回复
+        按各自的上下文窗口裁剪最早的轮次，放不下当前消息时抛出 ContextWindowExceeded（不调用上游）；
+        额度不足时抛出 RateLimitExceeded（接口返回 503，不排队）
+        """
+        message = {"role": "user", "content": user_message}
+        messages_a = fit_history(model_a_id, side_history(conversation, "a") + [message])
+        messages_b = fit_history(model_b_id, side_history(conversation, "b") + [message])
+        get_model_service().check_rate_limits([(model_a_id, messages_a), (model_b_id, messages_b)])
+        return cls(
+            mode, session_id, turn, model_a_id, model_b_id, user_message, messages_a, messages_b, new_session
+        )
+
+    async def _abandon(self, responses: Dict[str, str], errors: Optional[Dict[str, str]] = None):
+        await record_abandoned_turn(
+            self.mode, self.session_id, self.model_a_id, self.model_b_id, self.user_message,
+            responses.get("a", ""), responses.get("b", ""), errors
+        )
+
+    async def _finish(
+        self,
+        responses: Dict[str, str],
+        errors: Dict[str, str],
+        db: Optional[AsyncSession] = None,
+    ) -> bool:
+        """两侧都成功时追加本轮并返回 True；有一侧失败时失败的回复不作为答案保存，本轮记为放弃"""
+        if errors:
+            await self._abandon(responses, errors)
+            return False
+        if db is None:
+            async with async_session_maker() as session:
+                return await self._finish(responses, errors, session)
+        await save_turn(
+            db, self.session_id, self.turn, self.user_message, responses["a"], responses["b"],
+            new_session=self.new_session
+        )
+        return True
+
+    async def complete(self, http_request: Request, db: AsyncSession) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        非流式：等两侧都返回后保存本轮，返回 (回复, 错误)
+        客户端中途断开时取消上游调用，本轮记为放弃并抛出 ClientDisconnected
+        """
+        try:
+            responses, errors = await cancel_on_disconnect(
+                http_request,
+                get_model_service().get_dual_completion(
+                    self.model_a_id, self.model_b_id, self.messages_a, self.messages_b
+                )
+            )
+        except ClientDisconnected:
+            await self._abandon({})
+            raise
+        await self._finish(responses, errors, db)
+        return responses, errors
+
+    async def events(self, client_session_id: str, announce_session: bool = False) -> AsyncIterator[str]:
+        """
+        流式：两侧的增量输出合并为 SSE 事件
+        - event: session    （announce_session 时最先发送）{"session_id": "..."}
+        - event: a / b      增量文本 {"delta": "..."}
+        - event: done       某一侧生成完毕 {"side": "a"}
+        - event: error      某一侧调用失败 {"side": "a", "message": "..."}
+        - event: end        两侧均结束 {"session_id": "...", "saved": true}（有一侧失败时 saved 为 false）
+        客户端中途断开时关闭两侧上游流，本轮记为放弃（保留已生成的部分）
+        """
+        if announce_session:
+            yield format_sse("session", {"session_id": client_session_id})
+
+        parts: Dict[str, List[str]] = {side: [] for side in SIDES}
+        errors: Dict[str, str] = {}
+        try:
+            async with aclosing(get_model_service().stream_dual_completion(
+                self.model_a_id, self.model_b_id, self.messages_a, self.messages_b
+            )) as stream:
+                async for side, kind, payload in stream:
+                    if kind == "delta":
+                        parts[side].append(payload)
+                        yield format_sse(side, {"delta": payload})
+                    elif kind == "done":
+                        yield format_sse("done", {"side": side})
+                    else:
+                        errors[side] = payload
+                        yield format_sse("error", {"side": side, "message": payload})
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：上游流已随 aclosing 关闭，只记录本轮被放弃
+            await self._abandon({side: "".join(deltas) for side, deltas in parts.items()})
+            raise
+
+        # 依赖注入的会话在响应开始前已关闭，这里单独开启会话保存结果
+        saved = await self._finish({side: "".join(deltas) for side, deltas in parts.items()}, errors)
+        yield format_sse("end", {"session_id": client_session_id, "saved": saved})
@@ -0,0 +1,283 @@
+"""
+本地 OpenAI 兼容的假上游（/v1/chat/completions）
+
+用于离线压测与测试 ModelService：把 OPENAI_BASE_URL / DEEPSEEK_BASE_URL 指向它即可，不消耗真实额度。
+- 支持流式与非流式
+- 按模型配置首 token 延迟（TTFT）、生成速度（tokens/s）与输出长度
+- 按概率注入 429（带 Retry-After）、500、超时（不响应）与流式中途断开
+- 指定 seed 时，每个模型的第 N 个请求的行为是确定的（与并发顺序无关）
+
+配置（JSON），数值可以是固定值，也可以是 [最小, 最大] 区间（均匀分布）:
+    {
+        "default": {"ttft_ms": [200, 600], "tokens_per_second": [40, 80], "output_tokens": [50, 300]},
+        "models": {
+            "gpt-4o": {"ttft_ms": 300, "error_429": 0.05},
+            "deepseek-chat": {"timeout": 0.01, "hang_seconds": 30}
+        }
+    }
+
+用法:
+    python -m benchmarks.fake_upstream --port 9000 --profile fake_upstream.json
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 DEEPSEEK_BASE_URL=http://127.0.0.1:9000/v1 python main.py
+
+也可以在代码中直接使用 ASGI 应用:
+    from benchmarks.fake_upstream import create_app
+    app = create_app({"default": {"ttft_ms": 0, "output_tokens": 5}})
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Dict, List, Optional, Union
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.tokens import estimate_messages_tokens
+
+Range = Union[float, List[float]]
+
+DEFAULT_PROFILE: Dict[str, Range] = {
+    "ttft_ms": [200, 600],           # 首 token 延迟（毫秒）
+    "tokens_per_second": [40, 80],   # 首 token 之后的生成速度
+    "output_tokens": [50, 300],      # 输出长度（不超过请求的 max_tokens）
+    "error_429": 0.0,                # 返回 429 的概率
+    "error_500": 0.0,                # 返回 500 的概率
+    "timeout": 0.0,                  # 挂起不响应的概率
+    "drop": 0.0,                     # 流式输出中途断开的概率
+    "retry_after": 1,                # 429 的 Retry-After（秒）
+    "hang_seconds": 600,             # 超时故障的挂起时长（秒）
+}
+
+# 输出内容：每个 token 一个词
+_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+
+
+def _sample(rng: random.Random, value: Range) -> float:
+    if isinstance(value, (list, tuple)):
+        low, high = value
+        return rng.uniform(low, high)
+    return float(value)
+
+
+class FakeUpstream:
+    """假上游的行为配置与统计"""
+
+    def __init__(self, profiles: Optional[Dict] = None, seed: Optional[int] = None):
+        profiles = profiles or {}
+        self.default = {**DEFAULT_PROFILE, **profiles.get("default", {})}
+        self.models: Dict[str, Dict] = profiles.get("models", {})
+        self.seed = seed
+        self._request_counts: Dict[str, int] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def profile(self, model_id: str) -> Dict:
+        return {**self.default, **self.models.get(model_id, {})}
+
+    def rng(self, model_id: str) -> random.Random:
+        """每个请求一个随机源；指定 seed 时由 (seed, 模型, 该模型的请求序号) 决定"""
+        index = self._request_counts.get(model_id, 0)
+        self._request_counts[model_id] = index + 1
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f"{self.seed}:{model_id}:{index}")
+
+    def count(self, model_id: str, outcome: str):
+        counts = self.stats.setdefault(model_id, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+
+def _error(status: int, message: str, error_type: str, headers: Optional[Dict] = None):
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": error_type, "code": None}},
+        headers=headers,
+    )
+
+
+def create_app(profiles: Optional[Dict] = None, seed: Optional[int] = None) -> FastAPI:
+    """创建假上游 ASGI 应用；profiles 格式见模块说明"""
+    upstream = FakeUpstream(profiles, seed)
+    app = FastAPI(title="Fake OpenAI-compatible upstream")
+    app.state.upstream = upstream
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {
+            "object": "list",
+            "data": [{"id": model_id, "object": "model"} for model_id in upstream.models],
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        """各模型的请求结果计数：completed / error_429 / error_500 / timeout / drop / cancelled"""
+        return upstream.stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model_id = body.get("model", "")
+        profile = upstream.profile(model_id)
+        rng = upstream.rng(model_id)
+        upstream.count(model_id, "requests")
+
+        # 故障注入：按顺序各抽一次，保证同一 seed 下结果稳定
+        fault = rng.random()
+        for name in ("error_429", "error_500", "timeout"):
+            if fault < profile[name]:
+                break
+            fault -= profile[name]
+        else:
+            name = None
+
+        if name == "error_429":
+            upstream.count(model_id, name)
+            return _error(
+                429, "Rate limit reached (fake upstream)", "rate_limit_exceeded",
+                headers={"retry-after": str(profile["retry_after"])},
+            )
+        if name == "error_500":
+            upstream.count(model_id, name)
+            return _error(500, "Internal error (fake upstream)", "server_error")
+        if name == "timeout":
+            upstream.count(model_id, name)
+            await asyncio.sleep(profile["hang_seconds"])
+            return _error(504, "Upstream timed out (fake upstream)", "timeout")
+
+        ttft = _sample(rng, profile["ttft_ms"]) / 1000
+        tokens_per_second = max(_sample(rng, profile["tokens_per_second"]), 1e-6)
+        output_tokens = max(1, int(_sample(rng, profile["output_tokens"])))
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        finish_reason = "stop"
+        if max_tokens is not None and output_tokens > max_tokens:
+            output_tokens, finish_reason = max_tokens, "length"
+        drop_at = rng.randint(0, output_tokens - 1) if rng.random() < profile["drop"] else None
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        words = [_WORDS[i % len(_WORDS)] + " " for i in range(output_tokens)]
+        usage = {
+            "prompt_tokens": estimate_messages_tokens(body.get("messages", [])),
+            "completion_tokens": output_tokens,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(ttft + (output_tokens - 1) / tokens_per_second)
+            except asyncio.CancelledError:
+                upstream.count(model_id, "cancelled")
+                raise
+            upstream.count(model_id, "completed")
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model_id,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(
+            delta: Dict,
+            finish: Optional[str] = None,
+            chunk_usage: Optional[Dict] = None,
+        ) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model_id,
+                "choices": [] if chunk_usage else [
+                    {"index": 0, "delta": delta, "finish_reason": finish}
+                ],
+            }
+            if chunk_usage:
+                payload["usage"] = chunk_usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def event_stream():
+            try:
+                await asyncio.sleep(ttft)
+                yield chunk({"role": "assistant", "content": ""})
+                started = time.monotonic()
+                for i, word in enumerate(words):
+                    if i == drop_at:
+                        upstream.count(model_id, "drop")
+                        raise ConnectionResetError("fake upstream dropped the stream")
+                    # 按目标速度对齐发送时间，避免 sleep 误差累积
+                    delay = started + i / tokens_per_second - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    yield chunk({"content": word})
+                yield chunk({}, finish_reason)
+                if include_usage:
+                    yield chunk({}, chunk_usage=usage)
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                upstream.count(model_id, "cancelled")
+                raise
+            upstream.count(model_id, "completed")
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+def _parse_range(text: str) -> Range:
+    """'300' -> 300.0，'200-600' -> [200.0, 600.0]"""
+    if "-" in text.strip("-"):
+        low, high = text.split("-", 1)
+        return [float(low), float(high)]
+    return float(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容假上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--profile", help="JSON 配置文件（default / models）")
+    parser.add_argument("--seed", type=int, help="随机种子，指定后每个模型的请求序列可复现")
+    parser.add_argument("--ttft-ms", type=_parse_range, help="默认首 token 延迟，如 300 或 200-600")
+    parser.add_argument("--tps", type=_parse_range, help="默认生成速度（tokens/s），如 60 或 40-80")
+    parser.add_argument("--output-tokens", type=_parse_range, help="默认输出长度，如 200 或 50-300")
+    parser.add_argument("--error-429", type=float, help="默认 429 概率")
+    parser.add_argument("--error-500", type=float, help="默认 500 概率")
+    parser.add_argument("--timeout", type=float, help="默认超时（挂起）概率")
+    parser.add_argument("--drop", type=float, help="默认流式中途断开概率")
+    args = parser.parse_args()
+
+    profiles: Dict = {}
+    if args.profile:
+        with open(args.profile, encoding="utf-8") as f:
+            profiles = json.load(f)
+    overrides = {
+        "ttft_ms": args.ttft_ms,
+        "tokens_per_second": args.tps,
+        "output_tokens": args.output_tokens,
+        "error_429": args.error_429,
+        "error_500": args.error_500,
+        "timeout": args.timeout,
+        "drop": args.drop,
+    }
+    profiles.setdefault("default", {}).update(
+        {key: value for key, value in overrides.items() if value is not None}
+    )
+
+    uvicorn.run(
+        create_app(profiles, args.seed),
+        host=args.host, port=args.port, log_level="warning", backlog=4096,
+    )
+
+
+if __name__ == "__main__":
+    main()
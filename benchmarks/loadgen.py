@@ -0,0 +1,246 @@
+"""
+端到端压测：模拟大量并发用户走完 对战 → 对话 → 投票 → 看排行榜 的流程
+
+每个虚拟用户循环执行：
+    POST /api/battle/start
+    POST /api/battle/chat（或 /chat/stream）若干轮，每轮之间思考一段时间
+    按比例 POST /api/battle/vote
+    按比例 GET  /api/leaderboard
+统计每个端点的吞吐量、p50/p95/p99 延迟与错误率（流式端点另计首个事件延迟），结果可写入 JSON 以便对比。
+
+建议先用假上游启动服务，避免消耗真实额度:
+    python -m benchmarks.fake_upstream --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 DEEPSEEK_BASE_URL=http://127.0.0.1:9000/v1 python main.py
+
+用法:
+    python -m benchmarks.loadgen --users 1000 --duration 60 --turns 1-3 --think-time 1-5 \\
+        --stream-ratio 0.5 --vote-ratio 0.8 --leaderboard-ratio 0.3 --output loadgen.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+PROMPTS = [
+    "用一句话解释什么是量子纠缠",
+    "写一首关于秋天的五言绝句",
+    "Explain the difference between TCP and UDP.",
+    "给我三个提高专注力的建议",
+    "What is the time complexity of quicksort?",
+    "帮我把这句话翻译成英文：今天天气很好",
+]
+
+WINNERS = ["model_a", "model_b", "tie"]
+
+
+def _parse_range(text: str) -> Tuple[float, float]:
+    """'3' -> (3, 3)，'1-5' -> (1, 5)"""
+    if "-" in text:
+        low, high = text.split("-", 1)
+        return float(low), float(high)
+    return float(text), float(text)
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Metrics:
+    """按端点收集延迟与结果"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.first_event: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(
+        self,
+        endpoint: str,
+        status: str,
+        latency: float,
+        first_event: Optional[float] = None,
+    ):
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+        if status == "200":
+            self.latencies.setdefault(endpoint, []).append(latency)
+            if first_event is not None:
+                self.first_event.setdefault(endpoint, []).append(first_event)
+
+    def report(self, elapsed: float) -> Dict:
+        endpoints = {}
+        for endpoint, counts in sorted(self.statuses.items()):
+            total = sum(counts.values())
+            latencies = sorted(self.latencies.get(endpoint, []))
+            row = {
+                "requests": total,
+                "throughput_per_s": round(total / elapsed, 2),
+                "error_rate": round(1 - counts.get("200", 0) / total, 4),
+                "statuses": counts,
+            }
+            for q in (50, 95, 99):
+                value = _percentile(latencies, q)
+                row[f"p{q}_ms"] = round(value * 1000, 1) if value is not None else None
+            first_event = sorted(self.first_event.get(endpoint, []))
+            if first_event:
+                for q in (50, 95, 99):
+                    row[f"first_event_p{q}_ms"] = round(_percentile(first_event, q) * 1000, 1)
+            endpoints[endpoint] = row
+
+        total = sum(row["requests"] for row in endpoints.values())
+        ok = sum(counts.get("200", 0) for counts in self.statuses.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "throughput_per_s": round(total / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(1 - ok / total, 4) if total else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+async def _request(
+    client: httpx.AsyncClient,
+    metrics: Metrics,
+    endpoint: str,
+    method: str,
+    path: str,
+    payload: Optional[Dict] = None,
+) -> Optional[Dict]:
+    """发出一个普通请求并记录结果，成功时返回 JSON"""
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=payload)
+    except httpx.HTTPError as e:
+        metrics.record(endpoint, type(e).__name__, time.perf_counter() - started)
+        return None
+    metrics.record(endpoint, str(response.status_code), time.perf_counter() - started)
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+async def _stream(client: httpx.AsyncClient, metrics: Metrics, path: str, payload: Dict) -> bool:
+    """发出一个 SSE 请求并读完整个流，记录首个事件延迟与总耗时"""
+    endpoint = "battle/chat/stream"
+    started = time.perf_counter()
+    first_event = None
+    try:
+        async with client.stream("POST", path, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                metrics.record(endpoint, str(response.status_code), time.perf_counter() - started)
+                return False
+            failed = False
+            async for line in response.aiter_lines():
+                if first_event is None and line.startswith("event:"):
+                    first_event = time.perf_counter() - started
+                if line == "event: error":
+                    failed = True
+    except httpx.HTTPError as e:
+        metrics.record(endpoint, type(e).__name__, time.perf_counter() - started)
+        return False
+    # 某一侧模型失败时流本身仍是 200，单独计为 upstream_error
+    status = "upstream_error" if failed else "200"
+    metrics.record(endpoint, status, time.perf_counter() - started, first_event)
+    return not failed
+
+
+async def _think(think_time: Tuple[float, float]):
+    await asyncio.sleep(random.uniform(*think_time))
+
+
+async def run_user(client: httpx.AsyncClient, metrics: Metrics, args, deadline: float):
+    """一个虚拟用户：反复进行完整的对战流程，直到压测结束"""
+    while time.monotonic() < deadline:
+        battle = await _request(client, metrics, "battle/start", "POST", "/api/battle/start")
+        if battle is None:
+            await _think(args.think_time)
+            continue
+        session_id = battle["session_id"]
+
+        turns = random.randint(int(args.turns[0]), int(args.turns[1]))
+        chatted = False
+        for turn in range(turns):
+            if turn:
+                await _think(args.think_time)
+            payload = {"session_id": session_id, "message": random.choice(PROMPTS)}
+            if random.random() < args.stream_ratio:
+                ok = await _stream(client, metrics, "/api/battle/chat/stream", payload)
+            else:
+                ok = await _request(
+                    client, metrics, "battle/chat", "POST", "/api/battle/chat", payload
+                ) is not None
+            chatted = chatted or ok
+            if time.monotonic() >= deadline:
+                return
+
+        await _think(args.think_time)
+        if chatted and random.random() < args.vote_ratio:
+            await _request(client, metrics, "battle/vote", "POST", "/api/battle/vote", {
+                "session_id": session_id,
+                "winner": random.choice(WINNERS),
+            })
+        if random.random() < args.leaderboard_ratio:
+            await _request(client, metrics, "leaderboard", "GET", "/api/leaderboard")
+        await _think(args.think_time)
+
+
+async def main(args):
+    random.seed(args.seed)
+    metrics = Metrics()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+
+        async def delayed_user(index: int):
+            # 在 ramp_up 秒内均匀地加入用户，避免所有用户同一时刻发起第一个请求
+            await asyncio.sleep(args.ramp_up * index / args.users)
+            await run_user(client, metrics, args, deadline)
+
+        await asyncio.gather(*(delayed_user(i) for i in range(args.users)))
+        elapsed = time.monotonic() - started
+
+    report = metrics.report(elapsed)
+    print(f"{'endpoint':<22}{'requests':>10}{'rps':>10}{'err%':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for endpoint, row in report["endpoints"].items():
+        print(
+            f"{endpoint:<22}{row['requests']:>10}{row['throughput_per_s']:>10}"
+            f"{row['error_rate'] * 100:>7.1f}%"
+            f"{row['p50_ms'] or '-':>10}{row['p95_ms'] or '-':>10}{row['p99_ms'] or '-':>10}"
+        )
+    print(
+        f"total: {report['requests']} requests, {report['throughput_per_s']} req/s, "
+        f"error rate {report['error_rate'] * 100:.1f}%"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            args_dict = {**vars(args), "turns": list(args.turns), "think_time": list(args.think_time)}
+            json.dump({"args": args_dict, "results": report}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对战流程端到端压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=100, help="并发虚拟用户数")
+    parser.add_argument("--duration", type=float, default=60, help="压测时长（秒）")
+    parser.add_argument("--ramp-up", type=float, default=10, help="在多少秒内加入全部用户")
+    parser.add_argument("--turns", type=_parse_range, default=(1, 3), help="每场对战的对话轮数，如 2 或 1-3")
+    parser.add_argument("--think-time", type=_parse_range, default=(1, 5), help="两次操作间的思考时间（秒）")
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="使用流式对话接口的比例")
+    parser.add_argument("--vote-ratio", type=float, default=0.8, help="对战结束后投票的比例")
+    parser.add_argument("--leaderboard-ratio", type=float, default=0.3, help="对战结束后查看排行榜的比例")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求的超时（秒）")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""
+上游客户端基准测试：线程池 + 同步客户端 vs 原生异步客户端
+
+在本地启动假上游（benchmarks/fake_upstream.py），分别用两种方式发起 N 组并发的双模型请求，
+对比总耗时、吞吐量与延迟分位数。
+
+异步路径走完整的 ModelService（熔断、重试、用量账本等），用量账本写入进程内的 SQLite（先执行 init_db 建表），
+不会碰 DATABASE_URL 指向的数据库。默认把每个模型的并发上限固定为连接池大小，只比较传输方式；
+加 --adaptive 则使用 MODEL_CONCURRENCY_* 配置的自适应并发限制（含慢启动的爬升过程）。
+
+用法:
+    python -m benchmarks.upstream_client --concurrency 200 --latency 0.5
+    python -m benchmarks.upstream_client --concurrency 200 --latency 0.5 --adaptive
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+from typing import Callable, Awaitable, List
+
+import httpx
+import uvicorn
+from openai import OpenAI
+from starlette.concurrency import run_in_threadpool
+
+import config
+
+# 必须在导入 models / services 之前设置（数据库引擎在导入时创建）
+config.DATABASE_URL = "sqlite+aiosqlite://"
+
+from .fake_upstream import create_app
+
+
+def _serve(latency: float, port: int):
+    # 固定延迟、单 token 输出：非流式响应耗时恰为 latency
+    app = create_app({"default": {"ttft_ms": latency * 1000, "output_tokens": 1}})
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def start_server(latency: float, port: int) -> multiprocessing.Process:
+    """在独立进程中启动假上游，避免与被测客户端争抢 GIL"""
+    process = multiprocessing.Process(target=_serve, args=(latency, port), daemon=True)
+    process.start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("假上游启动失败")
+
+
+async def make_threadpool_dual(base_url: str) -> Callable[[], Awaitable[None]]:
+    """旧实现：同步 OpenAI 客户端 + run_in_threadpool"""
+    client = OpenAI(
+        api_key="bench",
+        base_url=base_url,
+        max_retries=0,
+        http_client=httpx.Client(limits=httpx.Limits(
+            max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+        )),
+    )
+
+    def _call(model_id: str):
+        client.chat.completions.create(
+            model=model_id,
+            messages=[{"role": "user", "content": "hi"}],
+        )
+
+    async def dual():
+        await asyncio.gather(
+            run_in_threadpool(_call, "model-a"),
+            run_in_threadpool(_call, "model-b"),
+        )
+
+    return dual
+
+
+async def make_async_dual(base_url: str, adaptive: bool) -> Callable[[], Awaitable[None]]:
+    """新实现：ModelService 的原生异步路径"""
+    config.UPSTREAM_ENDPOINTS = {
+        "openai": {"provider": "openai", "base_url": base_url, "api_key": "bench"},
+    }
+
+    from models.database import init_db
+    from services.concurrency import AdaptiveLimiter
+    from services.model_service import get_model_service
+    await init_db()
+    service = get_model_service()
+    if not adaptive:
+        for model_id in ("model-a", "model-b"):
+            service._limiters[model_id] = AdaptiveLimiter(
+                initial=config.UPSTREAM_MAX_CONNECTIONS,
+                min_limit=config.UPSTREAM_MAX_CONNECTIONS,
+                max_limit=config.UPSTREAM_MAX_CONNECTIONS,
+                backoff=1.0,
+                queue_timeout=config.MODEL_QUEUE_TIMEOUT,
+                max_queue=config.MODEL_QUEUE_MAX,
+            )
+
+    async def dual():
+        messages = [{"role": "user", "content": "hi"}]
+        await service.get_dual_completion("model-a", "model-b", messages, messages)
+
+    return dual
+
+
+async def run_batch(dual: Callable[[], Awaitable[None]], concurrency: int) -> dict:
+    """同时发起 concurrency 组双模型请求"""
+    latencies: List[float] = []
+
+    async def one():
+        start = time.perf_counter()
+        await dual()
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "dual_completions": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(concurrency / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+async def main(args):
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    server = start_server(args.latency, args.port)
+
+    results = {}
+    factories = (
+        ("threadpool", lambda: make_threadpool_dual(base_url)),
+        ("async", lambda: make_async_dual(base_url, args.adaptive)),
+    )
+    for name, factory in factories:
+        dual = await factory()
+        await run_batch(dual, min(args.concurrency, 10))  # 预热连接池
+        results[name] = await run_batch(dual, args.concurrency)
+        print(f"{name:<12} {json.dumps(results[name], ensure_ascii=False)}")
+
+    from models.database import engine
+    from services.model_service import get_model_service
+    from services.usage import get_usage_ledger
+    await get_model_service().aclose()
+    await get_usage_ledger().aclose()
+    await engine.dispose()
+    server.terminate()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="上游客户端基准测试")
+    parser.add_argument("--concurrency", type=int, default=200, help="并发的双模型请求组数")
+    parser.add_argument("--latency", type=float, default=0.5, help="假上游的固定响应延迟（秒）")
+    parser.add_argument("--adaptive", action="store_true", help="异步路径使用自适应并发限制（默认固定为连接池大小）")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    asyncio.run(main(parser.parse_args()))
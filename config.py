@@ -1,4 +1,5 @@
 """配置文件"""
+import json
 import os
 from dotenv import load_dotenv
 
@@ -12,99 +13,299 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
 
+# 上游连接池配置（每个服务商一个长连接池，并发受连接数而非线程数限制）
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "300"))
+
+# 按模型自适应并发限制（AIMD；第一次收到 429/超时之前从初始上限按慢启动翻倍增长）
+MODEL_CONCURRENCY_INITIAL = int(os.getenv("MODEL_CONCURRENCY_INITIAL", "8"))
+MODEL_CONCURRENCY_MIN = int(os.getenv("MODEL_CONCURRENCY_MIN", "1"))
+MODEL_CONCURRENCY_MAX = int(os.getenv("MODEL_CONCURRENCY_MAX", "64"))
+MODEL_CONCURRENCY_BACKOFF = float(os.getenv("MODEL_CONCURRENCY_BACKOFF", "0.5"))
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", "30"))
+MODEL_QUEUE_MAX = int(os.getenv("MODEL_QUEUE_MAX", "200"))
+
+# 按模型熔断器
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # 统计最近多少次调用
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))  # 至少多少次调用后才判断
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "120"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "2"))
+
+# 上游重试策略（按服务商）：最大尝试次数、退避基数/上限（秒）、总截止时间（秒）
+RETRY_POLICIES = {
+    "openai": {
+        "max_attempts": int(os.getenv("OPENAI_RETRY_MAX_ATTEMPTS", "3")),
+        "base_delay": float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5")),
+        "max_delay": float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8")),
+        "deadline": float(os.getenv("OPENAI_RETRY_DEADLINE", "60")),
+    },
+    "deepseek": {
+        "max_attempts": int(os.getenv("DEEPSEEK_RETRY_MAX_ATTEMPTS", "3")),
+        "base_delay": float(os.getenv("DEEPSEEK_RETRY_BASE_DELAY", "0.5")),
+        "max_delay": float(os.getenv("DEEPSEEK_RETRY_MAX_DELAY", "8")),
+        "deadline": float(os.getenv("DEEPSEEK_RETRY_DEADLINE", "60")),
+    },
+}
+
+# 未单独配置重试策略的服务商使用的默认策略
+DEFAULT_RETRY_POLICY = {
+    "max_attempts": int(os.getenv("UPSTREAM_RETRY_MAX_ATTEMPTS", "3")),
+    "base_delay": float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5")),
+    "max_delay": float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "8")),
+    "deadline": float(os.getenv("UPSTREAM_RETRY_DEADLINE", "60")),
+}
+
+# 对冲请求：主请求超过该模型观测到的 p95 仍无首个 token/结果时，发出一个备用请求
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))  # 额外请求最多占 5%
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # 样本不足时不对冲
+HEDGE_MAX_SAMPLES = int(os.getenv("HEDGE_MAX_SAMPLES", "200"))
+# 备用请求可发往另一组 Key/网关（注册为仅承接对冲请求的端点，留空则与主请求共用端点）
+OPENAI_HEDGE_BASE_URL = os.getenv("OPENAI_HEDGE_BASE_URL", "")
+OPENAI_HEDGE_API_KEY = os.getenv("OPENAI_HEDGE_API_KEY", "")
+DEEPSEEK_HEDGE_BASE_URL = os.getenv("DEEPSEEK_HEDGE_BASE_URL", "")
+DEEPSEEK_HEDGE_API_KEY = os.getenv("DEEPSEEK_HEDGE_API_KEY", "")
+
+# 上游端点注册表：每个端点一个 base_url + Key，provider 决定使用哪套重试/限流策略
+UPSTREAM_ENDPOINTS = {
+    "openai": {
+        "provider": "openai",
+        "base_url": OPENAI_BASE_URL,
+        "api_key": OPENAI_API_KEY,
+    },
+    "deepseek": {
+        "provider": "deepseek",
+        "base_url": DEEPSEEK_BASE_URL,
+        "api_key": DEEPSEEK_API_KEY,
+    },
+}
+if OPENAI_HEDGE_BASE_URL:
+    UPSTREAM_ENDPOINTS["openai-hedge"] = {
+        "provider": "openai",
+        "base_url": OPENAI_HEDGE_BASE_URL,
+        "api_key": OPENAI_HEDGE_API_KEY or OPENAI_API_KEY,
+        "hedge_only": True,
+    }
+if DEEPSEEK_HEDGE_BASE_URL:
+    UPSTREAM_ENDPOINTS["deepseek-hedge"] = {
+        "provider": "deepseek",
+        "base_url": DEEPSEEK_HEDGE_BASE_URL,
+        "api_key": DEEPSEEK_HEDGE_API_KEY or DEEPSEEK_API_KEY,
+        "hedge_only": True,
+    }
+# 额外网关（JSON），例如 {"gateway-2": {"provider": "openai", "base_url": "https://...", "api_key": "sk-..."}}
+# provider 须为 RETRY_POLICIES 中的服务商（OpenAI 兼容网关填 openai），否则启动时报错
+UPSTREAM_ENDPOINTS.update(json.loads(os.getenv("EXTRA_UPSTREAM_ENDPOINTS", "{}")))
+
+# 模型 → 端点名列表（JSON），例如 {"gpt-4o": ["openai", "gateway-2"]}
+# 未列出的模型：deepseek- 前缀使用全部 deepseek 端点，其余使用全部 openai 端点
+MODEL_ENDPOINTS = json.loads(os.getenv("MODEL_ENDPOINTS", "{}"))
+
+# 路由：按 EWMA 延迟 ×（1 + 惩罚系数 × EWMA 错误率）选分数最低的端点
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+ROUTING_ERROR_PENALTY = float(os.getenv("ROUTING_ERROR_PENALTY", "10"))
+ROUTING_ERROR_HALF_LIFE = float(os.getenv("ROUTING_ERROR_HALF_LIFE", "30"))  # 错误率半衰期（秒）
+
+# 客户端限流（按 API Key + 模型，RPM / TPM，0 表示不限制）
+# TPM 按 提示词估算 + max_tokens 预约，调用结束后按实际用量归还
+RATE_LIMITS = {
+    "openai": {
+        "rpm": int(os.getenv("OPENAI_RPM", "0")),
+        "tpm": int(os.getenv("OPENAI_TPM", "0")),
+    },
+    "deepseek": {
+        "rpm": int(os.getenv("DEEPSEEK_RPM", "0")),
+        "tpm": int(os.getenv("DEEPSEEK_TPM", "0")),
+    },
+}
+# 按模型覆盖服务商默认值（JSON），例如 {"gpt-4o": {"rpm": 500, "tpm": 300000}}
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+# 预计排队超过该秒数时直接返回 503 + Retry-After
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+
+# 非流式对战/对比请求期间检测客户端断开的轮询间隔（秒），断开后取消上游调用
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+# 对战令牌：开始对战时不写库，签名后的令牌作为 session_id，首次对话时才创建对战记录
+# 未配置密钥时首次使用会随机生成并保存到 BATTLE_TOKEN_SECRET_FILE，同一台机器上的各进程与重启后共用；
+# 多实例（多台机器）部署必须配置为相同的值
+BATTLE_TOKEN_SECRET = os.getenv("BATTLE_TOKEN_SECRET", "")
+BATTLE_TOKEN_SECRET_FILE = os.getenv("BATTLE_TOKEN_SECRET_FILE", ".battle_token_secret")
+BATTLE_TOKEN_TTL = int(os.getenv("BATTLE_TOKEN_TTL", "86400"))  # 未开始对话的令牌有效期（秒）
+
+# 运维 API（/api/admin）的访问令牌，请求头 X-Admin-Token 须与之相同；未配置时运维 API 一律拒绝访问
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # 数据库配置
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./lmarena.db")
+# 启动时自动执行待执行的数据库迁移；大表或多实例部署可关闭，改为发布前执行 python -m models.migrations
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() == "true"
+
+# 大文本压缩存储（对话消息、放弃轮次的部分输出）：UTF-8 编码后达到该字节数时 zlib 压缩
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+# 上下文窗口预算：对话历史按模型的 context_window / max_output_tokens 裁剪
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "32768"))  # 未配置窗口的模型
+CONTEXT_WINDOW_HEADROOM = float(os.getenv("CONTEXT_WINDOW_HEADROOM", "0.05"))  # 为估算误差预留的比例
+CONTEXT_MIN_COMPLETION_TOKENS = int(os.getenv("CONTEXT_MIN_COMPLETION_TOKENS", "1024"))  # 低于此回复长度直接拒绝
 
 # 支持的模型列表（已根据 API 实际支持的模型更新）
+# context_window: 上下文窗口（tokens），max_output_tokens: 单次最大输出（tokens，可省略）
 AVAILABLE_MODELS = [
     # OpenAI 兼容模型（使用 zetatechs.com API）
     {
         "id": "gpt-4o",
         "name": "GPT-4o",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 128000,
+        "max_output_tokens": 16384
     },
     {
         "id": "gpt-4o-mini",
         "name": "GPT-4o Mini",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 128000,
+        "max_output_tokens": 16384
     },
     {
         "id": "gpt-5-chat-latest",
         "name": "GPT-5 Chat",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 128000,
+        "max_output_tokens": 16384
     },
     {
         "id": "gpt-5-mini",
         "name": "GPT-5 Mini",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 400000,
+        "max_output_tokens": 128000
     },
     {
         "id": "claude-sonnet-4-5-20250929",
         "name": "Claude Sonnet 4.5",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 200000,
+        "max_output_tokens": 64000
     },
     {
         "id": "claude-opus-4-5-20251101",
         "name": "Claude Opus 4.5",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 200000,
+        "max_output_tokens": 64000
     },
     {
         "id": "gemini-2.5-pro-thinking",
         "name": "Gemini 2.5 Pro Thinking",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 1048576,
+        "max_output_tokens": 65536
     },
     {
         "id": "gemini-2.5-flash",
         "name": "Gemini 2.5 Flash",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 1048576,
+        "max_output_tokens": 65536
     },
     {
         "id": "o1",
         "name": "OpenAI O1",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 200000,
+        "max_output_tokens": 100000
     },
     {
         "id": "o3-mini",
         "name": "OpenAI O3 Mini",
         "provider": "openai",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 200000,
+        "max_output_tokens": 100000
     },
     {
         "id": "grok-4-0709",
         "name": "Grok 4",
         "provider": "xAI",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 256000
     },
     {
         "id":"qwen3-235b-a22b-thinking",
         "name":"Qwen3 235B A22B Thinking",
         "provider":"Qwen",
-        "initial_rating":0
+        "initial_rating":0,
+        "context_window":131072,
+        "max_output_tokens":32768
     },
     # DeepSeek 模型（使用官方 DeepSeek API）
     {
         "id": "deepseek-chat",
         "name": "DeepSeek Chat",
         "provider": "deepseek",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 128000,
+        "max_output_tokens": 8192
     },
     {
         "id": "deepseek-reasoner",
         "name": "DeepSeek Reasoner",
         "provider": "deepseek",
-        "initial_rating": 0
+        "initial_rating": 0,
+        "context_window": 128000,
+        "max_output_tokens": 65536
     }
 ]
 
+# 模型价格（美元 / 百万 tokens），用于用量账本的成本统计，按官方标价填写
+# 可用 MODEL_PRICING（JSON）覆盖，例如 {"gpt-4o": {"input": 2.5, "output": 10}}
+MODEL_PRICING = {
+    "gpt-4o": {"input": 2.5, "output": 10},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.6},
+    "gpt-5-chat-latest": {"input": 1.25, "output": 10},
+    "gpt-5-mini": {"input": 0.25, "output": 2},
+    "claude-sonnet-4-5-20250929": {"input": 3, "output": 15},
+    "claude-opus-4-5-20251101": {"input": 5, "output": 25},
+    "gemini-2.5-pro-thinking": {"input": 1.25, "output": 10},
+    "gemini-2.5-flash": {"input": 0.3, "output": 2.5},
+    "o1": {"input": 15, "output": 60},
+    "o3-mini": {"input": 1.1, "output": 4.4},
+    "grok-4-0709": {"input": 3, "output": 15},
+    "qwen3-235b-a22b-thinking": {"input": 0.7, "output": 8.4},
+    "deepseek-chat": {"input": 0.28, "output": 0.42},
+    "deepseek-reasoner": {"input": 0.28, "output": 0.42},
+}
+MODEL_PRICING.update(json.loads(os.getenv("MODEL_PRICING", "{}")))
+
+# 用量账本：请求路径只入队，后台按批写库；队列满时丢弃并计数
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", "200"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2"))  # 秒
+USAGE_MAX_PENDING = int(os.getenv("USAGE_MAX_PENDING", "10000"))
+# 后台批量写入（用量账本、投票队列）失败时的重试：间隔从 BATCH_WRITE_RETRY_BACKOFF 秒起每次翻倍
+BATCH_WRITE_MAX_RETRIES = int(os.getenv("BATCH_WRITE_MAX_RETRIES", "3"))
+BATCH_WRITE_RETRY_BACKOFF = float(os.getenv("BATCH_WRITE_RETRY_BACKOFF", "0.5"))  # 秒
+# 流式调用请求上游在末尾返回用量（stream_options.include_usage），网关不支持时关闭，改为本地估算
+STREAM_INCLUDE_USAGE = os.getenv("STREAM_INCLUDE_USAGE", "false").lower() == "true"
+
 # 评分系统参数（积分制）
 # - 胜：+2
 # - 平：+1
@@ -116,3 +317,36 @@ LOSS_POINTS = 0
 # 初始分数
 INITIAL_RATING = 0
 
+# 投票排队模式：投票只写对战结果与投票记录后立即返回，评分由后台每 VOTE_FLUSH_INTERVAL 秒
+# 或攒满 VOTE_BATCH_SIZE 票时批量累加（排行榜相应延迟）；关闭时每票在投票事务中直接更新评分
+VOTE_QUEUE_ENABLED = os.getenv("VOTE_QUEUE_ENABLED", "false").lower() == "true"
+VOTE_BATCH_SIZE = int(os.getenv("VOTE_BATCH_SIZE", "500"))
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "0.2"))  # 秒
+# 定期补偿尚未应用评分的投票（重试后仍失败的批次、已下线实例留下的投票），0 表示只在启动时补偿
+VOTE_RECOVER_INTERVAL = float(os.getenv("VOTE_RECOVER_INTERVAL", "60"))  # 秒
+
+# 评分分片数：大于 1 时每票累加到该模型随机一个分片行，热门模型的并发投票不再排队等同一行锁
+# （MySQL 上建议 8~16；SQLite 整库只有一把写锁，分片没有收益）
+RATING_STRIPES = int(os.getenv("RATING_STRIPES", "1"))
+# 排行榜缓存秒数（0 表示不缓存）
+LEADERBOARD_CACHE_TTL = float(os.getenv("LEADERBOARD_CACHE_TTL", "1"))
+
+# 评分快照与重建（services/rating_rebuild.py）：快照只包含 RATING_SNAPSHOT_LAG 秒之前的投票（更晚的可能尚未提交），
+# 每 RATING_SNAPSHOT_INTERVAL 秒自动生成一个（0 表示不自动生成），保留最近 RATING_SNAPSHOT_KEEP 个
+RATING_SNAPSHOT_LAG = int(os.getenv("RATING_SNAPSHOT_LAG", "300"))
+RATING_SNAPSHOT_INTERVAL = float(os.getenv("RATING_SNAPSHOT_INTERVAL", "3600"))
+RATING_SNAPSHOT_KEEP = int(os.getenv("RATING_SNAPSHOT_KEEP", "24"))
+
+# Bradley–Terry 排行榜（services/bradley_terry.py）：每 BT_REFRESH_INTERVAL 秒重新拟合（0 表示不计算），
+# 置信区间由 BT_BOOTSTRAP_ROUNDS 轮重采样在 BT_WORKERS 个进程中计算（0 表示在线程中计算）
+BT_REFRESH_INTERVAL = float(os.getenv("BT_REFRESH_INTERVAL", "60"))
+BT_BOOTSTRAP_ROUNDS = int(os.getenv("BT_BOOTSTRAP_ROUNDS", "100"))
+BT_WORKERS = int(os.getenv("BT_WORKERS", "2"))
+# 通过运维接口手动刷新的最小间隔（秒），间隔内或已有刷新在进行时直接返回上一次的结果
+BT_MANUAL_REFRESH_INTERVAL = float(os.getenv("BT_MANUAL_REFRESH_INTERVAL", "30"))
+# 评分量纲：平均模型为 BT_BASE_RATING，相差 BT_SCALE 分时胜率约 91%（与 Elo 相同）
+BT_BASE_RATING = float(os.getenv("BT_BASE_RATING", "1000"))
+BT_SCALE = float(os.getenv("BT_SCALE", "400"))
+# 每个模型与强度为 0 的虚拟对手平局的场数（先验，避免全胜或全负的模型评分发散）
+BT_PRIOR_GAMES = float(os.getenv("BT_PRIOR_GAMES", "1"))
+
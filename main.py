@@ -1,12 +1,23 @@
 """LMArena 主应用入口"""
+import asyncio
+import math
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from api import battle_router, chat_router, leaderboard_router
+from api import battle_router, chat_router, leaderboard_router, admin_router
 from models.database import init_db
+from services.model_service import get_model_service
+from services.rate_limit import RateLimitExceeded
+from services.context import ContextWindowExceeded
+from services.usage import get_usage_ledger
+from services.vote_queue import get_vote_queue
+from services.rating_rebuild import run_periodic_snapshots
+from services.bradley_terry import get_bradley_terry
+import config
 
 
 @asynccontextmanager
@@ -15,9 +26,30 @@ async def lifespan(app: FastAPI):
     # 启动时初始化数据库
     print("初始化数据库...")
     await init_db()
+    # 上次退出前尚未应用评分的投票（投票排队模式）
+    recovered = await get_vote_queue().recover()
+    if recovered:
+        print(f"已补充应用 {recovered} 张投票的评分")
     print("数据库初始化完成！")
+    snapshots = None
+    if config.RATING_SNAPSHOT_INTERVAL > 0:
+        snapshots = asyncio.create_task(run_periodic_snapshots(config.RATING_SNAPSHOT_INTERVAL))
+    vote_recovery = None
+    if config.VOTE_QUEUE_ENABLED and config.VOTE_RECOVER_INTERVAL > 0:
+        vote_recovery = asyncio.create_task(get_vote_queue().run_periodic_recovery(config.VOTE_RECOVER_INTERVAL))
+    bradley_terry = None
+    if config.BT_REFRESH_INTERVAL > 0:
+        bradley_terry = asyncio.create_task(get_bradley_terry().run_periodic(config.BT_REFRESH_INTERVAL))
     yield
-    # 关闭时的清理工作
+    # 关闭时的清理工作：先停掉后台任务并等它们退出，再关闭它们用到的进程池、上游连接与写入队列
+    background = [task for task in (snapshots, vote_recovery, bradley_terry) if task is not None]
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await get_bradley_terry().aclose()
+    await get_model_service().aclose()
+    await get_usage_ledger().aclose()
+    await get_vote_queue().aclose()
     print("应用关闭")
 
 
@@ -38,6 +70,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """上游额度排队超时：快速返回 503，并告知客户端何时重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(ContextWindowExceeded)
+async def context_window_exceeded_handler(request: Request, exc: ContextWindowExceeded):
+    """当前消息放不进模型的上下文窗口：在调用上游之前直接拒绝"""
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
 # 挂载静态文件
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -48,6 +94,7 @@ templates = Jinja2Templates(directory="templates")
 app.include_router(battle_router)
 app.include_router(chat_router)
 app.include_router(leaderboard_router)
+app.include_router(admin_router)
 
 
 @app.get("/")
@@ -1,6 +1,6 @@
 """数据库模型"""
 from .database import Base, engine, get_db, init_db
-from .schemas import Battle, Vote, ModelRating, ChatSession
+from .schemas import Battle, Vote, ModelRating, ChatSession, AbandonedTurn, UsageRecord, Message, ModelRatingStripe, RatingSnapshot
 
-__all__ = ["Base", "engine", "get_db", "init_db", "Battle", "Vote", "ModelRating", "ChatSession"]
+__all__ = ["Base", "engine", "get_db", "init_db", "Battle", "Vote", "ModelRating", "ChatSession", "AbandonedTurn", "UsageRecord", "Message", "ModelRatingStripe", "RatingSnapshot"]
 
@@ -0,0 +1,188 @@
+"""
+透明压缩的文本列，以及压缩存量数据的迁移
+
+写入时 UTF-8 编码后达到 config.COMPRESS_MIN_BYTES 的文本用 zlib 压缩，并加 2 字节头 b"\\x00z"；
+较短的文本按 UTF-8 原样存储（与旧的 Text 列内容一致）。读取时按头部判断是否需要解压，
+旧的未压缩数据（驱动返回 str 或不带头的 bytes）原样返回，因此无需先压缩存量数据即可上线。
+MySQL 上旧的 TEXT 列存不了二进制数据，迁移 0003 / 0006 会先把这些列改为 LONGBLOB（见 ensure_blob_columns），
+迁移 0005 压缩存量数据（见 models/migrations.py）。
+
+TEXT 改 LONGBLOB 在 MySQL 上不能在线执行（ALGORITHM=COPY：复制整表，期间阻塞写入），
+因此迁移只直接修改空表上的列；表中已有数据时迁移报错退出，需在停写的维护窗口单独执行:
+    python -m models.compression --widen-columns
+之后再执行迁移（python -m models.migrations 或重启服务）。
+
+调低 COMPRESS_MIN_BYTES 后可以单独重新压缩存量数据（可重复执行，每批单独提交）:
+    python -m models.compression --batch-size 500
+"""
+import argparse
+import asyncio
+import zlib
+from typing import Optional, Union
+
+from sqlalchemy import LargeBinary, select, text, update
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import TypeDecorator
+
+import config
+
+# 压缩数据的头部：NUL 不会出现在正常文本的开头
+ZLIB_HEADER = b"\x00z"
+
+
+def compress_text(value: str) -> bytes:
+    data = value.encode("utf-8")
+    if len(data) < config.COMPRESS_MIN_BYTES:
+        return data
+    compressed = zlib.compress(data, config.COMPRESS_LEVEL)
+    if len(compressed) + len(ZLIB_HEADER) >= len(data):
+        # 不可压缩的内容（如已压缩过的 base64）原样存储
+        return data
+    return ZLIB_HEADER + compressed
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value.startswith(ZLIB_HEADER):
+        return zlib.decompress(value[len(ZLIB_HEADER):]).decode("utf-8")
+    return value.decode("utf-8")
+
+
+def is_compressed(value: Union[str, bytes, None]) -> bool:
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:2]) == ZLIB_HEADER
+
+
+class CompressedText(TypeDecorator):
+    """在 Python 侧是 str 的二进制列：大文本透明压缩，小文本原样存储"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        # MySQL 的 BLOB 上限 64KB，推理模型的回复可能更长
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(mysql.LONGBLOB())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+def _compressed_columns():
+    from .schemas import AbandonedTurn, Message, Vote
+    return [
+        (Message, Message.content),
+        (Vote, Vote.user_prompt),
+        (AbandonedTurn, AbandonedTurn.partial_a),
+        (AbandonedTurn, AbandonedTurn.partial_b),
+    ]
+
+
+async def ensure_blob_columns(conn, offline: bool = False):
+    """
+    MySQL：把旧的 TEXT 列改为 LONGBLOB（已是 LONGBLOB 时跳过）；其他数据库无需处理
+    改列会复制整表并阻塞写入，非空表只在 offline=True（维护窗口中的 --widen-columns）时修改，否则报错
+    """
+    if conn.dialect.name != "mysql":
+        return
+    pending = []
+    for schema, column in _compressed_columns():
+        result = await conn.execute(
+            text(
+                "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column"
+            ),
+            {"table": schema.__tablename__, "column": column.key},
+        )
+        data_type = result.scalar_one_or_none()
+        if data_type is not None and data_type.lower() != "longblob":
+            pending.append((schema, column, data_type))
+
+    if not offline:
+        tables = []
+        for schema, _, _ in pending:
+            table = schema.__tablename__
+            if table not in tables and (await conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1"))).first():
+                tables.append(table)
+        if tables:
+            columns = ", ".join(f"{schema.__tablename__}.{column.key}" for schema, column, _ in pending)
+            raise RuntimeError(
+                f"{columns} 需要从 TEXT 改为 LONGBLOB，{', '.join(tables)} 表中已有数据，"
+                "MySQL 改列时会复制整表并阻塞写入。请在停写的维护窗口执行 "
+                "python -m models.compression --widen-columns，再执行迁移"
+            )
+
+    for schema, column, data_type in pending:
+        nullable = "NULL" if column.nullable else "NOT NULL"
+        await conn.execute(text(
+            f"ALTER TABLE {schema.__tablename__} MODIFY {column.key} LONGBLOB {nullable}"
+        ))
+        print(f"{schema.__tablename__}.{column.key}: {data_type} -> LONGBLOB")
+
+
+async def widen_columns():
+    """维护窗口中执行：把所有压缩存储的列改为 LONGBLOB（包括非空表）"""
+    from .database import engine
+
+    async with engine.begin() as conn:
+        await ensure_blob_columns(conn, offline=True)
+
+
+async def compress_existing(batch_size: int = 500) -> int:
+    """按主键分批扫描，压缩达到阈值但尚未压缩的存量数据；返回压缩的值个数"""
+    from .database import async_session_maker, engine
+
+    async with engine.begin() as conn:
+        await ensure_blob_columns(conn)
+
+    compressed = 0
+    for schema, column in _compressed_columns():
+        last_id = None
+        while True:
+            async with async_session_maker() as db:
+                # 按列名读取原始值，不经过 CompressedText 的解压
+                query = select(schema.id, text(column.key)).select_from(schema)
+                if last_id is not None:
+                    query = query.where(schema.id > last_id)
+                result = await db.execute(query.order_by(schema.id).limit(batch_size))
+                rows = result.all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                for row_id, value in rows:
+                    if value is None or is_compressed(value):
+                        continue
+                    plain = decompress_text(value)
+                    if not compress_text(plain).startswith(ZLIB_HEADER):
+                        # 低于阈值或压缩无收益，保持原样
+                        continue
+                    await db.execute(
+                        update(schema).where(schema.id == row_id).values({column.key: plain})
+                    )
+                    compressed += 1
+                await db.commit()
+        print(f"{schema.__tablename__}.{column.key}: 已处理至 {last_id}")
+    return compressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="压缩存量的大文本数据")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批扫描的行数")
+    parser.add_argument(
+        "--widen-columns", action="store_true",
+        help="只把 MySQL 上的 TEXT 列改为 LONGBLOB（复制整表、阻塞写入，需在维护窗口执行）",
+    )
+    args = parser.parse_args()
+    if args.widen_columns:
+        asyncio.run(widen_columns())
+    else:
+        count = asyncio.run(compress_existing(args.batch_size))
+        print(f"共压缩 {count} 个值")
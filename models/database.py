@@ -32,11 +32,17 @@ async def get_db():
 
 async def init_db():
     """初始化数据库"""
-    from .schemas import Battle, Vote, ModelRating, ChatSession
+    from .schemas import ModelRating
+    from .migrations import pending_migrations, upgrade
     
-    async with engine.begin() as conn:
-        # 创建所有表
-        await conn.run_sync(Base.metadata.create_all)
+    # 执行待执行的数据库迁移（建表、索引、数据回填），已是最新版本时只查询一次版本表
+    if config.AUTO_MIGRATE:
+        await upgrade()
+    else:
+        pending = await pending_migrations()
+        if pending:
+            labels = ", ".join(migration.label for migration in pending)
+            raise RuntimeError(f"数据库有待执行的迁移（{labels}），请先执行 python -m models.migrations")
     
     # 初始化模型评分
     async with async_session_maker() as session:
@@ -61,4 +67,8 @@ async def init_db():
                 session.add(model_rating)
             
             await session.commit()
+    
+    # 开启评分分片时为各模型补建分片行，关闭时合并残留的分片
+    from services.rating_service import RatingService
+    await RatingService.init_stripes([model_config["id"] for model_config in config.AVAILABLE_MODELS])
 
@@ -0,0 +1,246 @@
+"""
+版本化的数据库迁移
+
+每个迁移有递增的版本号，执行完成后记入 schema_migrations 表；启动时（config.AUTO_MIGRATE）只执行尚未应用的迁移，
+已是最新版本时只需一次查询，不再每次启动都 create_all。
+
+迁移需可重复执行：执行到一半中断时版本号不会记录，下次会从头再执行一遍该迁移。
+因此建表、改列、建索引都先检查当前结构，数据回填分批提交并跳过已处理的数据。
+新增表、列或索引时，在 schemas.py 中声明的同时在 MIGRATIONS 末尾追加一个迁移（全新的库由 0001 按当前模型建表，
+之后的迁移检查后跳过）。
+
+大表或多实例部署建议把 AUTO_MIGRATE 设为 false，在发布前单独执行:
+    python -m models.migrations            # 执行全部待执行的迁移
+    python -m models.migrations --status   # 查看各迁移是否已应用
+MySQL 上的索引以 ALGORITHM=INPLACE LOCK=NONE 在线创建，建索引期间表仍可读写。
+例外是 0003 / 0006 把 TEXT 列改为 LONGBLOB：MySQL 只能复制整表，表中已有数据时迁移会报错退出，
+需先在停写的维护窗口执行 python -m models.compression --widen-columns（见 models/compression.py）。
+"""
+import argparse
+import asyncio
+from typing import Awaitable, Callable, List, Set
+
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from .database import Base, async_session_maker, engine
+from .schemas import ModelRatingStripe, RatingSnapshot, SchemaMigration, Vote
+
+
+class Migration:
+    """一个迁移：版本号、名称与执行函数"""
+
+    def __init__(self, version: int, name: str, upgrade: Callable[[], Awaitable[None]]):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+
+    @property
+    def label(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+async def _initial_schema():
+    """按当前模型创建缺失的表（已存在的表不做修改）"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def _legacy_conversations():
+    """旧版 JSON 对话历史迁移到 messages 表"""
+    from services.conversation import migrate_legacy_conversations
+
+    migrated = await migrate_legacy_conversations()
+    if migrated:
+        print(f"已将 {migrated} 个会话的对话历史迁移到 messages 表")
+
+
+async def _compressed_columns():
+    """压缩存储的列在 MySQL 上改为 LONGBLOB（旧库中为 TEXT）；非空表需先离线执行 --widen-columns"""
+    from .compression import ensure_blob_columns
+
+    async with engine.begin() as conn:
+        await ensure_blob_columns(conn)
+
+
+def _existing_indexes(sync_conn, table_name: str) -> Set[str]:
+    return {index["name"] for index in inspect(sync_conn).get_indexes(table_name)}
+
+
+def _existing_columns(sync_conn, table_name: str) -> Set[str]:
+    return {column["name"] for column in inspect(sync_conn).get_columns(table_name)}
+
+
+def _online(conn, ddl: str) -> str:
+    """MySQL 上以在线 DDL 执行（不锁表）"""
+    if conn.dialect.name == "mysql":
+        return ddl + " ALGORITHM=INPLACE LOCK=NONE"
+    return ddl
+
+
+async def _create_indexes(names: List[str]):
+    """创建模型中声明、库中尚不存在的索引（已不再声明的跳过）"""
+    declared = {index.name: index for table in Base.metadata.sorted_tables for index in table.indexes}
+    async with engine.connect() as conn:
+        for name in names:
+            index = declared.get(name)
+            if index is None or name in await conn.run_sync(_existing_indexes, index.table.name):
+                continue
+            print(f"创建索引 {name}")
+            await conn.execute(text(_online(conn, str(CreateIndex(index).compile(dialect=conn.dialect)))))
+            await conn.commit()
+
+
+async def _drop_index(table_name: str, name: str):
+    async with engine.connect() as conn:
+        if name not in await conn.run_sync(_existing_indexes, table_name):
+            return
+        print(f"删除索引 {name}")
+        if conn.dialect.name == "mysql":
+            await conn.execute(text(_online(conn, f"DROP INDEX {name} ON {table_name}")))
+        else:
+            await conn.execute(text(f"DROP INDEX {name}"))
+        await conn.commit()
+
+
+async def _add_column(table_name: str, name: str, definition: str):
+    """添加列（已存在时跳过）；MySQL 上在线执行"""
+    async with engine.connect() as conn:
+        if name in await conn.run_sync(_existing_columns, table_name):
+            return
+        print(f"添加列 {table_name}.{name}")
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {name} {definition}"
+        if conn.dialect.name == "mysql":
+            ddl += ", ALGORITHM=INPLACE, LOCK=NONE"
+        await conn.execute(text(ddl))
+        await conn.commit()
+
+
+async def _performance_indexes():
+    await _create_indexes([
+        "ix_battles_created_at",
+        "ix_battles_winner_created_at",
+        "ix_votes_battle_id",
+        "ix_votes_created_at",
+        "ix_votes_model_a_id_created_at",
+        "ix_votes_model_b_id_created_at",
+    ])
+
+
+async def _compress_existing_text():
+    """压缩存量的大文本（分批提交）"""
+    from .compression import compress_existing
+
+    compressed = await compress_existing()
+    if compressed:
+        print(f"已压缩 {compressed} 个存量文本")
+
+
+async def _unique_vote_per_battle():
+    """
+    每场对战只保留最早的一票，再把 votes.battle_id 上的普通索引换成唯一索引
+    重复票此前已计入评分，评分表不在这里回退
+    """
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Vote.battle_id).group_by(Vote.battle_id).having(func.count() > 1)
+        )
+        removed = 0
+        for battle_id in result.scalars().all():
+            ids = await db.execute(
+                select(Vote.id).where(Vote.battle_id == battle_id).order_by(Vote.created_at, Vote.id)
+            )
+            duplicates = ids.scalars().all()[1:]
+            await db.execute(delete(Vote).where(Vote.id.in_(duplicates)))
+            removed += len(duplicates)
+        await db.commit()
+    if removed:
+        print(f"已删除 {removed} 张重复投票")
+
+    await _create_indexes(["uq_votes_battle_id"])
+    await _drop_index("votes", "ix_votes_battle_id")
+
+
+async def _vote_rating_applied():
+    """投票的评分应用标记（投票排队模式），存量投票均已应用"""
+    await _add_column("votes", "rating_applied", "INTEGER NOT NULL DEFAULT 1")
+    await _create_indexes(["ix_votes_rating_applied"])
+
+
+async def _create_table(schema):
+    async with engine.begin() as conn:
+        await conn.run_sync(schema.__table__.create, checkfirst=True)
+
+
+async def _rating_stripes():
+    """评分分片表"""
+    await _create_table(ModelRatingStripe)
+
+
+async def _rating_snapshots():
+    """评分快照表"""
+    await _create_table(RatingSnapshot)
+
+
+async def _abandoned_turn_errors():
+    """放弃轮次的失败原因（投票时按会话查找失败的轮次）"""
+    await _add_column("abandoned_turns", "error", "TEXT NULL")
+    await _create_indexes(["ix_abandoned_turns_session_id"])
+
+
+# 按版本号递增排列；已发布的迁移不要修改或删除
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial_schema", _initial_schema),
+    Migration(2, "legacy_conversations", _legacy_conversations),
+    Migration(3, "compressed_columns", _compressed_columns),
+    Migration(4, "performance_indexes", _performance_indexes),
+    Migration(5, "compress_existing_text", _compress_existing_text),
+    Migration(6, "vote_prompt_compressed", _compressed_columns),
+    Migration(7, "unique_vote_per_battle", _unique_vote_per_battle),
+    Migration(8, "vote_rating_applied", _vote_rating_applied),
+    Migration(9, "rating_stripes", _rating_stripes),
+    Migration(10, "rating_snapshots", _rating_snapshots),
+    Migration(11, "abandoned_turn_errors", _abandoned_turn_errors),
+]
+
+
+async def applied_versions() -> Set[int]:
+    async with engine.begin() as conn:
+        await conn.run_sync(SchemaMigration.__table__.create, checkfirst=True)
+        result = await conn.execute(select(SchemaMigration.version))
+        return set(result.scalars())
+
+
+async def pending_migrations() -> List[Migration]:
+    applied = await applied_versions()
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+async def upgrade() -> int:
+    """依次执行尚未应用的迁移，返回执行的个数"""
+    pending = await pending_migrations()
+    for migration in pending:
+        print(f"执行迁移 {migration.label} ...")
+        await migration.upgrade()
+        async with async_session_maker() as db:
+            db.add(SchemaMigration(version=migration.version, name=migration.name))
+            await db.commit()
+    return len(pending)
+
+
+async def _main(status: bool):
+    if status:
+        applied = await applied_versions()
+        for migration in MIGRATIONS:
+            print(f"{migration.label:40s} {'已应用' if migration.version in applied else '待执行'}")
+    else:
+        count = await upgrade()
+        print(f"共执行 {count} 个迁移" if count else "数据库已是最新版本")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="执行数据库迁移")
+    parser.add_argument("--status", action="store_true", help="只查看各迁移是否已应用")
+    args = parser.parse_args()
+    asyncio.run(_main(args.status))
@@ -1,7 +1,8 @@
 """数据库表结构定义"""
-from sqlalchemy import Column, String, Integer, Float, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, Float, DateTime, Text, ForeignKey, JSON, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from .database import Base
+from .compression import CompressedText
 import uuid
 
 
@@ -13,30 +14,44 @@ def generate_uuid():
 class Battle(Base):
     """对战会话表"""
     __tablename__ = "battles"
+    __table_args__ = (
+        Index("ix_battles_winner_created_at", "winner", "created_at"),
+    )
     
     id = Column(String(50), primary_key=True, default=generate_uuid)
     model_a_id = Column(String(100), nullable=False)  # 模型 A 的 ID
     model_b_id = Column(String(100), nullable=False)  # 模型 B 的 ID
-    conversation = Column(JSON, default=list)  # 对话历史 [{"role": "user", "content": "..."}, ...]
-    model_a_response = Column(Text)  # 模型 A 的最后回复
-    model_b_response = Column(Text)  # 模型 B 的最后回复
+    # 以下三列已废弃：对话历史改存 messages 表，启动时迁移旧数据后置空
+    conversation = Column(JSON(none_as_null=True), nullable=True)
+    model_a_response = Column(Text)
+    model_b_response = Column(Text)
     winner = Column(String(50), nullable=True)  # 胜者: "model_a", "model_b", "tie", None
     is_revealed = Column(Integer, default=0)  # 是否已揭示模型身份
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
 class Vote(Base):
     """投票记录表"""
     __tablename__ = "votes"
+    __table_args__ = (
+        # 每场对战只能有一票（并发的重复投票由唯一约束兜底）
+        Index("uq_votes_battle_id", "battle_id", unique=True),
+        # 按模型查询投票历史（时间范围内）
+        Index("ix_votes_model_a_id_created_at", "model_a_id", "created_at"),
+        Index("ix_votes_model_b_id_created_at", "model_b_id", "created_at"),
+        # 排队模式下查找尚未应用评分的投票
+        Index("ix_votes_rating_applied", "rating_applied"),
+    )
     
     id = Column(String(50), primary_key=True, default=generate_uuid)
     battle_id = Column(String(50), ForeignKey("battles.id"), nullable=False)
     winner = Column(String(50), nullable=False)  # "model_a", "model_b", "tie"
     model_a_id = Column(String(100), nullable=False)  # 记录具体模型 ID
     model_b_id = Column(String(100), nullable=False)
-    user_prompt = Column(Text)  # 用户的提问
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    user_prompt = Column(CompressedText)  # 用户的提问（投票时从 messages 表复制首条用户消息）
+    rating_applied = Column(Integer, nullable=False, default=1, server_default="1")  # 评分是否已累加（排队模式下先为 0）
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
 
 class ModelRating(Base):
@@ -54,6 +69,36 @@ class ModelRating(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class ModelRatingStripe(Base):
+    """
+    模型评分的分片计数（config.RATING_STRIPES > 1 时使用）
+    每票累加到该模型随机一个分片，模型的评分与计数 = model_ratings 中的值 + 各分片之和
+    """
+    __tablename__ = "model_rating_stripes"
+    
+    model_id = Column(String(100), primary_key=True)
+    stripe = Column(Integer, primary_key=True, autoincrement=False)
+    rating = Column(Float, nullable=False, default=0)
+    total_battles = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    ties = Column(Integer, nullable=False, default=0)
+
+
+class RatingSnapshot(Base):
+    """
+    评分快照：created_at 不晚于 votes_until 的全部投票按模型累计的胜 / 负 / 平场数
+    与积分规则无关，用于增量重建评分表（见 services/rating_rebuild.py）
+    """
+    __tablename__ = "rating_snapshots"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    votes_until = Column(DateTime(timezone=True), nullable=False)  # 高水位：投票的 created_at
+    vote_count = Column(Integer, nullable=False)  # 快照包含的投票数
+    state = Column(JSON, nullable=False)  # {model_id: [胜, 负, 平]}
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class ChatSession(Base):
     """聊天会话表（用于 Side-by-Side 和 Direct 模式）"""
     __tablename__ = "chat_sessions"
@@ -61,7 +106,71 @@ class ChatSession(Base):
     id = Column(String(50), primary_key=True, default=generate_uuid)
     mode = Column(String(50), nullable=False)  # "direct" 或 "sidebyside"
     model_ids = Column(JSON, nullable=False)  # 使用的模型 ID 列表
-    conversation = Column(JSON, default=list)  # 对话历史
+    conversation = Column(JSON(none_as_null=True), nullable=True)  # 已废弃：对话历史改存 messages 表
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+
+class AbandonedTurn(Base):
+    """
+    被放弃的对话轮次，不计入会话历史：
+    客户端在回复完成前断开（上游调用已取消），或有一侧模型调用失败（error 记录失败原因）
+    """
+    __tablename__ = "abandoned_turns"
+    
+    id = Column(String(50), primary_key=True, default=generate_uuid)
+    mode = Column(String(50), nullable=False)  # "battle" 或 "sidebyside"
+    session_id = Column(String(50), nullable=False, index=True)  # 对战或聊天会话 ID
+    model_a_id = Column(String(100), nullable=False)
+    model_b_id = Column(String(100), nullable=False)
+    user_message = Column(Text)  # 本轮用户的提问
+    partial_a = Column(CompressedText)  # 断开时模型 A 已生成的内容
+    partial_b = Column(CompressedText)  # 断开时模型 B 已生成的内容
+    error = Column(Text, nullable=True)  # 模型调用失败时的错误信息（客户端断开时为空）；有失败轮次的对战不能投票
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UsageRecord(Base):
+    """上游调用用量账本（每次上游尝试一行，含失败与取消；由后台批量写入）"""
+    __tablename__ = "usage_ledger"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)  # 调用开始时间（UTC）
+    model_id = Column(String(100), nullable=False)
+    provider = Column(String(50), nullable=False)
+    endpoint = Column(String(100), nullable=False)  # 端点名，见 config.UPSTREAM_ENDPOINTS
+    prompt_tokens = Column(Integer, default=0)  # 上游返回的用量，缺失时为本地估算
+    completion_tokens = Column(Integer, default=0)
+    ttft = Column(Float, nullable=True)  # 首 token 延迟（秒），仅流式调用
+    latency = Column(Float, nullable=False)  # 总耗时（秒）
+    tokens_per_second = Column(Float, nullable=True)  # 生成速度（流式按首 token 之后计）
+    finish_reason = Column(String(32), nullable=True)  # stop / length / ...
+    error = Column(String(64), nullable=True)  # 失败时的异常类名，取消为 "Cancelled"
+
+
+class Message(Base):
+    """
+    对话消息表（只追加）
+    每轮对话一条多行 INSERT：用户消息 side="user"，两侧模型回复 side="a" / "b"
+    session_id 为对战 ID 或并排对比会话 ID
+    """
+    __tablename__ = "messages"
+    __table_args__ = (
+        UniqueConstraint("session_id", "turn", "side", name="uq_messages_session_turn_side"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(50), nullable=False)
+    turn = Column(Integer, nullable=False)  # 轮次，从 0 开始
+    side = Column(String(8), nullable=False)  # "user" / "a" / "b"
+    content = Column(CompressedText, nullable=False)  # 大文本透明压缩，见 models/compression.py
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class SchemaMigration(Base):
+    """已应用的数据库迁移，见 models/migrations.py"""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
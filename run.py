@@ -44,7 +44,8 @@ def check_dependencies():
         'sqlalchemy',
         'aiosqlite',
         'pydantic',
-        'python-dotenv'
+        'python-dotenv',
+        'numpy'
     ]
     
     missing_packages = []
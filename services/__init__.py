@@ -1,6 +1,7 @@
 """服务层"""
-from .model_service import ModelService
+from .model_service import ModelService, get_model_service
 from .rating_service import RatingService
+from .rate_limit import RateLimitExceeded
 
-__all__ = ["ModelService", "RatingService"]
+__all__ = ["ModelService", "get_model_service", "RatingService", "RateLimitExceeded"]
 
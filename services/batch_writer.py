@@ -0,0 +1,98 @@
+"""后台批量写入器：用量账本与投票队列共用的攒批、退避重试与关闭逻辑"""
+import asyncio
+from typing import Any, List, Optional
+
+import config
+
+
+class BatchWriter:
+    """
+    请求路径只做一次 put_nowait；后台任务攒满 batch_size 条或等待 flush_interval 秒后调用 write_batch 一次性写入
+    写入失败时按指数退避（retry_backoff、2 倍、4 倍……秒）重试 max_retries 次，仍失败则计入 failed 并放弃这一批
+    子类实现 write_batch，失败时抛出异常
+    """
+
+    name = "批量写入"
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int = 0,
+        max_retries: Optional[int] = None,
+        retry_backoff: Optional[float] = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = config.BATCH_WRITE_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = config.BATCH_WRITE_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def write_batch(self, batch: List[Any]) -> Any:
+        raise NotImplementedError
+
+    def _put(self, item) -> bool:
+        """入队（不等待写入）；队列满时返回 False"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Any]) -> Any:
+        """写入一批，失败时退避重试；返回 write_batch 的结果，放弃时返回 None"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self.write_batch(batch)
+                self.batches += 1
+                return result
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    print(f"{self.name}失败（{len(batch)} 条），已放弃: {str(e)}")
+                    return None
+                self.retries += 1
+                delay = self.retry_backoff * 2 ** attempt
+                print(f"{self.name}失败（{len(batch)} 条），{delay:.1f} 秒后重试: {str(e)}")
+                await asyncio.sleep(delay)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def aclose(self):
+        """写完队列中剩余的数据后停止后台任务"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
@@ -0,0 +1,126 @@
+"""
+对战令牌：开始对战时不写库，把抽中的模型对与随机 nonce 签名后交给客户端
+首次对话时才按令牌建对战记录（对战 ID 即 nonce）
+
+格式: base64url(JSON 载荷) + "." + base64url(HMAC-SHA256 签名)
+
+签名密钥取 config.BATTLE_TOKEN_SECRET；未配置时首次使用随机生成并保存到 config.BATTLE_TOKEN_SECRET_FILE，
+重启（包括开发模式的自动重载）和同一台机器上的多个进程共用同一个密钥。
+密钥更换后旧令牌签名不再匹配，但已经写库的对战仍可按令牌中的对战 ID 找到（见 unverified_battle_id）。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+import uuid
+from typing import Optional
+
+import config
+
+
+class InvalidBattleToken(Exception):
+    """令牌格式错误或签名不匹配"""
+
+
+class BattleClaims:
+    """令牌中的对战信息"""
+
+    def __init__(self, battle_id: str, model_a_id: str, model_b_id: str, issued_at: int):
+        self.battle_id = battle_id
+        self.model_a_id = model_a_id
+        self.model_b_id = model_b_id
+        self.issued_at = issued_at
+
+    @property
+    def expired(self) -> bool:
+        return time.time() - self.issued_at > config.BATTLE_TOKEN_TTL
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+_file_secret: Optional[str] = None
+
+
+def _load_or_create_secret(path: str) -> str:
+    """读取密钥文件；不存在时生成一个，以硬链接原子地创建（并发创建时以先创建者为准）"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+
+    temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(secrets.token_urlsafe(32))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(temp_path)
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def _secret() -> str:
+    global _file_secret
+    if config.BATTLE_TOKEN_SECRET:
+        return config.BATTLE_TOKEN_SECRET
+    if _file_secret is None:
+        _file_secret = _load_or_create_secret(config.BATTLE_TOKEN_SECRET_FILE)
+    return _file_secret
+
+
+def _sign(payload: str) -> str:
+    key = _secret().encode("utf-8")
+    return _b64encode(hmac.new(key, payload.encode("utf-8"), hashlib.sha256).digest())
+
+
+def issue_battle_token(model_a_id: str, model_b_id: str) -> str:
+    """签发令牌：nonce 同时作为首次对话时创建的对战 ID"""
+    claims = {"a": model_a_id, "b": model_b_id, "n": str(uuid.uuid4()), "t": int(time.time())}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def is_battle_token(session_id: str) -> bool:
+    """区分令牌与旧版的对战 ID（UUID 中没有 "."）"""
+    return "." in session_id
+
+
+def unverified_battle_id(token: str) -> Optional[str]:
+    """
+    不校验签名，只取出令牌中的对战 ID（格式错误时返回 None）
+    仅用于查找已经写库的对战：签名密钥更换后旧令牌仍能找到已有记录，但不能凭它创建新对战
+    """
+    payload = token.partition(".")[0]
+    try:
+        battle_id = json.loads(_b64decode(payload))["n"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return battle_id if isinstance(battle_id, str) else None
+
+
+def verify_battle_token(token: str) -> BattleClaims:
+    """校验签名并解出对战信息；不检查是否过期（见 BattleClaims.expired）"""
+    payload, _, signature = token.partition(".")
+    if not hmac.compare_digest(signature.encode("utf-8"), _sign(payload).encode("ascii")):
+        raise InvalidBattleToken("对战令牌签名无效")
+    try:
+        claims = json.loads(_b64decode(payload))
+        return BattleClaims(claims["n"], claims["a"], claims["b"], int(claims["t"]))
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidBattleToken("对战令牌格式错误") from e
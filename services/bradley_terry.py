@@ -0,0 +1,253 @@
+"""
+Bradley–Terry 排行榜（与积分制评分并列展示）
+
+积分制的评分随模型被抽中的次数累积，不能直接比较强弱。这里按全部投票拟合 Bradley–Terry 模型：
+    P(i 胜 j) = 1 / (1 + exp(θj - θi))
+投票由数据库按 (模型 A, 模型 B, 结果) 聚合为两两胜负矩阵，平局记为双方各胜半场，拟合的开销只与模型数有关、与票数无关。
+用牛顿法（逻辑回归的 IRLS）求解，每个模型另与强度为 0 的虚拟对手平局 BT_PRIOR_GAMES 场，
+从未赢过或从未输过的模型也有有限的评分。评分换算为 Elo 量纲：BT_BASE_RATING + BT_SCALE * log10(e) * (θ - 平均 θ)。
+
+95% 置信区间：按多项分布重采样胜负矩阵（等价于对投票做 bootstrap），BT_BOOTSTRAP_ROUNDS 轮拟合分给
+BT_WORKERS 个进程并行，取 2.5% / 97.5% 分位数。每次拟合都以上一次的解为初值（热启动），新增投票不多时两三步即收敛。
+
+后台任务每 BT_REFRESH_INTERVAL 秒刷新一次：RATING_SNAPSHOT_LAG 秒之前的投票累加进内存后不再重读，
+之后的投票（可能还有未提交的事务）每次重新统计。/api/leaderboard 只读内存中的结果，不增加数据库查询；
+多进程部署时每个进程各自拟合。
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models.database import async_session_maker
+from models.schemas import Vote
+from .rating_rebuild import high_water_mark, vote_groups
+import config
+
+# (模型 A, 模型 B, 结果) -> 票数
+Groups = Dict[Tuple[str, str, str], int]
+
+# 单步牛顿迭代中 θ 的最大变化量（远离最优解时避免越过）
+_MAX_STEP = 2.0
+
+
+def _add(groups: Groups, key: Tuple[str, str, str], count: int):
+    groups[key] = groups.get(key, 0) + count
+
+
+def pairwise_matrices(groups: Groups, model_ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """wins[i, j]：i 胜 j 的票数；ties[i, j]：i 与 j 平局的票数（只记在 i < j 一侧）"""
+    index = {model_id: i for i, model_id in enumerate(model_ids)}
+    wins = np.zeros((len(model_ids), len(model_ids)))
+    ties = np.zeros_like(wins)
+    for (model_a_id, model_b_id, winner), count in groups.items():
+        a, b = index[model_a_id], index[model_b_id]
+        if winner == "model_a":
+            wins[a, b] += count
+        elif winner == "model_b":
+            wins[b, a] += count
+        else:
+            ties[min(a, b), max(a, b)] += count
+    return wins, ties
+
+
+def fit(
+    wins: np.ndarray,
+    ties: np.ndarray,
+    theta: Optional[np.ndarray] = None,
+    prior_games: float = 1.0,
+    tol: float = 1e-6,
+    max_iter: int = 100,
+) -> Tuple[np.ndarray, int]:
+    """牛顿法拟合各模型的强度 θ，theta 为初值（热启动）；返回 (θ, 迭代次数)"""
+    score = wins + 0.5 * (ties + ties.T)
+    games = score + score.T
+    points = score.sum(axis=1) + 0.5 * prior_games
+    theta = np.zeros(len(wins)) if theta is None else np.array(theta, dtype=float)
+
+    for iteration in range(1, max_iter + 1):
+        # p[i, j] = P(i 胜 j)，p.T = 1 - p
+        p = 1.0 / (1.0 + np.exp(theta[None, :] - theta[:, None]))
+        prior_p = 1.0 / (1.0 + np.exp(-theta))
+        gradient = points - (games * p).sum(axis=1) - prior_games * prior_p
+        weights = games * p * p.T
+        hessian = weights - np.diag(weights.sum(axis=1) + prior_games * prior_p * (1.0 - prior_p))
+        step = np.linalg.solve(hessian, -gradient)
+        largest = np.abs(step).max()
+        if largest > _MAX_STEP:
+            step *= _MAX_STEP / largest
+        theta += step
+        if largest < tol:
+            break
+    return theta, iteration
+
+
+def bootstrap(
+    wins: np.ndarray,
+    ties: np.ndarray,
+    theta: np.ndarray,
+    rounds: int,
+    seed,
+    prior_games: float = 1.0,
+) -> np.ndarray:
+    """重采样 rounds 次并从 theta 热启动拟合，返回 (rounds, 模型数) 的 θ（各轮已减去均值）"""
+    rng = np.random.default_rng(seed)
+    size = wins.size
+    cells = np.concatenate([wins.ravel(), ties.ravel()])
+    total = int(cells.sum())
+    probabilities = cells / total
+    samples = np.empty((rounds, len(theta)))
+    for i in range(rounds):
+        resampled = rng.multinomial(total, probabilities).astype(float)
+        fitted, _ = fit(
+            resampled[:size].reshape(wins.shape),
+            resampled[size:].reshape(ties.shape),
+            theta,
+            prior_games,
+        )
+        samples[i] = fitted - fitted.mean()
+    return samples
+
+
+def to_rating(theta: np.ndarray) -> np.ndarray:
+    """θ（已减去均值）换算为 Elo 量纲的评分"""
+    return config.BT_BASE_RATING + config.BT_SCALE * np.log10(np.e) * theta
+
+
+class BradleyTerryLeaderboard:
+    """
+    Bradley–Terry 评分与置信区间的计算与缓存
+    refresh() 由后台任务定期调用；请求路径只调用 results()
+    """
+
+    def __init__(self, rounds: int, workers: int):
+        self.rounds = rounds
+        self.workers = workers
+        # RATING_SNAPSHOT_LAG 之前（截至 self._until）的票数，只增不减
+        self._groups: Groups = {}
+        self._until: Optional[datetime] = None
+        # 上一次的解，作为下一次拟合的初值
+        self._theta: Dict[str, float] = {}
+        self._results: Dict[str, Dict] = {}
+        self._summary: Dict = {"updated_at": None}
+        self._refreshed_at: Optional[float] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = asyncio.Lock()
+
+    async def _load(self) -> Groups:
+        """读取新增的投票：高水位之前的累加进 self._groups，之后的每次重新统计"""
+        async with async_session_maker() as db:
+            until = await high_water_mark(db)
+            if self._until is None or until > self._until:
+                conditions = [Vote.created_at <= until]
+                if self._until is not None:
+                    conditions.append(Vote.created_at > self._until)
+                async for model_a_id, model_b_id, winner, count in vote_groups(db, *conditions):
+                    _add(self._groups, (model_a_id, model_b_id, winner), count)
+                self._until = until
+
+            groups = dict(self._groups)
+            async for model_a_id, model_b_id, winner, count in vote_groups(db, Vote.created_at > self._until):
+                _add(groups, (model_a_id, model_b_id, winner), count)
+            return groups
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        """拟合用的进程池（BT_WORKERS 为 0 时返回 None，在默认线程池中计算）"""
+        if self._pool is None and self.workers > 0:
+            # spawn：不继承事件循环与数据库驱动的线程
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def refresh(self, min_interval: float = 0) -> Dict:
+        """
+        按最新的投票重新拟合并计算置信区间，返回本次的摘要
+        已有刷新在进行、或距上次刷新不到 min_interval 秒时不排队等待，直接返回上一次的摘要
+        """
+        if self._lock.locked() or (
+            self._refreshed_at is not None and time.monotonic() - self._refreshed_at < min_interval
+        ):
+            return self._summary
+        async with self._lock:
+            started = time.perf_counter()
+            groups = await self._load()
+            model_ids = sorted({model_id for model_a_id, model_b_id, _ in groups for model_id in (model_a_id, model_b_id)})
+            if not model_ids:
+                return self._summary
+
+            wins, ties = pairwise_matrices(groups, model_ids)
+            initial = np.array([self._theta.get(model_id, 0.0) for model_id in model_ids])
+            loop = asyncio.get_running_loop()
+            pool = self._executor()
+            theta, iterations = await loop.run_in_executor(
+                pool, fit, wins, ties, initial, config.BT_PRIOR_GAMES
+            )
+
+            chunks = [len(chunk) for chunk in np.array_split(np.arange(self.rounds), max(self.workers, 1)) if len(chunk)]
+            seeds = np.random.SeedSequence().spawn(len(chunks))
+            samples = await asyncio.gather(*(
+                loop.run_in_executor(pool, bootstrap, wins, ties, theta, rounds, seed, config.BT_PRIOR_GAMES)
+                for rounds, seed in zip(chunks, seeds)
+            ))
+
+            ratings = to_rating(theta - theta.mean())
+            if chunks:
+                lower, upper = np.percentile(to_rating(np.vstack(samples)), [2.5, 97.5], axis=0)
+            else:
+                lower, upper = ratings, ratings
+            order = np.argsort(-ratings)
+            self._results = {
+                model_ids[i]: {
+                    "bt_rank": rank,
+                    "bt_rating": round(float(ratings[i]), 1),
+                    "bt_ci_lower": round(float(lower[i]), 1),
+                    "bt_ci_upper": round(float(upper[i]), 1),
+                }
+                for rank, i in enumerate(order, start=1)
+            }
+            self._theta = dict(zip(model_ids, theta.tolist()))
+            self._summary = {
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "votes": int(wins.sum() + ties.sum()),
+                "models": len(model_ids),
+                "iterations": iterations,
+                "bootstrap_rounds": sum(chunks),
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            self._refreshed_at = time.monotonic()
+            return self._summary
+
+    def results(self) -> Dict[str, Dict]:
+        """各模型最近一次的 Bradley–Terry 评分（尚未计算时为空）"""
+        return self._results
+
+    def summary(self) -> Dict:
+        return self._summary
+
+    async def run_periodic(self, interval: float):
+        """启动时计算一次，之后每 interval 秒刷新（由应用生命周期启动和取消）"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Bradley–Terry 排行榜计算失败: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def aclose(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_shared_leaderboard: Optional[BradleyTerryLeaderboard] = None
+
+
+def get_bradley_terry() -> BradleyTerryLeaderboard:
+    """获取进程内共享的 Bradley–Terry 排行榜"""
+    global _shared_leaderboard
+    if _shared_leaderboard is None:
+        _shared_leaderboard = BradleyTerryLeaderboard(config.BT_BOOTSTRAP_ROUNDS, config.BT_WORKERS)
+    return _shared_leaderboard
@@ -0,0 +1,140 @@
+"""按模型熔断器"""
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Tuple
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求未发往上游"""
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """429、5xx、超时和连接错误计入模型故障；参数错误等 4xx 不计"""
+    if isinstance(exc, (APITimeoutError, APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    三态熔断器：closed → open → half_open → closed
+    - closed：统计最近 window 次调用，错误率或慢调用率超过阈值即打开
+    - open：直接拒绝，open_seconds 后进入 half_open
+    - half_open：最多放行 probes 个探测请求，全部成功则关闭，任一失败重新打开
+    """
+
+    def __init__(
+        self,
+        window: int,
+        min_calls: int,
+        error_rate: float,
+        slow_call_seconds: float,
+        slow_call_rate: float,
+        open_seconds: float,
+        probes: int,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+
+        self.state = CLOSED
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (失败, 慢调用)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _refresh(self):
+        """open 状态到期后转为 half_open"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+
+    def allows_pairing(self) -> bool:
+        """是否可以参与对战配对：closed，或 half_open 且仍有探测名额"""
+        self._refresh()
+        if self.state == CLOSED:
+            return True
+        return self.state == HALF_OPEN and self._probes_in_flight < self.probes
+
+    @contextmanager
+    def call(self):
+        """包裹一次上游调用并记录结果；不允许调用时抛出 CircuitOpenError"""
+        self._refresh()
+        probing = False
+        if self.state == OPEN:
+            raise CircuitOpenError("模型暂时不可用（熔断中）")
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.probes:
+                raise CircuitOpenError("模型暂时不可用（探测中）")
+            self._probes_in_flight += 1
+            probing = True
+
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            if is_upstream_failure(e):
+                self._record(probing, failed=True, slow=False)
+            elif probing:
+                self._probes_in_flight -= 1
+            raise
+        else:
+            slow = time.monotonic() - started >= self.slow_call_seconds
+            self._record(probing, failed=False, slow=slow)
+
+    def _record(self, probing: bool, failed: bool, slow: bool):
+        if probing:
+            self._probes_in_flight -= 1
+            if self.state != HALF_OPEN:
+                return
+            if failed or slow:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.probes:
+                self.state = CLOSED
+                self._calls.clear()
+            return
+
+        if self.state != CLOSED:
+            return
+        self._calls.append((failed, slow))
+        if len(self._calls) < self.min_calls:
+            return
+        total = len(self._calls)
+        failures = sum(1 for f, _ in self._calls if f)
+        slow_calls = sum(1 for _, s in self._calls if s)
+        if failures / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+            self._open()
+
+    def stats(self) -> Dict:
+        """当前状态与最近窗口内的错误率"""
+        self._refresh()
+        total = len(self._calls)
+        failures = sum(1 for f, _ in self._calls if f)
+        return {
+            "state": self.state,
+            "recent_calls": total,
+            "error_rate": round(failures / total, 3) if total else 0.0,
+        }
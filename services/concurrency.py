@@ -0,0 +1,109 @@
+"""按模型自适应并发限制（AIMD）"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict
+
+import httpx
+from openai import APITimeoutError, RateLimitError
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """排队超时或队列已满，请求被拒绝"""
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """429 与超时说明上游已过载，需要收缩并发"""
+    return isinstance(
+        exc,
+        (RateLimitError, APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError),
+    )
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 并发限制器（思路同 TCP 拥塞控制）
+    - 慢启动：第一次收到过载信号之前，每次成功 limit += 1（每完成一个窗口的请求，上限翻倍），
+      初始上限较小时也能很快涨到上游实际能承受的并发
+    - 成功：limit += 1 / limit（每完成约一个窗口的请求，上限 +1）
+    - 429/超时：limit *= backoff（同一窗口内只收缩一次），并结束慢启动
+    超过上限的请求排队等待，等待时间和队列长度都有上界
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        backoff: float,
+        queue_timeout: float,
+        max_queue: int,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self.slow_start = True
+        self._window = 0  # 每次收缩后递增，避免同一批失败重复收缩
+        self._cond = asyncio.Condition()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """占用一个并发槽位，退出时根据结果调整上限"""
+        async with self._cond:
+            if not self._has_capacity():
+                if self.queued >= self.max_queue:
+                    self.rejected += 1
+                    raise ConcurrencyLimitExceeded("排队请求过多")
+                self.queued += 1
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(self._has_capacity),
+                        timeout=self.queue_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise ConcurrencyLimitExceeded("排队等待超时")
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            window = self._window
+
+        try:
+            yield
+        except BaseException as e:
+            await self._release(window, overloaded=is_overload_error(e), succeeded=False)
+            raise
+        else:
+            await self._release(window, overloaded=False, succeeded=True)
+
+    async def _release(self, window: int, overloaded: bool, succeeded: bool):
+        async with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                if window == self._window:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self._window += 1
+                self.slow_start = False
+            elif succeeded:
+                step = 1.0 if self.slow_start else 1.0 / self.limit
+                self.limit = min(float(self.max_limit), self.limit + step)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        """当前上限、是否处于慢启动、在途数、排队数和累计拒绝数"""
+        return {
+            "limit": int(self.limit),
+            "slow_start": self.slow_start,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
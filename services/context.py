@@ -0,0 +1,81 @@
+"""按模型上下文窗口为对话历史做预算：放不下时从最早的轮次开始丢弃"""
+from typing import Dict, List
+
+from .tokens import estimate_message_tokens, estimate_messages_tokens, REPLY_PRIMING
+import config
+
+
+class ContextWindowExceeded(Exception):
+    """只保留当前这条消息也放不进模型的上下文窗口"""
+
+    def __init__(self, model_id: str, prompt_tokens: int, context_window: int):
+        super().__init__(
+            f"消息过长：模型 {model_id} 的上下文窗口约 {context_window} tokens，"
+            f"当前消息约 {prompt_tokens} tokens，请缩短后重试"
+        )
+        self.model_id = model_id
+        self.prompt_tokens = prompt_tokens
+        self.context_window = context_window
+
+
+def _model_config(model_id: str) -> Dict:
+    for model in config.AVAILABLE_MODELS:
+        if model["id"] == model_id:
+            return model
+    return {}
+
+
+def context_window(model_id: str) -> int:
+    """模型的上下文窗口（tokens），未配置时使用默认值"""
+    return _model_config(model_id).get("context_window", config.DEFAULT_CONTEXT_WINDOW)
+
+
+def _usable_window(model_id: str) -> int:
+    # 估算值有误差，预留一部分余量
+    return int(context_window(model_id) * (1 - config.CONTEXT_WINDOW_HEADROOM))
+
+
+def _target_completion(model_id: str, max_tokens: int) -> int:
+    return min(max_tokens, _model_config(model_id).get("max_output_tokens", max_tokens))
+
+
+def completion_budget(model_id: str, messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """给定提示词后，本次调用实际可用的 max_tokens（不超过模型输出上限与剩余窗口）"""
+    prompt = estimate_messages_tokens(messages)
+    return max(1, min(_target_completion(model_id, max_tokens), _usable_window(model_id) - prompt))
+
+
+def fit_history(
+    model_id: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int = 8000,
+) -> List[Dict[str, str]]:
+    """
+    裁剪对话历史，使 提示词 + 回复 放进模型的上下文窗口
+    以用户消息为轮次边界，从最早的轮次开始整轮丢弃，开头的 system 消息与当前这轮始终保留；
+    只剩当前这轮仍放不下完整回复时压缩回复长度，连最小回复长度都放不下时抛出 ContextWindowExceeded
+    """
+    usable = _usable_window(model_id)
+    target = _target_completion(model_id, max_tokens)
+
+    system_count = 0
+    while system_count < len(messages) and messages[system_count]["role"] == "system":
+        system_count += 1
+    system, rest = messages[:system_count], messages[system_count:]
+    fixed = sum(estimate_message_tokens(m) for m in system) + REPLY_PRIMING
+
+    # suffix[i]: 保留 rest[i:] 时的历史 token 数
+    suffix = [0] * (len(rest) + 1)
+    for i in range(len(rest) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + estimate_message_tokens(rest[i])
+
+    starts = [i for i, m in enumerate(rest) if m["role"] == "user"] or [0]
+    for start in starts:
+        if fixed + suffix[start] + target <= usable:
+            return system + rest[start:]
+
+    # 只保留当前这轮
+    prompt = fixed + suffix[starts[-1]]
+    if usable - prompt < min(target, config.CONTEXT_MIN_COMPLETION_TOKENS):
+        raise ContextWindowExceeded(model_id, prompt, context_window(model_id))
+    return system + rest[starts[-1]:]
@@ -0,0 +1,179 @@
+"""
+对战 / 并排对比会话的分侧对话历史
+
+对话存放在只追加的 messages 表中，每轮一条多行 INSERT：
+    (session_id, turn, "user", 用户消息), (session_id, turn, "a", 模型 A 回复), (session_id, turn, "b", 模型 B 回复)
+读取时还原为消息列表，模型回复带 "side" 标记（"a" 或 "b"）：
+    [{"role": "user", "content": "..."},
+     {"role": "assistant", "side": "a", "content": "..."},
+     {"role": "assistant", "side": "b", "content": "..."}, ...]
+每个模型只看到全部用户消息和自己一侧的回复，不再读取对手的回答
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, null, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import async_session_maker
+from models.schemas import Battle, ChatSession, Message
+
+SIDES = ("a", "b")
+USER_SIDE = "user"
+
+# 并发请求写入同一轮次时的最多尝试次数
+SAVE_TURN_ATTEMPTS = 5
+
+# 旧格式的回复没有 side 标记，内容形如 "[Model A]: ..." 或 "[模型名]: ..."，每轮依次为 A、B
+_LEGACY_PREFIX = re.compile(r"^\[[^\]\n]*\]: ")
+
+
+def side_history(conversation: List[Dict], side: str) -> List[Dict[str, str]]:
+    """取出某一侧模型自己的对话线程（可直接作为 messages 发给上游）"""
+    return [
+        {"role": message["role"], "content": message["content"]}
+        for message in conversation
+        if message["role"] != "assistant" or message.get("side") == side
+    ]
+
+
+def _to_message(side: str, content: str) -> Dict[str, str]:
+    if side == USER_SIDE:
+        return {"role": "user", "content": content}
+    return {"role": "assistant", "side": side, "content": content}
+
+
+async def load_conversation(db: AsyncSession, session_id: str) -> Tuple[List[Dict], int]:
+    """读取会话的消息列表，同时返回下一轮的轮次"""
+    result = await db.execute(
+        select(Message.turn, Message.side, Message.content)
+        .where(Message.session_id == session_id)
+        .order_by(Message.turn, Message.id)
+    )
+    rows = result.all()
+    conversation = [_to_message(side, content) for _, side, content in rows]
+    return conversation, (rows[-1].turn + 1 if rows else 0)
+
+
+async def next_turn(db: AsyncSession, session_id: str) -> int:
+    result = await db.execute(
+        select(func.max(Message.turn)).where(Message.session_id == session_id)
+    )
+    last = result.scalar_one()
+    return 0 if last is None else last + 1
+
+
+def first_user_message_query(session_id: str):
+    """会话第一条用户消息的标量子查询（投票记录中的 user_prompt，插入时直接复制，不经过应用层）"""
+    return select(Message.content).where(
+        Message.session_id == session_id,
+        Message.turn == 0,
+        Message.side == USER_SIDE,
+    ).scalar_subquery()
+
+
+def _turn_rows(session_id: str, turn: int, messages: Dict[str, str]) -> List[Dict]:
+    return [
+        {"session_id": session_id, "turn": turn, "side": side, "content": content}
+        for side, content in messages.items()
+    ]
+
+
+async def save_turn(
+    db: AsyncSession,
+    session_id: str,
+    turn: int,
+    user_message: str,
+    response_a: str,
+    response_b: str,
+    new_session=None,
+) -> int:
+    """
+    以一条多行 INSERT 追加一轮对话并提交，返回实际写入的轮次
+    new_session: 会话记录尚未写库时（对战令牌的首轮）传入，与本轮消息在同一事务中写入
+    并发请求已写入同一轮次（唯一约束冲突）时，回滚后按最新轮次重试
+    """
+    messages = {USER_SIDE: user_message, "a": response_a, "b": response_b}
+    for attempt in range(SAVE_TURN_ATTEMPTS):
+        try:
+            if new_session is not None:
+                db.add(new_session)
+                await db.flush()
+            await db.execute(insert(Message).values(_turn_rows(session_id, turn, messages)))
+            await db.commit()
+            return turn
+        except IntegrityError:
+            await db.rollback()
+            if attempt == SAVE_TURN_ATTEMPTS - 1:
+                raise
+            turn = await next_turn(db, session_id)
+            if turn > 0:
+                # 会话记录已由并发请求随它的首轮一起写入
+                new_session = None
+
+
+def _legacy_turns(conversation: List[Dict]) -> List[Dict[str, str]]:
+    """把旧版 JSON 对话历史拆成轮次：[{"user": ..., "a": ..., "b": ...}, ...]"""
+    turns: List[Dict[str, str]] = []
+    legacy_index = 0
+    for message in conversation or []:
+        if message.get("role") != "assistant":
+            legacy_index = 0
+            turns.append({USER_SIDE: message["content"]})
+            continue
+
+        side = message.get("side")
+        content = message["content"]
+        if side is None:
+            side = SIDES[min(legacy_index, 1)]
+            legacy_index += 1
+            content = _LEGACY_PREFIX.sub("", content, count=1)
+        if not turns or side in turns[-1]:
+            turns.append({})
+        turns[-1][side] = content
+    return turns
+
+
+async def _migrate_batch(schema, batch_size: int, after: Optional[str]) -> List[str]:
+    """迁移主键大于 after 的一批会话，返回本批的会话 ID（按主键递增）"""
+    async with async_session_maker() as db:
+        query = select(schema.id, schema.conversation).where(schema.conversation.is_not(None))
+        if after is not None:
+            query = query.where(schema.id > after)
+        result = await db.execute(query.order_by(schema.id).limit(batch_size))
+        sessions = result.all()
+        if not sessions:
+            return []
+
+        rows = []
+        for session_id, conversation in sessions:
+            for turn, messages in enumerate(_legacy_turns(conversation)):
+                rows.extend(_turn_rows(session_id, turn, messages))
+        if rows:
+            await db.execute(insert(Message), rows)
+
+        session_ids = [session_id for session_id, _ in sessions]
+        values = {"conversation": null()}
+        if schema is Battle:
+            values.update(model_a_response=null(), model_b_response=null())
+        await db.execute(update(schema).where(schema.id.in_(session_ids)).values(**values))
+        await db.commit()
+        return session_ids
+
+
+async def migrate_legacy_conversations(batch_size: int = 200) -> int:
+    """
+    把 battles / chat_sessions 中旧版 JSON 对话历史迁移到 messages 表，并清空旧列
+    按主键分批提交，每批的写入与清空在同一事务中，中断后重新执行会从未迁移的会话继续；返回迁移的会话数
+    """
+    migrated = 0
+    for schema in (Battle, ChatSession):
+        after = None
+        while True:
+            session_ids = await _migrate_batch(schema, batch_size, after)
+            if not session_ids:
+                break
+            migrated += len(session_ids)
+            after = session_ids[-1]
+    return migrated
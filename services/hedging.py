@@ -0,0 +1,47 @@
+"""对冲请求：延迟统计与额外请求预算"""
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class LatencyTracker:
+    """按模型保存最近的延迟样本，用于估算分位数"""
+
+    def __init__(self, max_samples: int, min_samples: int):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model_id: str, seconds: float):
+        samples = self._samples.get(model_id)
+        if samples is None:
+            samples = deque(maxlen=self.max_samples)
+            self._samples[model_id] = samples
+        samples.append(seconds)
+
+    def percentile(self, model_id: str, q: float) -> Optional[float]:
+        """样本不足 min_samples 时返回 None"""
+        samples = self._samples.get(model_id)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """限制对冲请求占主请求的比例，控制额外成本"""
+
+    def __init__(self, ratio: float):
+        self.ratio = ratio
+        self.requests = 0
+        self.hedges = 0
+
+    def record_request(self):
+        self.requests += 1
+
+    def try_acquire(self) -> bool:
+        """预算内返回 True 并计数"""
+        if self.hedges + 1 > self.ratio * self.requests:
+            return False
+        self.hedges += 1
+        return True
@@ -1,35 +1,371 @@
 """模型调用服务"""
 import asyncio
-from typing import List, Dict, Optional
-from openai import OpenAI
-from starlette.concurrency import run_in_threadpool
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Dict, Optional, AsyncIterator, Set, Tuple
+from .circuit_breaker import CircuitBreaker, is_upstream_failure
+from .concurrency import AdaptiveLimiter
+from .hedging import HedgeBudget, LatencyTracker
+from .rate_limit import RateLimiter, RateLimitExceeded
+from .tokens import estimate_messages_tokens
+from .context import completion_budget
+from .registry import Endpoint, ProviderRegistry, is_failover_error
+from .retry import RetryPolicy
+from .usage import UsageCall, get_usage_ledger
 import config
 
 
+class ModelCallFailed(Exception):
+    """模型调用最终失败（已重试、切换端点与对冲），接口层按侧展示错误，失败的一轮不写入对话历史"""
+
+    def __init__(self, model_id: str, message: str):
+        super().__init__(message)
+        self.model_id = model_id
+
+
 class ModelService:
-    """AI 模型调用服务（使用同步 OpenAI 客户端，在后台线程执行，避免 httpx 兼容性问题）"""
+    """AI 模型调用服务（原生异步客户端，不占用工作线程）"""
 
     def __init__(self):
-        # OpenAI 客户端（默认）
-        self.openai_client = OpenAI(
-            api_key=config.OPENAI_API_KEY,
-            base_url=config.OPENAI_BASE_URL,
+        # 上游端点注册表（每个端点独立的 base_url、Key 与连接池）
+        self.registry = ProviderRegistry(config.UPSTREAM_ENDPOINTS, config.MODEL_ENDPOINTS)
+
+        # 每个模型一个自适应并发限制器和熔断器（首次使用时创建）
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+        # 每个服务商一个重试策略（未单独配置的服务商使用默认策略）
+        self._retry_policies: Dict[str, RetryPolicy] = {
+            provider: RetryPolicy(**policy)
+            for provider, policy in config.RETRY_POLICIES.items()
+        }
+        self._default_retry_policy = RetryPolicy(**config.DEFAULT_RETRY_POLICY)
+        self._retry_counts: Dict[str, int] = {}
+        self._failover_counts: Dict[str, int] = {}
+
+        # 对冲请求：延迟样本与预算
+        self._latency = LatencyTracker(config.HEDGE_MAX_SAMPLES, config.HEDGE_MIN_SAMPLES)
+        self._ttft = LatencyTracker(config.HEDGE_MAX_SAMPLES, config.HEDGE_MIN_SAMPLES)
+        self._hedge_budget = HedgeBudget(config.HEDGE_BUDGET_RATIO)
+        self._hedge_counts: Dict[str, Dict[str, int]] = {}
+
+        # 按 (API Key, 模型) 的 RPM/TPM 限流器（首次使用时创建，不限流时为 None）
+        self._rate_limiters: Dict[Tuple[str, str], Optional[RateLimiter]] = {}
+
+        # 流式调用是否请求上游在末尾返回用量（不支持的网关改为本地估算）
+        self._stream_options = (
+            {"stream_options": {"include_usage": True}} if config.STREAM_INCLUDE_USAGE else {}
         )
-        
-        # DeepSeek 客户端
-        self.deepseek_client = OpenAI(
-            api_key=config.DEEPSEEK_API_KEY,
-            base_url=config.DEEPSEEK_BASE_URL,
+
+    def _rank_endpoints(
+        self,
+        model_id: str,
+        tokens: int,
+        exclude: Set[str] = frozenset(),
+        hedge: bool = False,
+    ) -> List[Endpoint]:
+        """
+        按优先级排序模型的候选端点：
+        先看限流排队时间，再看 EWMA 延迟与错误率；对冲请求优先使用仅对冲端点
+        exclude 中的端点排在最后（全部被排除时仍可作为兜底）
+        """
+        def _key(endpoint: Endpoint):
+            rate_limiter = self._get_rate_limiter(endpoint, model_id)
+            wait = rate_limiter.estimate_wait(tokens) if rate_limiter is not None else 0.0
+            return (
+                endpoint.name in exclude,
+                hedge and not endpoint.hedge_only,
+                wait,
+                endpoint.health(model_id).score(config.ROUTING_ERROR_PENALTY),
+            )
+
+        candidates = self.registry.candidates(model_id, include_hedge_only=hedge)
+        return sorted(candidates, key=_key)
+
+    def _hedge_delay(self, tracker: LatencyTracker, model_id: str) -> Optional[float]:
+        """计入预算并返回对冲等待时间；未开启或样本不足时返回 None"""
+        if not config.HEDGE_ENABLED:
+            return None
+        self._hedge_budget.record_request()
+        return tracker.percentile(model_id, config.HEDGE_PERCENTILE)
+
+    def _try_hedge(self, model_id: str) -> bool:
+        """预算内允许发出一个备用请求"""
+        if not self._hedge_budget.try_acquire():
+            return False
+        counts = self._hedge_counts.setdefault(model_id, {"issued": 0, "won": 0})
+        counts["issued"] += 1
+        return True
+
+    def _record_hedge_win(self, model_id: str):
+        self._hedge_counts[model_id]["won"] += 1
+
+    def _retry_policy(self, endpoint: Endpoint) -> RetryPolicy:
+        return self._retry_policies.get(endpoint.provider, self._default_retry_policy)
+
+    async def _wait_before_retry(
+        self,
+        model_id: str,
+        endpoint: Endpoint,
+        exc: Exception,
+        attempt: int,
+        started: float,
+    ) -> bool:
+        """按端点所属服务商的策略决定是否重试；需要重试时先等待并计数，返回 True"""
+        policy = self._retry_policy(endpoint)
+        delay = policy.retry_delay(exc, attempt, time.monotonic() - started)
+        if delay is None:
+            return False
+        self._retry_counts[model_id] = self._retry_counts.get(model_id, 0) + 1
+        print(f"模型 {model_id} 第 {attempt} 次调用失败（{endpoint.name}），{delay:.2f}s 后重试: {str(exc)}")
+        await asyncio.sleep(delay)
+        return True
+
+    async def _handle_attempt_failure(
+        self,
+        model_id: str,
+        endpoint: Endpoint,
+        exc: Exception,
+        tried: Set[str],
+        tokens: int,
+        attempt: int,
+        started: float,
+    ) -> bool:
+        """
+        一次尝试失败后的处理：记录端点健康度；还有未尝试过的端点时立即故障转移，
+        否则按重试策略退避。返回 True 表示应继续下一次尝试
+        """
+        if is_upstream_failure(exc) or is_failover_error(exc):
+            endpoint.health(model_id).record(False)
+        tried.add(endpoint.name)
+        if is_failover_error(exc):
+            untried = [
+                e for e in self.registry.candidates(model_id)
+                if e.name not in tried
+            ]
+            if untried and time.monotonic() - started < self._retry_policy(endpoint).deadline:
+                self._failover_counts[model_id] = self._failover_counts.get(model_id, 0) + 1
+                print(f"模型 {model_id} 在 {endpoint.name} 调用失败，切换端点: {str(exc)}")
+                return True
+        if not await self._wait_before_retry(model_id, endpoint, exc, attempt, started):
+            return False
+        # 所有端点都试过后重新在全部端点中选择
+        if len(tried) >= len(self.registry.candidates(model_id)):
+            tried.clear()
+        return True
+
+    def _get_limiter(self, model_id: str) -> AdaptiveLimiter:
+        """获取模型对应的并发限制器"""
+        limiter = self._limiters.get(model_id)
+        if limiter is None:
+            limiter = AdaptiveLimiter(
+                initial=config.MODEL_CONCURRENCY_INITIAL,
+                min_limit=config.MODEL_CONCURRENCY_MIN,
+                max_limit=config.MODEL_CONCURRENCY_MAX,
+                backoff=config.MODEL_CONCURRENCY_BACKOFF,
+                queue_timeout=config.MODEL_QUEUE_TIMEOUT,
+                max_queue=config.MODEL_QUEUE_MAX,
+            )
+            self._limiters[model_id] = limiter
+        return limiter
+
+    def _get_breaker(self, model_id: str) -> CircuitBreaker:
+        """获取模型对应的熔断器"""
+        breaker = self._breakers.get(model_id)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                window=config.BREAKER_WINDOW,
+                min_calls=config.BREAKER_MIN_CALLS,
+                error_rate=config.BREAKER_ERROR_RATE,
+                slow_call_seconds=config.BREAKER_SLOW_CALL_SECONDS,
+                slow_call_rate=config.BREAKER_SLOW_CALL_RATE,
+                open_seconds=config.BREAKER_OPEN_SECONDS,
+                probes=config.BREAKER_HALF_OPEN_PROBES,
+            )
+            self._breakers[model_id] = breaker
+        return breaker
+
+    def _get_rate_limiter(self, endpoint: Endpoint, model_id: str) -> Optional[RateLimiter]:
+        """获取 (API Key, 模型) 对应的限流器；未配置额度时返回 None"""
+        key = (endpoint.api_key, model_id)
+        if key not in self._rate_limiters:
+            limits = {
+                **config.RATE_LIMITS.get(endpoint.provider, {}),
+                **config.MODEL_RATE_LIMITS.get(model_id, {}),
+            }
+            rpm, tpm = limits.get("rpm", 0), limits.get("tpm", 0)
+            self._rate_limiters[key] = (
+                RateLimiter(rpm, tpm, config.RATE_LIMIT_MAX_WAIT) if rpm or tpm else None
+            )
+        return self._rate_limiters[key]
+
+    def check_rate_limits(
+        self,
+        calls: List[Tuple[str, List[Dict[str, str]]]],
+        max_tokens: int = 8000,
+    ):
+        """
+        调用前检查额度：calls 为 (模型 ID, 发给该模型的 messages) 列表，
+        任一模型在所有端点上预计排队都超过上限时抛出 RateLimitExceeded，
+        由接口层直接返回 503 + Retry-After，避免请求在服务端长时间挂起
+        """
+        for model_id, messages in calls:
+            tokens = estimate_messages_tokens(messages) + completion_budget(
+                model_id, messages, max_tokens
+            )
+            waits = []
+            for endpoint in self.registry.candidates(model_id):
+                limiter = self._get_rate_limiter(endpoint, model_id)
+                if limiter is None:
+                    break
+                waits.append((limiter.estimate_wait(tokens), limiter))
+            else:
+                wait, limiter = min(waits, key=lambda item: item[0])
+                if wait > limiter.max_wait:
+                    limiter.rejected += 1
+                    raise RateLimitExceeded(wait)
+
+    @asynccontextmanager
+    async def _guard(self, model_id: str, endpoint: Endpoint, tokens: int):
+        """一次上游尝试的保护：先按额度排队，再占用并发槽位"""
+        rate_limiter = self._get_rate_limiter(endpoint, model_id)
+        if rate_limiter is not None:
+            await rate_limiter.acquire(tokens)
+        async with self._get_limiter(model_id).acquire():
+            yield
+
+    def get_pairable_models(self) -> List[Dict]:
+        """可参与对战配对的模型（熔断器关闭，或半开且仍有探测名额）"""
+        return [
+            model for model in config.AVAILABLE_MODELS
+            if model["id"] not in self._breakers
+            or self._breakers[model["id"]].allows_pairing()
+        ]
+
+    def get_breaker_stats(self) -> Dict[str, Dict]:
+        """各模型熔断器的状态与最近错误率"""
+        return {
+            model_id: breaker.stats()
+            for model_id, breaker in self._breakers.items()
+        }
+
+    def get_rate_limit_stats(self) -> Dict[str, Dict]:
+        """各 (API Key, 模型) 的剩余额度、排队数和拒绝数（Key 以使用它的端点名表示，不输出 Key 本身）"""
+        key_names: Dict[str, List[str]] = {}
+        for endpoint in self.registry.endpoints.values():
+            key_names.setdefault(endpoint.api_key, []).append(endpoint.name)
+        return {
+            f"{'+'.join(key_names.get(api_key, ['?']))}/{model_id}": limiter.stats()
+            for (api_key, model_id), limiter in self._rate_limiters.items()
+            if limiter is not None
+        }
+
+    def get_retry_stats(self) -> Dict[str, int]:
+        """各模型累计重试次数"""
+        return dict(self._retry_counts)
+
+    def get_failover_stats(self) -> Dict[str, int]:
+        """各模型累计切换端点次数"""
+        return dict(self._failover_counts)
+
+    def get_endpoint_stats(self) -> Dict[str, Dict]:
+        """各端点上各模型的 EWMA 延迟、错误率和请求数"""
+        return self.registry.stats()
+
+    def get_concurrency_stats(self) -> Dict[str, Dict]:
+        """各模型的并发上限、在途数、排队数和拒绝数"""
+        return {
+            model_id: limiter.stats()
+            for model_id, limiter in self._limiters.items()
+        }
+
+    def get_hedge_stats(self) -> Dict:
+        """对冲请求预算使用情况，以及各模型发出/胜出的备用请求数"""
+        return {
+            "enabled": config.HEDGE_ENABLED,
+            "requests": self._hedge_budget.requests,
+            "hedges": self._hedge_budget.hedges,
+            "models": {
+                model_id: {
+                    **counts,
+                    "latency_p95": self._latency.percentile(model_id, config.HEDGE_PERCENTILE),
+                    "ttft_p95": self._ttft.percentile(model_id, config.HEDGE_PERCENTILE),
+                }
+                for model_id, counts in self._hedge_counts.items()
+            },
+        }
+
+    async def aclose(self):
+        """关闭所有连接池（应用关闭时调用）"""
+        await self.registry.aclose()
+
+    @contextmanager
+    def _track_usage(self, model_id: str, endpoint: Endpoint, messages: List[Dict[str, str]]):
+        """把一次上游调用记入用量账本（成功、失败与取消都会记录，写库在后台完成）"""
+        call = UsageCall(
+            model_id, endpoint.provider, endpoint.name, estimate_messages_tokens(messages)
         )
-    
-    def _get_client_for_model(self, model_id: str) -> OpenAI:
-        """根据模型 ID 返回对应的 API 客户端"""
-        # 判断是否是 DeepSeek 模型
-        if model_id.startswith("deepseek-") or model_id.startswith("deepseek/"):
-            return self.deepseek_client
-        
-        # 默认使用 OpenAI 客户端
-        return self.openai_client
+        try:
+            yield call
+        except (asyncio.CancelledError, GeneratorExit):
+            call.error = "Cancelled"
+            raise
+        except Exception as e:
+            call.error = type(e).__name__
+            raise
+        finally:
+            get_usage_ledger().record(call)
+
+    async def _request_completion(
+        self,
+        model_id: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        exclude: Set[str] = frozenset(),
+        hedge: bool = False,
+        chosen: Optional[Set[str]] = None,
+    ) -> str:
+        """
+        带故障转移与重试的非流式调用，最终失败时抛出异常
+        熔断器记录的是整个调用（含切换端点与重试）的最终结果，单个端点故障不会熔断模型
+        chosen: 每次尝试前把选中的端点加入其中，供对冲请求避开
+        """
+        tokens = estimate_messages_tokens(messages) + max_tokens
+        tried: Set[str] = set(exclude)
+        started = time.monotonic()
+        attempt = 0
+        with self._get_breaker(model_id).call():
+            while True:
+                attempt += 1
+                endpoint = self._rank_endpoints(model_id, tokens, tried, hedge)[0]
+                if chosen is not None:
+                    chosen.add(endpoint.name)
+                try:
+                    async with self._guard(model_id, endpoint, tokens):
+                        attempt_started = time.monotonic()
+                        with self._track_usage(model_id, endpoint, messages) as usage:
+                            resp = await endpoint.client.chat.completions.create(
+                                model=model_id,
+                                messages=messages,
+                                temperature=temperature,
+                                max_tokens=max_tokens,
+                            )
+                            usage.set_usage(resp.usage)
+                            usage.finish_reason = resp.choices[0].finish_reason
+                            usage.add_text(resp.choices[0].message.content or "")
+                        latency = time.monotonic() - attempt_started
+                    self._latency.record(model_id, latency)
+                    endpoint.health(model_id).record(True, latency)
+                    rate_limiter = self._get_rate_limiter(endpoint, model_id)
+                    if rate_limiter is not None and resp.usage is not None:
+                        rate_limiter.settle(tokens, resp.usage.total_tokens)
+                    return resp.choices[0].message.content
+                except Exception as e:
+                    if not await self._handle_attempt_failure(
+                        model_id, endpoint, e, tried, tokens, attempt, started
+                    ):
+                        raise
 
     async def get_completion(
         self,
@@ -39,73 +375,264 @@ class ModelService:
         max_tokens: int = 8000,
     ) -> str:
         """
-        获取模型回复（在后台线程中调用同步 OpenAI 客户端）
-        根据模型 ID 自动选择对应的 API 客户端
+        获取模型回复
+        按延迟与错误率选择端点，失败时自动切换；开启对冲时，
+        主请求超过该模型的 p95 仍未返回则向另一端点发出备用请求，先返回者胜出
+        max_tokens 会被压缩到模型输出上限与剩余上下文窗口以内
+        最终失败时抛出 ModelCallFailed
         """
-        # 根据模型 ID 选择客户端
-        client = self._get_client_for_model(model_id)
-
-        def _call() -> str:
-            resp = client.chat.completions.create(
-                model=model_id,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
+        max_tokens = completion_budget(model_id, messages, max_tokens)
+        try:
+            delay = self._hedge_delay(self._latency, model_id)
+            busy: Set[str] = set()
+            primary = asyncio.ensure_future(
+                self._request_completion(model_id, messages, temperature, max_tokens, chosen=busy)
             )
-            return resp.choices[0].message.content
+            tasks = [primary]
+            try:
+                if delay is None:
+                    return await primary
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if done or not self._try_hedge(model_id):
+                    return await primary
 
-        try:
-            return await run_in_threadpool(_call)
+                # 避开主请求实际使用的端点，而不是按当前状态重新排序得到的首选
+                backup = asyncio.ensure_future(
+                    self._request_completion(
+                        model_id, messages, temperature, max_tokens, exclude=set(busy), hedge=True
+                    )
+                )
+                tasks.append(backup)
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is backup:
+                                self._record_hedge_win(model_id)
+                            return task.result()
+                # 两个请求都失败，以主请求的错误为准
+                return primary.result()
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
         except Exception as e:
             print(f"模型 {model_id} 调用失败: {str(e)}")
-            return f"抱歉，模型调用失败: {str(e)}"
+            raise ModelCallFailed(model_id, str(e)) from e
 
     async def get_dual_completion(
         self,
         model_a_id: str,
         model_b_id: str,
-        messages: List[Dict[str, str]],
+        messages_a: List[Dict[str, str]],
+        messages_b: List[Dict[str, str]],
         temperature: float = 0.7,
         max_tokens: int = 8000,
-    ) -> tuple[str, str]:
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
         """
         同时获取两个模型的回复（用于对战/对比模式）
+        每个模型只收到自己一侧的对话历史
+        返回 (回复, 错误)：{"a": ..., "b": ...} 中只有成功的一侧有回复，失败的一侧在错误中
         """
         results = await asyncio.gather(
-            self.get_completion(model_a_id, messages, temperature, max_tokens),
-            self.get_completion(model_b_id, messages, temperature, max_tokens),
+            self.get_completion(model_a_id, messages_a, temperature, max_tokens),
+            self.get_completion(model_b_id, messages_b, temperature, max_tokens),
             return_exceptions=True,
         )
 
-        response_a = (
-            results[0]
-            if not isinstance(results[0], Exception)
-            else f"模型 A 调用失败: {str(results[0])}"
-        )
-        response_b = (
-            results[1]
-            if not isinstance(results[1], Exception)
-            else f"模型 B 调用失败: {str(results[1])}"
-        )
+        responses: Dict[str, str] = {}
+        errors: Dict[str, str] = {}
+        for side, result in zip(("a", "b"), results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                errors[side] = str(result)
+            else:
+                responses[side] = result
+        return responses, errors
 
-        return response_a, response_b
+    async def _request_stream(
+        self,
+        model_id: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        exclude: Set[str] = frozenset(),
+        hedge: bool = False,
+        chosen: Optional[Set[str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        带故障转移与重试的流式调用；只在首个 token 之前切换端点或重试
+        熔断器记录整个调用的最终结果
+        chosen: 每次尝试前把选中的端点加入其中，供对冲请求避开
+        """
+        tokens = estimate_messages_tokens(messages) + max_tokens
+        tried: Set[str] = set(exclude)
+        started = time.monotonic()
+        attempt = 0
+        with self._get_breaker(model_id).call():
+            while True:
+                attempt += 1
+                yielded = False
+                endpoint = self._rank_endpoints(model_id, tokens, tried, hedge)[0]
+                if chosen is not None:
+                    chosen.add(endpoint.name)
+                try:
+                    async with self._guard(model_id, endpoint, tokens):
+                        attempt_started = time.monotonic()
+                        with self._track_usage(model_id, endpoint, messages) as usage:
+                            stream = await endpoint.client.chat.completions.create(
+                                model=model_id,
+                                messages=messages,
+                                temperature=temperature,
+                                max_tokens=max_tokens,
+                                stream=True,
+                                **self._stream_options,
+                            )
+                            try:
+                                async for chunk in stream:
+                                    # include_usage 时用量在最后一个 choices 为空的 chunk 中
+                                    usage.set_usage(chunk.usage)
+                                    if not chunk.choices:
+                                        continue
+                                    choice = chunk.choices[0]
+                                    if choice.finish_reason:
+                                        usage.finish_reason = choice.finish_reason
+                                    delta = choice.delta.content
+                                    if delta:
+                                        if not yielded:
+                                            ttft = time.monotonic() - attempt_started
+                                            self._ttft.record(model_id, ttft)
+                                            endpoint.health(model_id).record(True, ttft)
+                                            usage.first_token()
+                                        yielded = True
+                                        usage.add_text(delta)
+                                        yield delta
+                            finally:
+                                # 提前结束（客户端断开/异常）时关闭上游连接，让服务商停止生成
+                                await stream.close()
+                    return
+                except Exception as e:
+                    # 已经输出过内容就无法重放，只在首个 token 之前重试
+                    if yielded or not await self._handle_attempt_failure(
+                        model_id, endpoint, e, tried, tokens, attempt, started
+                    ):
+                        raise
 
-    # 目前前端未用到流式输出，如需可再实现
     async def stream_completion(
         self,
         model_id: str,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
-        max_tokens: int = 2000,
-    ):
-        """占位实现：当前未启用流式输出"""
-        content = await self.get_completion(
-            model_id=model_id,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        yield content
+        max_tokens: int = 8000,
+    ) -> AsyncIterator[str]:
+        """
+        流式获取模型回复（stream=True），逐段产出增量文本
+        开启对冲时，超过该模型首 token 延迟的 p95 仍无输出则向另一端点发出备用请求，
+        先产出首个 token 的一路胜出，另一路立即取消
+        max_tokens 会被压缩到模型输出上限与剩余上下文窗口以内
+        最终失败时直接抛出异常，由调用方决定如何展示
+        """
+        max_tokens = completion_budget(model_id, messages, max_tokens)
+        busy: Set[str] = set()
+        primary = self._request_stream(model_id, messages, temperature, max_tokens, chosen=busy)
+        delay = self._hedge_delay(self._ttft, model_id)
+        if delay is None:
+            async for delta in primary:
+                yield delta
+            return
+
+        # 对每一路预取首个 token，谁先到就继续消费谁
+        streams = {asyncio.ensure_future(primary.__anext__()): primary}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(streams, timeout=delay)
+            if not done and self._try_hedge(model_id):
+                # 避开主请求实际使用的端点，而不是按当前状态重新排序得到的首选
+                backup = self._request_stream(
+                    model_id, messages, temperature, max_tokens, exclude=set(busy), hedge=True
+                )
+                streams[asyncio.ensure_future(backup.__anext__())] = backup
+
+            pending = set(streams)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None or isinstance(exc, StopAsyncIteration):
+                        winner = task
+                        break
+            if winner is None:
+                # 全部失败，以主请求的错误为准
+                next(iter(streams)).result()
+        finally:
+            for task, stream in streams.items():
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+        stream = streams[winner]
+        if stream is not primary:
+            self._record_hedge_win(model_id)
+        if winner.exception() is not None:
+            return
+        try:
+            yield winner.result()
+            async for delta in stream:
+                yield delta
+        finally:
+            await stream.aclose()
+
+    async def stream_dual_completion(
+        self,
+        model_a_id: str,
+        model_b_id: str,
+        messages_a: List[Dict[str, str]],
+        messages_b: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 8000,
+    ) -> AsyncIterator[Tuple[str, str, str]]:
+        """
+        同时流式获取两个模型的回复，并按到达顺序合并为一个事件流
+        每个模型只收到自己一侧的对话历史
+
+        产出 (side, kind, payload)：
+            side: "a" 或 "b"
+            kind: "delta"（增量文本）、"done"（该侧结束）、"error"（该侧失败，payload 为错误信息）
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def _pump(side: str, model_id: str, messages: List[Dict[str, str]]):
+            try:
+                async for delta in self.stream_completion(
+                    model_id, messages, temperature, max_tokens
+                ):
+                    await queue.put((side, "delta", delta))
+                await queue.put((side, "done", ""))
+            except Exception as e:
+                print(f"模型 {model_id} 流式调用失败: {str(e)}")
+                await queue.put((side, "error", str(e)))
+
+        tasks = [
+            asyncio.create_task(_pump("a", model_a_id, messages_a)),
+            asyncio.create_task(_pump("b", model_b_id, messages_b)),
+        ]
+        try:
+            finished = 0
+            while finished < len(tasks):
+                side, kind, payload = await queue.get()
+                if kind != "delta":
+                    finished += 1
+                yield side, kind, payload
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 用 wait 而不是 gather：外层被再次取消时 gather 会把取消转发给子任务，打断其关闭上游连接
+            await asyncio.wait(tasks)
 
     @staticmethod
     def get_available_models() -> List[Dict]:
@@ -119,3 +646,14 @@ class ModelService:
             if model["id"] == model_id:
                 return model
         return None
+
+
+_shared_service: Optional[ModelService] = None
+
+
+def get_model_service() -> ModelService:
+    """获取进程内共享的 ModelService（所有路由共用同一组端点与连接池）"""
+    global _shared_service
+    if _shared_service is None:
+        _shared_service = ModelService()
+    return _shared_service
@@ -0,0 +1,109 @@
+"""按 API Key + 模型的客户端限流（RPM / TPM 令牌桶，先到先得）"""
+import asyncio
+import math
+import time
+from typing import Dict
+
+
+class RateLimitExceeded(Exception):
+    """预计排队时间超过上限，调用方应稍后重试"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"请求过多，请 {math.ceil(retry_after)} 秒后重试")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    每分钟补充 per_minute 个令牌，容量同为 per_minute
+    余额允许为负：负数部分就是已预约但尚未到期的排队请求
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """扣除 amount 个令牌需要等待的秒数"""
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    同时限制 RPM 与 TPM
+    请求按到达顺序预约令牌后再等待，因此排队是公平的（FIFO）；
+    预计等待超过 max_wait 时立即拒绝，不占用额度
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_wait: float):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.rejected = 0
+
+    def estimate_wait(self, tokens: int) -> float:
+        """当前需要排队的秒数（不预约）"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens: int):
+        """预约 1 个请求和 tokens 个 token 的额度，必要时排队等待"""
+        wait = self.estimate_wait(tokens)
+        if wait > self.max_wait:
+            self.rejected += 1
+            raise RateLimitExceeded(wait)
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        if wait <= 0:
+            return
+
+        self.waiting += 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # 排队中被取消，归还预约的额度
+            if self.requests is not None:
+                self.requests.give_back(1)
+            if self.tokens is not None:
+                self.tokens.give_back(tokens)
+            raise
+        finally:
+            self.waiting -= 1
+
+    def settle(self, estimated: int, actual: int):
+        """调用结束后按实际用量归还多预约的 token"""
+        if self.tokens is not None and actual < estimated:
+            self.tokens.give_back(estimated - actual)
+
+    def stats(self) -> Dict:
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket._refill()
+        return {
+            "rpm_available": int(self.requests.tokens) if self.requests else None,
+            "tpm_available": int(self.tokens.tokens) if self.tokens else None,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,247 @@
+"""
+以 votes 为准重建评分表（model_ratings）
+
+评分表是投票的物化结果，崩溃、重复投票或积分规则调整后可能与 votes 不一致。重建时按模型统计胜/负/平场数，
+再按当前的 WIN_POINTS / TIE_POINTS / LOSS_POINTS 算出评分，覆盖写入评分表（分片计数清零）。
+
+快照（rating_snapshots）记录截至某个高水位（投票的 created_at）的各模型胜/负/平场数，与积分规则无关：
+    - 增量重建：最近的快照 + 重放快照之后的投票
+    - 全量重建：重放全部投票
+统计由数据库按 (模型 A, 模型 B, 结果) 分组聚合，一遍扫描，结果集只有模型对的数量级，用服务端游标流式读取。
+
+高水位取数据库当前时间减去 RATING_SNAPSHOT_LAG 秒，更晚的投票可能还在未提交的事务中，不进入快照；
+最后写入评分表时锁住评分行，在同一事务中补上高水位之后已应用的投票，并扣除高水位之前尚未应用评分的投票
+（排队模式下由后台稍后累加），因此重建期间可以照常投票。
+
+    python -m services.rating_rebuild              # 增量重建（没有快照时为全量）
+    python -m services.rating_rebuild --full       # 全量重建
+    python -m services.rating_rebuild --snapshot   # 只生成快照
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import async_session_maker, engine
+from models.schemas import ModelRating, ModelRatingStripe, RatingSnapshot, Vote
+from .rating_service import RatingService
+import config
+
+# 每个模型的 [胜, 负, 平] 场数
+Counts = Dict[str, List[int]]
+
+_WINS, _LOSSES, _TIES = 0, 1, 2
+
+# 投票结果对应的 (模型 A, 模型 B) 计数下标
+_OUTCOMES = {"model_a": (_WINS, _LOSSES), "model_b": (_LOSSES, _WINS), "tie": (_TIES, _TIES)}
+
+
+def _add(counts: Counts, other: Counts, sign: int = 1):
+    for model_id, values in other.items():
+        target = counts.setdefault(model_id, [0, 0, 0])
+        for i, value in enumerate(values):
+            target[i] += sign * value
+
+
+async def vote_groups(db: AsyncSession, *conditions) -> AsyncIterator[Tuple[str, str, str, int]]:
+    """满足条件的投票按 (模型 A, 模型 B, 结果) 分组的票数，由数据库聚合后流式读取"""
+    result = await db.stream(
+        select(Vote.model_a_id, Vote.model_b_id, Vote.winner, func.count())
+        .where(*conditions)
+        .group_by(Vote.model_a_id, Vote.model_b_id, Vote.winner)
+        .execution_options(yield_per=1000)
+    )
+    async for model_a_id, model_b_id, winner, count in result:
+        yield model_a_id, model_b_id, winner, count
+
+
+async def _count_votes(db: AsyncSession, *conditions) -> Tuple[Counts, int]:
+    """按模型统计满足条件的投票的胜/负/平场数，返回 (统计, 投票数)"""
+    counts: Counts = {}
+    total = 0
+    async for model_a_id, model_b_id, winner, count in vote_groups(db, *conditions):
+        outcome_a, outcome_b = _OUTCOMES.get(winner, _OUTCOMES["tie"])
+        counts.setdefault(model_a_id, [0, 0, 0])[outcome_a] += count
+        counts.setdefault(model_b_id, [0, 0, 0])[outcome_b] += count
+        total += count
+    return counts, total
+
+
+async def _latest_snapshot(db: AsyncSession) -> Optional[RatingSnapshot]:
+    result = await db.execute(select(RatingSnapshot).order_by(RatingSnapshot.id.desc()).limit(1))
+    return result.scalar_one_or_none()
+
+
+async def high_water_mark(db: AsyncSession) -> datetime:
+    """数据库当前时间减去 RATING_SNAPSHOT_LAG 秒（与 votes.created_at 同一时钟）"""
+    result = await db.execute(select(func.now()))
+    return result.scalar_one() - timedelta(seconds=config.RATING_SNAPSHOT_LAG)
+
+
+async def _counts_until(db: AsyncSession, full: bool) -> Tuple[Counts, int, datetime, Optional[int]]:
+    """截至高水位的全部投票统计：增量时从最近的快照继续，返回 (统计, 重放的投票数, 高水位, 基于的快照 ID)"""
+    until = await high_water_mark(db)
+    snapshot = None if full else await _latest_snapshot(db)
+    if snapshot is not None and snapshot.votes_until > until:
+        # 修改 RATING_SNAPSHOT_LAG 后快照可能比这次的高水位更新，改为全量
+        snapshot = None
+
+    counts: Counts = {}
+    conditions = [Vote.created_at <= until]
+    if snapshot is not None:
+        _add(counts, snapshot.state)
+        conditions.append(Vote.created_at > snapshot.votes_until)
+    replayed, replayed_votes = await _count_votes(db, *conditions)
+    _add(counts, replayed)
+    return counts, replayed_votes, until, snapshot.id if snapshot else None
+
+
+async def _save_snapshot(db: AsyncSession, counts: Counts, until: datetime) -> RatingSnapshot:
+    snapshot = RatingSnapshot(
+        votes_until=until,
+        vote_count=sum(sum(values) for values in counts.values()) // 2,
+        state=counts,
+    )
+    db.add(snapshot)
+    await db.flush()
+    # 只保留最近的 RATING_SNAPSHOT_KEEP 个快照
+    stale = await db.execute(
+        select(RatingSnapshot.id)
+        .order_by(RatingSnapshot.id.desc())
+        .offset(config.RATING_SNAPSHOT_KEEP)
+    )
+    stale_ids = stale.scalars().all()
+    if stale_ids:
+        await db.execute(delete(RatingSnapshot).where(RatingSnapshot.id.in_(stale_ids)))
+    return snapshot
+
+
+def _rating(model_id: str, values: List[int]) -> float:
+    model_config = next((m for m in config.AVAILABLE_MODELS if m["id"] == model_id), {})
+    initial = model_config.get("initial_rating", config.INITIAL_RATING)
+    return (
+        initial
+        + values[_WINS] * config.WIN_POINTS
+        + values[_LOSSES] * config.LOSS_POINTS
+        + values[_TIES] * config.TIE_POINTS
+    )
+
+
+async def _write_ratings(db: AsyncSession, counts: Counts, until: datetime):
+    """
+    锁住评分行后补上高水位之后已应用的投票、扣除高水位之前尚未应用的投票，覆盖写入评分表并清零分片
+    并发投票的评分更新会等待这里提交，之后在重建结果上继续累加
+    """
+    await db.execute(select(ModelRating.id).with_for_update())
+    await db.execute(select(ModelRatingStripe.model_id).with_for_update())
+    # SQLite 在第一条写语句时才加写锁，先清零分片，之后读到的投票在提交前不会再变
+    await db.execute(
+        update(ModelRatingStripe)
+        .values(rating=0, total_battles=0, wins=0, losses=0, ties=0)
+        .execution_options(synchronize_session=False)
+    )
+
+    applied_after, _ = await _count_votes(db, Vote.created_at > until, Vote.rating_applied == 1)
+    pending_before, _ = await _count_votes(db, Vote.created_at <= until, Vote.rating_applied == 0)
+    counts = {model_id: list(values) for model_id, values in counts.items()}
+    _add(counts, applied_after)
+    _add(counts, pending_before, sign=-1)
+
+    existing = await db.execute(select(ModelRating.model_id))
+    model_ids = set(existing.scalars())
+    for model_id in set(counts) - model_ids:
+        model_config = next((m for m in config.AVAILABLE_MODELS if m["id"] == model_id), {})
+        db.add(ModelRating(model_id=model_id, model_name=model_config.get("name", model_id)))
+        model_ids.add(model_id)
+    await db.flush()
+
+    values = {model_id: counts.get(model_id, [0, 0, 0]) for model_id in model_ids}
+    columns = {
+        "rating": lambda v, model_id: _rating(model_id, v),
+        "total_battles": lambda v, model_id: sum(v),
+        "wins": lambda v, model_id: v[_WINS],
+        "losses": lambda v, model_id: v[_LOSSES],
+        "ties": lambda v, model_id: v[_TIES],
+    }
+    await db.execute(
+        update(ModelRating)
+        .where(ModelRating.model_id.in_(list(values)))
+        .values(**{
+            column: case(
+                *((ModelRating.model_id == model_id, compute(v, model_id)) for model_id, v in values.items())
+            )
+            for column, compute in columns.items()
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def take_snapshot() -> Dict:
+    """生成一个快照（不修改评分表）"""
+    started = time.perf_counter()
+    async with async_session_maker() as db:
+        counts, replayed, until, base_id = await _counts_until(db, full=False)
+        snapshot = await _save_snapshot(db, counts, until)
+        await db.commit()
+        return {
+            "snapshot_id": snapshot.id,
+            "based_on": base_id,
+            "votes_until": until.isoformat(),
+            "replayed_votes": replayed,
+            "total_votes": snapshot.vote_count,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+
+async def rebuild_ratings(full: bool = False) -> Dict:
+    """按 votes 重建评分表，同时保存新的快照；full=False 时从最近的快照增量重放"""
+    started = time.perf_counter()
+    async with async_session_maker() as db:
+        counts, replayed, until, base_id = await _counts_until(db, full)
+        snapshot = await _save_snapshot(db, counts, until)
+        await db.commit()
+
+        await _write_ratings(db, counts, until)
+        await db.commit()
+        RatingService.invalidate_leaderboard()
+        return {
+            "mode": "incremental" if base_id else "full",
+            "snapshot_id": snapshot.id,
+            "based_on": base_id,
+            "votes_until": until.isoformat(),
+            "replayed_votes": replayed,
+            "total_votes": snapshot.vote_count,
+            "models": len(counts),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+
+async def run_periodic_snapshots(interval: float):
+    """每 interval 秒生成一个快照（由应用生命周期启动和取消）"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await take_snapshot()
+        except Exception as e:
+            print(f"评分快照生成失败: {str(e)}")
+
+
+async def _main(args):
+    if args.snapshot:
+        result = await take_snapshot()
+    else:
+        result = await rebuild_ratings(full=args.full)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按 votes 重建评分表")
+    parser.add_argument("--full", action="store_true", help="忽略快照，重放全部投票")
+    parser.add_argument("--snapshot", action="store_true", help="只生成快照，不修改评分表")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,10 +1,69 @@
-"""评分系统服务（积分制：胜+2，平+1，负+0）"""
-from typing import Tuple
+"""
+评分系统服务（积分制：胜+2，平+1，负+0）
+
+config.RATING_STRIPES > 1 时，投票不直接更新 model_ratings 的那一行，而是累加到该模型随机一个分片
+（model_rating_stripes），热门模型的并发投票分散到多行锁上；读取时 model_ratings 与各分片相加。
+关闭分片后启动时，残留的分片计数会合并回 model_ratings（见 init_stripes）。
+"""
+import random
+import time
+from typing import Dict, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from models.schemas import ModelRating, Vote
+from sqlalchemy import and_, case, delete, func, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from models.database import async_session_maker
+from models.schemas import ModelRating, ModelRatingStripe
 import config
 
+# 评分表中按投票累加的列
+_COUNTER_COLUMNS = ("rating", "total_battles", "wins", "losses", "ties")
+
+# 投票结果对应的 (模型 A, 模型 B) 计数列
+_OUTCOMES = {"model_a": ("wins", "losses"), "model_b": ("losses", "wins")}
+
+# 排行榜缓存：{limit: (过期时间, 排行榜)}
+_leaderboard_cache: Dict[int, Tuple[float, List[Dict]]] = {}
+
+
+def _increments(schema, deltas: Dict[str, Dict[str, float]]) -> Dict:
+    """各计数列的相对更新表达式：column = column + CASE model_id WHEN ... END"""
+    values = {}
+    for column in _COUNTER_COLUMNS:
+        whens = [
+            (schema.model_id == model_id, delta[column])
+            for model_id, delta in deltas.items()
+            if delta.get(column)
+        ]
+        if whens:
+            values[column] = func.coalesce(getattr(schema, column), 0) + case(*whens, else_=0)
+    return values
+
+
+def _ratings_query():
+    """model_ratings 加上各分片之和后的评分与计数（未开启分片时只查 model_ratings）"""
+    if config.RATING_STRIPES <= 1:
+        return select(
+            ModelRating.model_id,
+            ModelRating.model_name,
+            *(getattr(ModelRating, column) for column in _COUNTER_COLUMNS)
+        )
+    stripes = (
+        select(
+            ModelRatingStripe.model_id,
+            *(func.sum(getattr(ModelRatingStripe, column)).label(column) for column in _COUNTER_COLUMNS)
+        )
+        .group_by(ModelRatingStripe.model_id)
+        .subquery()
+    )
+    return select(
+        ModelRating.model_id,
+        ModelRating.model_name,
+        *(
+            (func.coalesce(getattr(ModelRating, column), 0) + func.coalesce(stripes.c[column], 0)).label(column)
+            for column in _COUNTER_COLUMNS
+        )
+    ).outerjoin(stripes, stripes.c.model_id == ModelRating.model_id)
+
 
 class RatingService:
     """评分系统服务（积分制）"""
@@ -28,6 +87,126 @@ class RatingService:
         # tie
         return rating_a + config.TIE_POINTS, rating_b + config.TIE_POINTS
     
+    @staticmethod
+    def vote_deltas(model_a_id: str, model_b_id: str, winner: str) -> Dict[str, Dict[str, float]]:
+        """一次投票对两个模型的评分与计数增量：{model_id: {"rating": ..., "total_battles": 1, "wins" / "losses" / "ties": 1}}"""
+        points_a, points_b = RatingService.calculate_new_ratings(0, 0, winner)
+        outcome_a, outcome_b = _OUTCOMES.get(winner, ("ties", "ties"))
+        return {
+            model_a_id: {"rating": points_a, "total_battles": 1, outcome_a: 1},
+            model_b_id: {"rating": points_b, "total_battles": 1, outcome_b: 1},
+        }
+
+    @staticmethod
+    async def apply_deltas(db: AsyncSession, deltas: Dict[str, Dict[str, float]]):
+        """
+        以一条 UPDATE 把各模型的增量加到评分表上（wins = wins + 1 式的相对更新，并发投票不会互相覆盖）
+        开启分片时累加到各模型随机一个分片；不提交，由调用方提交
+        """
+        if config.RATING_STRIPES > 1:
+            await RatingService._apply_to_stripes(db, deltas)
+        else:
+            await RatingService._apply_to_ratings(db, deltas)
+
+    @staticmethod
+    async def _apply_to_stripes(db: AsyncSession, deltas: Dict[str, Dict[str, float]]):
+        stripes = {model_id: random.randrange(config.RATING_STRIPES) for model_id in deltas}
+        result = await db.execute(
+            update(ModelRatingStripe)
+            .where(or_(*(
+                and_(ModelRatingStripe.model_id == model_id, ModelRatingStripe.stripe == stripe)
+                for model_id, stripe in stripes.items()
+            )))
+            .values(**_increments(ModelRatingStripe, deltas))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == len(deltas):
+            return
+
+        # 分片行由 ensure_stripes 在启动时建好；不在配置中的模型没有分片，直接累加到 model_ratings
+        existing = await db.execute(
+            select(ModelRatingStripe.model_id).where(
+                tuple_(ModelRatingStripe.model_id, ModelRatingStripe.stripe).in_(list(stripes.items()))
+            )
+        )
+        striped = set(existing.scalars())
+        await RatingService._apply_to_ratings(
+            db, {model_id: delta for model_id, delta in deltas.items() if model_id not in striped}
+        )
+
+    @staticmethod
+    async def _apply_to_ratings(db: AsyncSession, deltas: Dict[str, Dict[str, float]]):
+        """累加到 model_ratings；评分表中还没有的模型补录一条初始记录"""
+        result = await db.execute(
+            update(ModelRating)
+            .where(ModelRating.model_id.in_(list(deltas)))
+            .values(**_increments(ModelRating, deltas))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == len(deltas):
+            return
+
+        # 兼容新增模型或未初始化的模型
+        existing = await db.execute(
+            select(ModelRating.model_id).where(ModelRating.model_id.in_(list(deltas)))
+        )
+        missing = set(deltas) - set(existing.scalars())
+        for model_id in missing:
+            delta = deltas[model_id]
+            db.add(ModelRating(
+                model_id=model_id,
+                model_name=model_id,
+                rating=config.INITIAL_RATING + delta.get("rating", 0),
+                total_battles=delta.get("total_battles", 0),
+                wins=delta.get("wins", 0),
+                losses=delta.get("losses", 0),
+                ties=delta.get("ties", 0)
+            ))
+        await db.flush()
+
+    @staticmethod
+    async def init_stripes(model_ids: List[str]):
+        """
+        启动时调用：开启分片时为各模型补建 config.RATING_STRIPES 个分片行（多实例同时启动时冲突的一方跳过）；
+        未开启分片时把残留的分片计数合并回 model_ratings 并删除分片行
+        """
+        if config.RATING_STRIPES <= 1:
+            await RatingService._fold_stripes()
+            return
+        async with async_session_maker() as db:
+            result = await db.execute(select(ModelRatingStripe.model_id, ModelRatingStripe.stripe))
+            existing = set(result.all())
+            for model_id in model_ids:
+                for stripe in range(config.RATING_STRIPES):
+                    if (model_id, stripe) not in existing:
+                        db.add(ModelRatingStripe(model_id=model_id, stripe=stripe))
+            try:
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+
+    @staticmethod
+    async def _fold_stripes():
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(
+                    ModelRatingStripe.model_id,
+                    *(func.sum(getattr(ModelRatingStripe, column)) for column in _COUNTER_COLUMNS)
+                )
+                .group_by(ModelRatingStripe.model_id)
+                .with_for_update()
+            )
+            deltas = {
+                model_id: dict(zip(_COUNTER_COLUMNS, sums))
+                for model_id, *sums in result.all()
+            }
+            if not deltas:
+                return
+            await RatingService._apply_to_ratings(db, deltas)
+            await db.execute(delete(ModelRatingStripe))
+            await db.commit()
+            print(f"已将 {len(deltas)} 个模型的评分分片合并回 model_ratings")
+
     @staticmethod
     async def update_ratings(
         db: AsyncSession,
@@ -37,7 +216,7 @@ class RatingService:
         source: str = "battle",  # 目前仅 battle 会调用；side-by-side 已不计入评分
     ) -> Tuple[float, float]:
         """
-        更新两个模型的评分
+        在调用方的事务中更新两个模型的评分（不提交）
         
         Args:
             db: 数据库会话
@@ -48,91 +227,21 @@ class RatingService:
         Returns:
             (模型 A 的新评分, 模型 B 的新评分)
         """
-        # 获取当前评分
-        result_a = await db.execute(
-            select(ModelRating).where(ModelRating.model_id == model_a_id)
-        )
-        result_b = await db.execute(
-            select(ModelRating).where(ModelRating.model_id == model_b_id)
-        )
-        
-        model_a_rating = result_a.scalar_one_or_none()
-        model_b_rating = result_b.scalar_one_or_none()
-
-        # 如果评分表中不存在，补录一条初始记录（兼容新增模型或未初始化的模型）
-        if model_a_rating is None:
-            model_a_rating = ModelRating(
-                model_id=model_a_id,
-                model_name=model_a_id,
-                rating=config.INITIAL_RATING,
-                total_battles=0,
-                wins=0,
-                losses=0,
-                ties=0
-            )
-            db.add(model_a_rating)
-
-        if model_b_rating is None:
-            model_b_rating = ModelRating(
-                model_id=model_b_id,
-                model_name=model_b_id,
-                rating=config.INITIAL_RATING,
-                total_battles=0,
-                wins=0,
-                losses=0,
-                ties=0
-            )
-            db.add(model_b_rating)
-        
-        # 如果刚创建了新记录，需要先 flush 确保它们有 ID
-        await db.flush()
-        
-        # 计算新评分（积分制）
-        new_rating_a, new_rating_b = RatingService.calculate_new_ratings(
-            model_a_rating.rating,
-            model_b_rating.rating,
-            winner,
-        )
-        
-        # 更新模型 A 的评分和统计
-        update_data_a = {
-            "rating": new_rating_a,
-            "total_battles": (model_a_rating.total_battles or 0) + 1
-        }
-        if winner == "model_a":
-            update_data_a["wins"] = (model_a_rating.wins or 0) + 1
-        elif winner == "model_b":
-            update_data_a["losses"] = (model_a_rating.losses or 0) + 1
-        else:
-            update_data_a["ties"] = (model_a_rating.ties or 0) + 1
-        
-        await db.execute(
-            update(ModelRating)
-            .where(ModelRating.model_id == model_a_id)
-            .values(**update_data_a)
+        await RatingService.apply_deltas(
+            db, RatingService.vote_deltas(model_a_id, model_b_id, winner)
         )
-        
-        # 更新模型 B 的评分和统计
-        update_data_b = {
-            "rating": new_rating_b,
-            "total_battles": (model_b_rating.total_battles or 0) + 1
-        }
-        if winner == "model_b":
-            update_data_b["wins"] = (model_b_rating.wins or 0) + 1
-        elif winner == "model_a":
-            update_data_b["losses"] = (model_b_rating.losses or 0) + 1
-        else:
-            update_data_b["ties"] = (model_b_rating.ties or 0) + 1
-        
-        await db.execute(
-            update(ModelRating)
-            .where(ModelRating.model_id == model_b_id)
-            .values(**update_data_b)
+        return await RatingService.current_ratings(db, model_a_id, model_b_id)
+
+    @staticmethod
+    async def current_ratings(db: AsyncSession, model_a_id: str, model_b_id: str) -> Tuple[float, float]:
+        """两个模型的当前评分（评分表中没有的模型为初始分数）"""
+        query = _ratings_query().where(ModelRating.model_id.in_([model_a_id, model_b_id]))
+        result = await db.execute(query)
+        ratings = {row.model_id: float(row.rating) for row in result}
+        return (
+            ratings.get(model_a_id, config.INITIAL_RATING),
+            ratings.get(model_b_id, config.INITIAL_RATING),
         )
-        
-        await db.commit()
-        
-        return new_rating_a, new_rating_b
     
     @staticmethod
     async def get_leaderboard(db: AsyncSession, limit: int = 50):
@@ -146,28 +255,48 @@ class RatingService:
         Returns:
             排行榜列表
         """
-        result = await db.execute(
-            select(ModelRating)
-            .order_by(ModelRating.rating.desc())
-            .limit(limit)
-        )
+        query = _ratings_query()
+        result = await db.execute(query.order_by(query.selected_columns.rating.desc()).limit(limit))
         
-        models = result.scalars().all()
+        models = result.all()
         
         leaderboard = []
         for rank, model in enumerate(models, start=1):
-            win_rate = (model.wins / model.total_battles * 100) if model.total_battles > 0 else 0
+            # 分片求和在 MySQL 上返回 Decimal
+            total_battles, wins = int(model.total_battles), int(model.wins)
+            win_rate = (wins / total_battles * 100) if total_battles > 0 else 0
             leaderboard.append({
                 "rank": rank,
                 "model_id": model.model_id,
                 "model_name": model.model_name,
                 "rating": int(model.rating),
-                "total_battles": model.total_battles,
-                "wins": model.wins,
-                "losses": model.losses,
-                "ties": model.ties,
+                "total_battles": total_battles,
+                "wins": wins,
+                "losses": int(model.losses),
+                "ties": int(model.ties),
                 "win_rate": round(win_rate, 1)
             })
         
         return leaderboard
 
+    @staticmethod
+    def invalidate_leaderboard():
+        _leaderboard_cache.clear()
+
+    @staticmethod
+    async def get_leaderboard_cached(db: AsyncSession, limit: int = 50):
+        """
+        带缓存的排行榜（缓存 config.LEADERBOARD_CACHE_TTL 秒，0 表示不缓存）
+        本进程应用投票或重建评分后缓存立即失效；缓存是进程内的，多实例部署时其他实例最多滞后 TTL 秒
+        """
+        now = time.monotonic()
+        cached = _leaderboard_cache.get(limit)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        leaderboard = await RatingService.get_leaderboard(db, limit=limit)
+        if config.LEADERBOARD_CACHE_TTL > 0:
+            if len(_leaderboard_cache) >= 32:
+                _leaderboard_cache.clear()
+            _leaderboard_cache[limit] = (now + config.LEADERBOARD_CACHE_TTL, leaderboard)
+        return leaderboard
+
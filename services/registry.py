@@ -0,0 +1,181 @@
+"""上游服务商注册表：每个模型可由多个端点（网关 + Key）提供，按延迟与错误率路由"""
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from openai import APIStatusError, AsyncOpenAI, DefaultAsyncHttpxClient
+
+from .circuit_breaker import is_upstream_failure
+import config
+
+
+def create_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """创建异步客户端，每个端点独享一个可调参的长连接池"""
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            config.UPSTREAM_READ_TIMEOUT,
+            connect=config.UPSTREAM_CONNECT_TIMEOUT,
+        ),
+        http2=config.UPSTREAM_HTTP2,
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        max_retries=0,  # 重试由 ModelService 按服务商策略统一处理
+    )
+
+
+def default_provider_for_model(model_id: str) -> str:
+    """未配置 MODEL_ENDPOINTS 时，根据模型 ID 判断走哪个服务商"""
+    if model_id.startswith("deepseek-") or model_id.startswith("deepseek/"):
+        return "deepseek"
+    return "openai"
+
+
+def is_failover_error(exc: BaseException) -> bool:
+    """换一个端点可能成功的错误：上游故障，以及与 Key/网关相关的 401/403/404"""
+    if is_upstream_failure(exc):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code in (401, 403, 404)
+
+
+class EndpointHealth:
+    """某端点上某个模型的 EWMA 延迟（秒）与错误率；错误率随时间衰减，故障恢复后会被重新探测"""
+
+    def __init__(self, alpha: float, error_half_life: float):
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self._error_rate = 0.0
+        self._updated = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        elapsed = time.monotonic() - self._updated
+        return self._error_rate * 0.5 ** (elapsed / self.error_half_life)
+
+    def record(self, succeeded: bool, latency: Optional[float] = None):
+        self.requests += 1
+        error_rate = self.error_rate
+        self._error_rate = error_rate + self.alpha * ((0.0 if succeeded else 1.0) - error_rate)
+        self._updated = time.monotonic()
+        if succeeded and latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+
+    def score(self, error_penalty: float) -> float:
+        """越小越好"""
+        if self.latency is None:
+            # 尚无延迟样本：没失败过的得 0 分优先探测，失败过的按错误率排到后面
+            return error_penalty * self.error_rate
+        return self.latency * (1 + error_penalty * self.error_rate)
+
+
+class Endpoint:
+    """一个上游端点：base_url + API Key + 连接池"""
+
+    def __init__(
+        self,
+        name: str,
+        provider: str,
+        base_url: str,
+        api_key: str,
+        hedge_only: bool = False,
+    ):
+        self.name = name
+        self.provider = provider
+        self.base_url = base_url
+        self.api_key = api_key
+        self.hedge_only = hedge_only
+        self.client = create_client(api_key, base_url)
+        self._health: Dict[str, EndpointHealth] = {}
+
+    def health(self, model_id: str) -> EndpointHealth:
+        health = self._health.get(model_id)
+        if health is None:
+            health = EndpointHealth(config.ROUTING_EWMA_ALPHA, config.ROUTING_ERROR_HALF_LIFE)
+            self._health[model_id] = health
+        return health
+
+    def stats(self) -> Dict:
+        return {
+            "provider": self.provider,
+            "hedge_only": self.hedge_only,
+            "models": {
+                model_id: {
+                    "latency_ewma": round(h.latency, 3) if h.latency is not None else None,
+                    "error_rate": round(h.error_rate, 3),
+                    "requests": h.requests,
+                }
+                for model_id, h in self._health.items()
+            },
+        }
+
+
+def validate_endpoints(endpoints: Dict[str, Dict], model_endpoints: Dict[str, List[str]]):
+    """
+    启动时检查端点配置，配置错误直接报错，而不是等到故障转移时才出错：
+    provider 须为已知的服务商（config.RETRY_POLICIES 中的键，决定重试与限流策略），base_url 必填，
+    MODEL_ENDPOINTS 中引用的端点须存在
+    """
+    for name, spec in endpoints.items():
+        provider = spec.get("provider")
+        if provider not in config.RETRY_POLICIES:
+            raise ValueError(
+                f"上游端点 {name} 的 provider 未知: {provider!r}"
+                f"（可选: {', '.join(config.RETRY_POLICIES)}）"
+            )
+        if not spec.get("base_url"):
+            raise ValueError(f"上游端点 {name} 缺少 base_url")
+    for model_id, names in model_endpoints.items():
+        unknown = [name for name in names if name not in endpoints]
+        if unknown:
+            raise ValueError(f"模型 {model_id} 引用了不存在的上游端点: {', '.join(unknown)}")
+
+
+class ProviderRegistry:
+    """根据配置构建全部端点，并给出模型可用的端点列表"""
+
+    def __init__(self, endpoints: Dict[str, Dict], model_endpoints: Dict[str, List[str]]):
+        validate_endpoints(endpoints, model_endpoints)
+        self.endpoints: Dict[str, Endpoint] = {
+            name: Endpoint(
+                name=name,
+                provider=spec["provider"],
+                base_url=spec["base_url"],
+                api_key=spec["api_key"],
+                hedge_only=spec.get("hedge_only", False),
+            )
+            for name, spec in endpoints.items()
+        }
+        self.model_endpoints = model_endpoints
+
+    def candidates(self, model_id: str, include_hedge_only: bool = False) -> List[Endpoint]:
+        """可以为该模型提供服务的端点"""
+        names = self.model_endpoints.get(model_id)
+        if names is not None:
+            endpoints = [self.endpoints[name] for name in names]
+        else:
+            provider = default_provider_for_model(model_id)
+            endpoints = [e for e in self.endpoints.values() if e.provider == provider]
+        if not include_hedge_only:
+            endpoints = [e for e in endpoints if not e.hedge_only]
+        if not endpoints:
+            raise ValueError(f"模型 {model_id} 没有可用的上游端点")
+        return endpoints
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: endpoint.stats() for name, endpoint in self.endpoints.items()}
+
+    async def aclose(self):
+        for endpoint in self.endpoints.values():
+            await endpoint.client.close()
@@ -0,0 +1,77 @@
+"""上游调用重试策略（指数退避 + 全抖动 + Retry-After）"""
+import email.utils
+import random
+import time
+from typing import Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+# 请求未被处理或可安全重放的状态码
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    只重试幂等的失败：限流、网关错误和连接失败
+    读超时意味着上游可能已在生成（并计费），不重试
+    """
+    if isinstance(exc, APITimeoutError):
+        return False
+    if isinstance(exc, (APIConnectionError, httpx.ConnectError)):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def parse_retry_after(exc: BaseException) -> Optional[float]:
+    """从 retry-after-ms / retry-after 响应头中解析等待秒数"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    # HTTP-date 格式
+    parsed = email.utils.parsedate_to_datetime(retry_after)
+    if parsed is None:
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """单个服务商的重试策略"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, deadline: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def retry_delay(self, exc: BaseException, attempt: int, elapsed: float) -> Optional[float]:
+        """
+        第 attempt 次尝试失败后应等待多久再重试；返回 None 表示放弃
+        优先使用上游给出的 Retry-After，否则使用全抖动指数退避
+        """
+        if attempt >= self.max_attempts or not is_retryable(exc):
+            return None
+        delay = parse_retry_after(exc)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if elapsed + delay > self.deadline:
+            return None
+        return delay
@@ -0,0 +1,42 @@
+"""
+本地离线 token 估算
+
+不依赖具体模型的分词器，也不联网；按 BPE 分词器的常见切分规律近似：
+- 中日韩字符：每字 1 个
+- 英文单词：6 个字母以内 1 个，更长的按 4 个字母 1 个
+- 数字：每 3 位 1 个
+- 标点与其他符号：每个 1 个
+- 每条消息另加 4 个（角色与分隔符），整段提示词另加 3 个（回复引导）
+结果用于限流预约与上下文窗口预算，宁可略微高估
+"""
+import math
+import re
+from typing import Dict, List
+
+_PIECE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\U00020000-\U0002ffff]|[A-Za-z]+|\d+|\S")
+
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """估算一段文本的 token 数"""
+    total = 0
+    for piece in _PIECE.findall(text or ""):
+        if piece.isascii() and piece.isalpha():
+            total += 1 if len(piece) <= 6 else math.ceil(len(piece) / 4)
+        elif piece.isdigit():
+            total += math.ceil(len(piece) / 3)
+        else:
+            total += 1
+    return total
+
+
+def estimate_message_tokens(message: Dict[str, str]) -> int:
+    """估算单条消息的 token 数（含消息开销）"""
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """估算整段 messages 作为提示词的 token 数"""
+    return sum(estimate_message_tokens(message) for message in messages) + REPLY_PRIMING
@@ -0,0 +1,202 @@
+"""上游用量账本：每次上游调用的 token、延迟与结果，异步批量写库，并提供按模型的汇总"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.database import async_session_maker
+from models.schemas import UsageRecord, Vote
+from .batch_writer import BatchWriter
+from .tokens import estimate_tokens
+import config
+
+
+class UsageCall:
+    """一次上游调用的计量，调用过程中由 ModelService 填写"""
+
+    def __init__(self, model_id: str, provider: str, endpoint: str, prompt_tokens: int):
+        self.created_at = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.model_id = model_id
+        self.provider = provider
+        self.endpoint = endpoint
+        self.prompt_tokens = prompt_tokens  # 先用本地估算，上游返回用量后覆盖
+        self.completion_tokens: Optional[int] = None
+        self.ttft: Optional[float] = None
+        self.finish_reason: Optional[str] = None
+        self.error: Optional[str] = None
+        self._parts: List[str] = []
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.started
+
+    def add_text(self, text: str):
+        self._parts.append(text)
+
+    def set_usage(self, usage):
+        """记录上游返回的 usage（OpenAI 格式）"""
+        if usage is None:
+            return
+        self.prompt_tokens = usage.prompt_tokens
+        self.completion_tokens = usage.completion_tokens
+
+    def to_row(self) -> Dict:
+        latency = time.monotonic() - self.started
+        completion_tokens = self.completion_tokens
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens("".join(self._parts))
+        generation_time = latency - (self.ttft or 0.0)
+        tokens_per_second = None
+        if self.error is None and completion_tokens and generation_time > 0:
+            tokens_per_second = completion_tokens / generation_time
+        return {
+            "created_at": self.created_at,
+            "model_id": self.model_id,
+            "provider": self.provider,
+            "endpoint": self.endpoint,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "ttft": self.ttft,
+            "latency": latency,
+            "tokens_per_second": tokens_per_second,
+            "finish_reason": self.finish_reason,
+            "error": self.error,
+        }
+
+
+class UsageLedger(BatchWriter):
+    """
+    用量账本的批量写入器
+    请求路径只做一次 put_nowait；后台任务攒满 batch_size 条或等待 flush_interval 秒后一次性写库
+    """
+
+    name = "用量账本写入"
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int, **kwargs):
+        super().__init__(batch_size, flush_interval, max_pending, **kwargs)
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, call: UsageCall):
+        """记录一次调用（不等待写库）；队列满时丢弃"""
+        if not self._put(call.to_row()):
+            self.dropped += 1
+
+    async def write_batch(self, batch: List[Dict]):
+        async with async_session_maker() as session:
+            await session.execute(insert(UsageRecord), batch)
+            await session.commit()
+        self.written += len(batch)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+
+_shared_ledger: Optional[UsageLedger] = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """获取进程内共享的用量账本"""
+    global _shared_ledger
+    if _shared_ledger is None:
+        _shared_ledger = UsageLedger(
+            config.USAGE_BATCH_SIZE, config.USAGE_FLUSH_INTERVAL, config.USAGE_MAX_PENDING
+        )
+    return _shared_ledger
+
+
+class UsageService:
+    """用量汇总"""
+
+    @staticmethod
+    def cost(model_id: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        """按 config.MODEL_PRICING 计算费用（美元），未配置价格时返回 None"""
+        price = config.MODEL_PRICING.get(model_id)
+        if price is None:
+            return None
+        # MySQL 上 SUM 返回 Decimal，不能直接与 float 相乘
+        return (int(prompt_tokens) * price["input"] + int(completion_tokens) * price["output"]) / 1_000_000
+
+    @staticmethod
+    async def rollup(db: AsyncSession, hours: float = 24) -> Dict:
+        """
+        最近 hours 小时内按模型汇总：调用数、失败数、token 数、平均首 token 延迟/总耗时、
+        平均生成速度（tokens/s）、费用，以及每票成本（该模型的上游费用 / 该模型参与的投票数）
+        """
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+
+        result = await db.execute(
+            select(
+                UsageRecord.model_id,
+                func.count(),
+                func.sum(case((UsageRecord.error.is_not(None), 1), else_=0)),
+                func.coalesce(func.sum(UsageRecord.prompt_tokens), 0),
+                func.coalesce(func.sum(UsageRecord.completion_tokens), 0),
+                func.avg(UsageRecord.ttft),
+                func.avg(UsageRecord.latency),
+                func.avg(UsageRecord.tokens_per_second),
+            )
+            .where(UsageRecord.created_at >= since)
+            .group_by(UsageRecord.model_id)
+        )
+        usage_rows = result.all()
+
+        votes: Dict[str, int] = {}
+        for column in (Vote.model_a_id, Vote.model_b_id):
+            result = await db.execute(
+                select(column, func.count()).where(Vote.created_at >= since).group_by(column)
+            )
+            for model_id, count in result.all():
+                votes[model_id] = votes.get(model_id, 0) + int(count)
+        total_votes = int((await db.execute(
+            select(func.count()).select_from(Vote).where(Vote.created_at >= since)
+        )).scalar_one())
+
+        models = []
+        total_cost = 0.0
+        for (model_id, calls, errors, prompt_tokens, completion_tokens,
+             avg_ttft, avg_latency, tokens_per_second) in usage_rows:
+            # MySQL 上 SUM / AVG 返回 Decimal
+            errors, prompt_tokens, completion_tokens = int(errors or 0), int(prompt_tokens), int(completion_tokens)
+            avg_ttft, avg_latency, tokens_per_second = (
+                float(value) if value is not None else None
+                for value in (avg_ttft, avg_latency, tokens_per_second)
+            )
+            cost = UsageService.cost(model_id, prompt_tokens, completion_tokens)
+            total_cost += cost or 0.0
+            model_votes = votes.get(model_id, 0)
+            models.append({
+                "model_id": model_id,
+                "calls": calls,
+                "errors": errors,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "avg_ttft": round(avg_ttft, 3) if avg_ttft is not None else None,
+                "avg_latency": round(avg_latency, 3) if avg_latency is not None else None,
+                "tokens_per_second": (
+                    round(tokens_per_second, 1) if tokens_per_second is not None else None
+                ),
+                "cost": round(cost, 4) if cost is not None else None,
+                "votes": model_votes,
+                "cost_per_vote": (
+                    round(cost / model_votes, 4) if cost is not None and model_votes else None
+                ),
+            })
+        models.sort(key=lambda item: item["cost"] or 0.0, reverse=True)
+
+        return {
+            "since": since.isoformat(),
+            "models": models,
+            "total_cost": round(total_cost, 4),
+            "total_votes": total_votes,
+            "cost_per_vote": round(total_cost / total_votes, 4) if total_votes else None,
+        }
@@ -0,0 +1,130 @@
+"""
+投票评分的批量应用（可选的排队模式，config.VOTE_QUEUE_ENABLED）
+
+排队模式下 /api/battle/vote 在一个事务中写入对战结果与投票记录（rating_applied=0）后立即返回，不更新评分表；
+后台任务攒满 VOTE_BATCH_SIZE 票或等待 VOTE_FLUSH_INTERVAL 秒后，把这批投票合并为按模型的增量，
+以一条 UPDATE 累加到评分表，并在同一事务中把这些投票标记为已应用（rating_applied=1）。
+热门模型的评分行每批只写一次，而不是每票一次。
+
+投票记录在返回前已提交；应用失败的批次按指数退避重试（见 BatchWriter），重试后仍失败或进程崩溃时，
+尚未应用的投票仍留在 votes 表中，由 recover() 在启动时以及之后每 VOTE_RECOVER_INTERVAL 秒补上
+（也覆盖已下线实例留下的投票）。
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+
+from models.database import async_session_maker
+from models.schemas import Vote
+from .batch_writer import BatchWriter
+from .rating_service import RatingService
+import config
+
+
+class VoteQueue(BatchWriter):
+    """
+    投票评分的批量应用器
+    请求路径只做一次 put_nowait；后台任务攒满 batch_size 票或等待 flush_interval 秒后一次性应用
+    """
+
+    name = "投票评分批量应用"
+
+    def __init__(self, batch_size: int, flush_interval: float, **kwargs):
+        super().__init__(batch_size, flush_interval, **kwargs)
+        self.applied = 0
+        self.recovered = 0
+
+    def submit(self, vote_id: str):
+        """登记一张已提交、评分尚未应用的投票（不等待应用）"""
+        self._put(vote_id)
+
+    async def write_batch(self, vote_ids: List[str]) -> int:
+        """
+        在一个事务中应用一批投票的评分，返回实际应用的票数；失败时抛出异常，投票保持 rating_applied=0
+        只处理仍为 rating_applied=0 的投票（加行锁），先以条件更新标记为已应用：
+        与 recover() 或其他实例并发时若有投票已被对方应用，整批回滚后重试，不会重复累加
+        """
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Vote.id, Vote.model_a_id, Vote.model_b_id, Vote.winner)
+                .where(Vote.id.in_(vote_ids), Vote.rating_applied == 0)
+                .with_for_update()
+            )
+            votes = result.all()
+            if not votes:
+                return 0
+
+            marked = await db.execute(
+                update(Vote)
+                .where(Vote.id.in_([vote_id for vote_id, *_ in votes]), Vote.rating_applied == 0)
+                .values(rating_applied=1)
+                .execution_options(synchronize_session=False)
+            )
+            if marked.rowcount != len(votes):
+                await db.rollback()
+                raise RuntimeError("部分投票已被并发应用")
+
+            deltas: Dict[str, Dict[str, float]] = {}
+            for _, model_a_id, model_b_id, winner in votes:
+                for model_id, delta in RatingService.vote_deltas(model_a_id, model_b_id, winner).items():
+                    merged = deltas.setdefault(model_id, {})
+                    for column, value in delta.items():
+                        merged[column] = merged.get(column, 0) + value
+
+            await RatingService.apply_deltas(db, deltas)
+            await db.commit()
+        RatingService.invalidate_leaderboard()
+        self.applied += len(votes)
+        return len(votes)
+
+    async def recover(self) -> int:
+        """应用 votes 表中所有尚未应用评分的投票（启动时及定期调用），返回应用的票数"""
+        recovered = 0
+        last_id = None
+        while True:
+            async with async_session_maker() as db:
+                query = select(Vote.id).where(Vote.rating_applied == 0)
+                if last_id is not None:
+                    query = query.where(Vote.id > last_id)
+                result = await db.execute(query.order_by(Vote.id).limit(self.batch_size))
+                vote_ids = result.scalars().all()
+            if not vote_ids:
+                return recovered
+            recovered += await self._flush(vote_ids) or 0
+            last_id = vote_ids[-1]
+
+    async def run_periodic_recovery(self, interval: float):
+        """每 interval 秒补偿一次尚未应用的投票（由应用生命周期启动和取消）"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                recovered = await self.recover()
+            except Exception as e:
+                print(f"补偿尚未应用的投票失败: {str(e)}")
+                continue
+            if recovered:
+                self.recovered += recovered
+                print(f"已补充应用 {recovered} 张投票的评分")
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": config.VOTE_QUEUE_ENABLED,
+            "pending": self.pending,
+            "applied": self.applied,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed": self.failed,
+            "recovered": self.recovered,
+        }
+
+
+_shared_queue: Optional[VoteQueue] = None
+
+
+def get_vote_queue() -> VoteQueue:
+    """获取进程内共享的投票队列"""
+    global _shared_queue
+    if _shared_queue is None:
+        _shared_queue = VoteQueue(config.VOTE_BATCH_SIZE, config.VOTE_FLUSH_INTERVAL)
+    return _shared_queue
@@ -183,10 +183,12 @@ async function sendBattleMessage() {
         }
 
         // 显示加载状态
-        document.getElementById('response-a').innerHTML = '<div class="loading">思考中...</div>';
-        document.getElementById('response-b').innerHTML = '<div class="loading">思考中...</div>';
+        const responseA = document.getElementById('response-a');
+        const responseB = document.getElementById('response-b');
+        responseA.innerHTML = '<div class="loading">思考中...</div>';
+        responseB.innerHTML = '<div class="loading">思考中...</div>';
 
-        const response = await fetch('/api/battle/chat', {
+        const response = await fetch('/api/battle/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -195,13 +197,16 @@ async function sendBattleMessage() {
             })
         });
 
-        if (!response.ok) throw new Error('发送消息失败');
+        if (!response.ok) throw new Error(await readErrorDetail(response, '发送消息失败，请重试'));
 
-        const data = await response.json();
-
-        // 显示回复
-        document.getElementById('response-a').textContent = data.response_a;
-        document.getElementById('response-b').textContent = data.response_b;
+        // 逐段显示两个模型的回复
+        const { saved } = await renderDualStream(response, responseA, responseB);
+        if (!saved) {
+            // 有模型调用失败：本轮未计入对战，这场对战不能投票
+            showError('有模型调用失败，这场对战不能投票，请开始新的对战');
+            document.getElementById('battle-start').style.display = 'block';
+            return;
+        }
 
         // 显示投票区域
         document.getElementById('voting-section').style.display = 'block';
@@ -210,7 +215,7 @@ async function sendBattleMessage() {
 
     } catch (error) {
         console.error('发送消息失败:', error);
-        showError('发送消息失败，请重试');
+        showError(error.message || '发送消息失败，请重试');
         sendBtn.disabled = false;
         if (battleInputSection) battleInputSection.style.display = 'block';
     }
@@ -329,10 +334,12 @@ async function sendSideBySideMessage() {
             userMsg.style.display = 'block';
         }
 
-        document.getElementById('sidebyside-response-a').innerHTML = '<div class="loading">思考中...</div>';
-        document.getElementById('sidebyside-response-b').innerHTML = '<div class="loading">思考中...</div>';
+        const responseA = document.getElementById('sidebyside-response-a');
+        const responseB = document.getElementById('sidebyside-response-b');
+        responseA.innerHTML = '<div class="loading">思考中...</div>';
+        responseB.innerHTML = '<div class="loading">思考中...</div>';
 
-        const response = await fetch('/api/chat/sidebyside', {
+        const response = await fetch('/api/chat/sidebyside/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -343,13 +350,16 @@ async function sendSideBySideMessage() {
             })
         });
 
-        if (!response.ok) throw new Error('发送消息失败');
+        if (!response.ok) throw new Error(await readErrorDetail(response, '发送消息失败，请重试'));
 
-        const data = await response.json();
-        sideBySideSessionId = data.session_id;
-
-        document.getElementById('sidebyside-response-a').textContent = data.response_a;
-        document.getElementById('sidebyside-response-b').textContent = data.response_b;
+        const { sessionId, saved } = await renderDualStream(response, responseA, responseB);
+        if (sessionId) sideBySideSessionId = sessionId;
+        if (!saved) {
+            // 有模型调用失败：本轮未写入会话，可以重新发送
+            showError('有模型调用失败，本轮未保存，请重试');
+            if (sideBySideInputSection) sideBySideInputSection.style.display = 'block';
+            return;
+        }
 
         // 显示投票区并重置状态
         sideBySideVoted = false;
@@ -360,7 +370,7 @@ async function sendSideBySideMessage() {
 
     } catch (error) {
         console.error('发送消息失败:', error);
-        showError('发送消息失败，请重试');
+        showError(error.message || '发送消息失败，请重试');
         if (sideBySideInputSection) sideBySideInputSection.style.display = 'block';
     } finally {
         sendBtn.disabled = false;
@@ -459,6 +469,7 @@ function renderLeaderboard(leaderboard) {
             <div>排名</div>
             <div>模型</div>
             <div>评分</div>
+            <div>BT 评分 (95% CI)</div>
             <div>对战数</div>
             <div>胜率</div>
             <div>胜/负/平</div>
@@ -467,11 +478,16 @@ function renderLeaderboard(leaderboard) {
 
     leaderboard.forEach(item => {
         const rankEmoji = item.rank === 1 ? '🥇' : item.rank === 2 ? '🥈' : item.rank === 3 ? '🥉' : '';
+        // Bradley–Terry 评分由后台定期计算，刚启动时可能还没有
+        const btRating = item.bt_rating === null || item.bt_rating === undefined
+            ? '-'
+            : `${Math.round(item.bt_rating)} <span class="ci">(${Math.round(item.bt_ci_lower)}–${Math.round(item.bt_ci_upper)})</span>`;
         html += `
             <div class="leaderboard-row">
                 <div class="rank">${rankEmoji} ${item.rank}</div>
                 <div class="model-name">${item.model_name}</div>
                 <div class="stat rating">${item.rating}</div>
+                <div class="stat">${btRating}</div>
                 <div class="stat">${item.total_battles}</div>
                 <div class="stat">${item.win_rate}%</div>
                 <div class="stat">${item.wins}/${item.losses}/${item.ties}</div>
@@ -482,7 +498,75 @@ function renderLeaderboard(leaderboard) {
     container.innerHTML = html;
 }
 
+// ===== 流式输出 =====
+// 读取 text/event-stream 响应，每解析出一个事件调用一次 onEvent(event, data)
+async function readSSE(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            onEvent(event, data ? JSON.parse(data) : {});
+        }
+    }
+}
+
+// 将双模型事件流渲染到两个回复区域，返回 { sessionId, saved }（有一侧失败时本轮未保存）
+async function renderDualStream(response, elementA, elementB) {
+    const targets = { a: elementA, b: elementB };
+    const started = { a: false, b: false };
+    let sessionId = null;
+    let saved = false;
+
+    const append = (side, text) => {
+        const el = targets[side];
+        if (!started[side]) {
+            el.textContent = '';
+            started[side] = true;
+        }
+        el.textContent += text;
+    };
+
+    await readSSE(response, (event, data) => {
+        if (event === 'a' || event === 'b') {
+            append(event, data.delta);
+        } else if (event === 'error') {
+            append(data.side, `${started[data.side] ? '\n\n' : ''}抱歉，模型调用失败: ${data.message}`);
+        } else if (event === 'session' || event === 'end') {
+            sessionId = data.session_id;
+            if (event === 'end') saved = data.saved;
+        }
+    });
+
+    return { sessionId, saved };
+}
+
 // ===== 工具函数 =====
+// 读取接口返回的错误说明（如 503 限流提示），读取失败时使用默认文案
+async function readErrorDetail(response, fallback) {
+    try {
+        const data = await response.json();
+        return data.detail || fallback;
+    } catch (e) {
+        return fallback;
+    }
+}
+
 function showLoading(mode) {
     // 可以添加全局加载指示器
 }
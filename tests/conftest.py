@@ -0,0 +1,211 @@
+"""
+测试夹具：内存 SQLite + 零延迟的假 ModelService，通过进程内 ASGI 传输驱动 main.app
+环境变量必须在导入 config / main 之前设置
+"""
+import os
+
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite://"
+# 固定的对战令牌密钥，不在工作目录生成密钥文件
+os.environ["BATTLE_TOKEN_SECRET"] = "test-battle-token-secret"
+
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from sqlalchemy import event
+
+from services import model_service as model_service_module
+from services.model_service import ModelService
+
+REPLY = "这是假模型的回复。"
+
+
+class FakeModelService(ModelService):
+    """不访问上游的 ModelService：立即返回固定回复，其余逻辑（选模型、限流检查等）沿用真实实现"""
+
+    async def get_completion(
+        self,
+        model_id: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 8000,
+    ) -> str:
+        return f"[{model_id}] {REPLY}"
+
+    async def stream_completion(
+        self,
+        model_id: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 8000,
+    ) -> AsyncIterator[str]:
+        for delta in (f"[{model_id}] ", REPLY):
+            yield delta
+
+
+class _ASGIResponseStream(httpx.AsyncByteStream):
+    """边生成边读取的响应体；关闭时取消仍在运行的应用"""
+
+    def __init__(self, chunks: asyncio.Queue, task: asyncio.Task):
+        self._chunks = chunks
+        self._task = task
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                # 与真实网络一致：响应中途断开表现为读取错误
+                raise httpx.ReadError(str(chunk)) from chunk
+            yield chunk
+
+    async def aclose(self):
+        if not self._task.done():
+            self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    进程内调用 ASGI 应用的传输，响应头到达即返回、响应体逐块交给客户端
+    httpx.ASGITransport 会先缓冲完整的响应体，测不出首 token 延迟与首 token 之后的行为
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(name.lower(), value) for name, value in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": ("127.0.0.1", 123),
+            "root_path": "",
+        }
+        request_sent = False
+        started: asyncio.Future = asyncio.get_running_loop().create_future()
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        async def receive():
+            nonlocal request_sent
+            if request_sent:
+                # 客户端不会主动断开：等到响应关闭时被取消
+                await asyncio.Event().wait()
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started.set_result(message)
+            elif message["type"] == "http.response.body":
+                await chunks.put(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await chunks.put(None)
+
+        async def run():
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                if started.done():
+                    await chunks.put(e)
+                else:
+                    started.set_exception(e)
+
+        task = asyncio.create_task(run())
+        try:
+            message = await started
+        except BaseException:
+            # 等待响应头时被取消（如对冲胜出后取消另一路），同时取消上游应用
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        return httpx.Response(
+            message["status"],
+            headers=message.get("headers", []),
+            stream=_ASGIResponseStream(chunks, task),
+        )
+
+
+# 路由模块在导入时取共享实例，先替换再导入 main
+model_service_module._shared_service = FakeModelService()
+
+from main import app  # noqa: E402
+from models.database import engine, init_db  # noqa: E402
+import config  # noqa: E402
+
+
+class QueryCounter:
+    """统计执行的 SQL 语句数"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client() -> AsyncIterator[httpx.AsyncClient]:
+    await init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http_client:
+        yield http_client
+    await engine.dispose()
+
+
+@pytest.fixture
+def queries() -> QueryCounter:
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(engine.sync_engine, "before_cursor_execute", counter)
+
+
+@pytest.fixture
+async def make_service(client, monkeypatch) -> AsyncIterator[Callable[..., ModelService]]:
+    """
+    构建连到假上游（benchmarks.fake_upstream.create_app）的真实 ModelService，请求经 StreamingASGITransport 在进程内完成
+    endpoints: {端点名: (provider, 假上游应用)}；model_endpoints: 模型 -> 端点名列表
+    依赖 client 夹具以确保用量账本的表已创建
+    """
+    services: List[ModelService] = []
+
+    def _make(
+        endpoints: Dict[str, Tuple[str, object]],
+        model_endpoints: Optional[Dict[str, List[str]]] = None,
+    ) -> ModelService:
+        monkeypatch.setattr(config, "UPSTREAM_ENDPOINTS", {
+            name: {"provider": provider, "base_url": f"http://{name}/v1", "api_key": f"key-{name}"}
+            for name, (provider, _) in endpoints.items()
+        })
+        monkeypatch.setattr(config, "MODEL_ENDPOINTS", model_endpoints or {})
+        service = ModelService()
+        for name, (_, upstream_app) in endpoints.items():
+            service.registry.endpoints[name].client = AsyncOpenAI(
+                api_key=f"key-{name}",
+                base_url=f"http://{name}/v1",
+                http_client=httpx.AsyncClient(transport=StreamingASGITransport(upstream_app)),
+                max_retries=0,
+            )
+        services.append(service)
+        return service
+
+    yield _make
+    for service in services:
+        await service.aclose()
@@ -0,0 +1,36 @@
+"""运维 API（/api/admin）的令牌校验"""
+import pytest
+
+import config
+
+pytestmark = pytest.mark.anyio
+
+ENDPOINTS = [
+    ("GET", "/api/admin/upstream"),
+    ("GET", "/api/admin/votes"),
+    ("POST", "/api/admin/ratings/rebuild?full=true"),
+    ("POST", "/api/admin/ratings/snapshot"),
+    ("POST", "/api/admin/ratings/bradley-terry"),
+]
+
+
+@pytest.mark.parametrize("method,path", ENDPOINTS)
+async def test_disabled_without_configured_token(client, monkeypatch, method, path):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "")
+    response = await client.request(method, path, headers={"X-Admin-Token": "anything"})
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("method,path", ENDPOINTS)
+async def test_missing_or_wrong_token(client, monkeypatch, method, path):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret-token")
+    assert (await client.request(method, path)).status_code == 401
+    response = await client.request(method, path, headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+
+async def test_valid_token(client, monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret-token")
+    response = await client.get("/api/admin/votes", headers={"X-Admin-Token": "secret-token"})
+    assert response.status_code == 200, response.text
+    assert "unapplied" in response.json()
@@ -0,0 +1,240 @@
+"""对战 / 并排对比接口：分侧对话历史、上游额度不足时的 503、调用失败的轮次不保存也不能投票、每场对战只记一票、投票后排行榜缓存失效"""
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List
+
+import pytest
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from conftest import REPLY
+from main import app
+from models.database import Base, async_session_maker, engine, get_db
+from models.schemas import AbandonedTurn, Message, Vote, generate_uuid
+from services.battle_token import verify_battle_token
+from services.model_service import ModelCallFailed, get_model_service
+import config
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_each_model_only_sees_its_own_replies(client, monkeypatch):
+    service = get_model_service()
+    sent = {}
+    original = service.get_completion
+
+    async def record(model_id, messages, *args, **kwargs):
+        sent[model_id] = messages
+        return await original(model_id, messages, *args, **kwargs)
+
+    monkeypatch.setattr(service, "get_completion", record)
+
+    session_id = (await client.post("/api/battle/start")).json()["session_id"]
+    for message in ("第一个问题", "第二个问题"):
+        response = await client.post("/api/battle/chat", json={"session_id": session_id, "message": message})
+        assert response.status_code == 200, response.text
+
+    assert len(sent) == 2
+    for model_id, messages in sent.items():
+        assert messages == [
+            {"role": "user", "content": "第一个问题"},
+            {"role": "assistant", "content": f"[{model_id}] {REPLY}"},
+            {"role": "user", "content": "第二个问题"},
+        ]
+
+
+async def test_exhausted_rate_limit_returns_503(client, monkeypatch):
+    service = get_model_service()
+    models = (await client.get("/api/chat/models")).json()["models"]
+    model_a_id, model_b_id = models[0]["id"], models[1]["id"]
+    monkeypatch.setattr(service, "_rate_limiters", {})
+    monkeypatch.setattr(config, "MODEL_RATE_LIMITS", {model_a_id: {"rpm": 1}})
+    # 用掉每个端点上唯一的请求额度：下一个请求要排队约 60 秒，超过 RATE_LIMIT_MAX_WAIT
+    for endpoint in service.registry.candidates(model_a_id):
+        service._get_rate_limiter(endpoint, model_a_id).requests.take(1)
+
+    response = await client.post("/api/chat/sidebyside", json={
+        "model_a_id": model_a_id, "model_b_id": model_b_id, "message": "你好",
+    })
+
+    assert response.status_code == 503, response.text
+    assert int(response.headers["Retry-After"]) > config.RATE_LIMIT_MAX_WAIT
+
+
+def fail_side_a(monkeypatch, session_id: str):
+    """让对战中模型 A 的调用失败（非流式在调用时失败，流式在首段输出后中断）"""
+    service = get_model_service()
+    failing_model = verify_battle_token(session_id).model_a_id
+    get_completion, stream_completion = service.get_completion, service.stream_completion
+
+    async def completion(model_id, messages, *args, **kwargs):
+        if model_id == failing_model:
+            raise ModelCallFailed(model_id, "上游 500")
+        return await get_completion(model_id, messages, *args, **kwargs)
+
+    async def stream(model_id, messages, *args, **kwargs):
+        async for delta in stream_completion(model_id, messages, *args, **kwargs):
+            yield delta
+            if model_id == failing_model:
+                raise ModelCallFailed(model_id, "上游连接中断")
+
+    monkeypatch.setattr(service, "get_completion", completion)
+    monkeypatch.setattr(service, "stream_completion", stream)
+
+
+async def saved_and_failed_turns(session_id: str):
+    """(messages 表中的行数, 记录了错误的放弃轮次)"""
+    battle_id = verify_battle_token(session_id).battle_id
+    async with async_session_maker() as db:
+        messages = await db.execute(select(Message.id).where(Message.session_id == battle_id))
+        failed = await db.execute(
+            select(AbandonedTurn.error).where(
+                AbandonedTurn.session_id == battle_id, AbandonedTurn.error.is_not(None)
+            )
+        )
+        return len(messages.all()), list(failed.scalars())
+
+
+async def test_failed_side_is_not_saved_and_blocks_vote(client, monkeypatch):
+    session_id = (await client.post("/api/battle/start")).json()["session_id"]
+    fail_side_a(monkeypatch, session_id)
+
+    response = await client.post("/api/battle/chat", json={"session_id": session_id, "message": "你好"})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["response_a"], body["error_a"], body["error_b"]) == ("", "上游 500", None)
+    assert body["response_b"].endswith(REPLY)
+    assert await saved_and_failed_turns(session_id) == (0, ["a: 上游 500"])
+
+    # 之后成功的轮次照常保存，但这场对战不能投票
+    monkeypatch.undo()
+    response = await client.post("/api/battle/chat", json={"session_id": session_id, "message": "再试一次"})
+    assert response.json()["error_a"] is None
+    vote = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "model_b"})
+    assert vote.status_code == 400
+    assert "调用失败" in vote.json()["detail"]
+    assert await battle_votes(session_id) == []
+
+
+async def test_failed_side_in_stream_sends_error_and_is_not_saved(client, monkeypatch):
+    session_id = (await client.post("/api/battle/start")).json()["session_id"]
+    fail_side_a(monkeypatch, session_id)
+
+    response = await client.post("/api/battle/chat/stream", json={"session_id": session_id, "message": "你好"})
+    assert response.status_code == 200
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert ("error", {"side": "a", "message": "上游连接中断"}) in events
+    assert ("done", {"side": "b"}) in events
+    assert events[-1] == ("end", {"session_id": session_id, "saved": False})
+    assert not any("抱歉" in json.dumps(data, ensure_ascii=False) for _, data in events)
+
+    messages, failed = await saved_and_failed_turns(session_id)
+    assert messages == 0 and failed == ["a: 上游连接中断"]
+    vote = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "model_b"})
+    assert vote.status_code == 400
+    assert "调用失败" in vote.json()["detail"]
+
+
+async def chatted_battle(client) -> str:
+    session_id = (await client.post("/api/battle/start")).json()["session_id"]
+    response = await client.post("/api/battle/chat", json={"session_id": session_id, "message": "你好"})
+    assert response.status_code == 200, response.text
+    return session_id
+
+
+async def battle_votes(session_id: str, session_maker=async_session_maker) -> List[str]:
+    """对战的全部投票结果"""
+    battle_id = verify_battle_token(session_id).battle_id
+    async with session_maker() as db:
+        result = await db.execute(select(Vote.winner).where(Vote.battle_id == battle_id))
+        return list(result.scalars())
+
+
+@pytest.fixture
+async def file_db(client, tmp_path) -> AsyncIterator[async_sessionmaker]:
+    """
+    接口改用临时 SQLite 文件：每个请求一条独立连接
+    内存库的所有会话共用一条连接，一个请求回滚会连带撤销另一个请求未提交的写入，测不了真实的并发
+    """
+    file_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'votes.db'}")
+    async with file_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(file_engine, expire_on_commit=False)
+
+    async def get_file_db():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = get_file_db
+    yield session_maker
+    del app.dependency_overrides[get_db]
+    await file_engine.dispose()
+
+
+async def test_duplicate_vote_is_rejected(client):
+    session_id = await chatted_battle(client)
+    first = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "model_a"})
+    assert first.status_code == 200, first.text
+
+    second = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "model_b"})
+    assert second.status_code == 400
+    assert "已经投过票" in second.json()["detail"]
+    assert await battle_votes(session_id) == ["model_a"]
+
+
+async def test_concurrent_votes_count_once(client, file_db):
+    session_id = await chatted_battle(client)
+    winners = ("model_a", "model_b")
+    responses = await asyncio.gather(*(
+        client.post("/api/battle/vote", json={"session_id": session_id, "winner": winner})
+        for winner in winners
+    ))
+
+    assert sorted(response.status_code for response in responses) == [200, 400]
+    accepted = winners[[response.status_code for response in responses].index(200)]
+    assert await battle_votes(session_id, file_db) == [accepted]
+    reveal = await client.get(f"/api/battle/reveal/{session_id}")
+    assert reveal.json()["winner"] == accepted
+
+
+async def test_unique_index_rejects_second_vote_row(client):
+    # 条件更新之外的兜底：迁移 0007 建的 votes.battle_id 唯一索引
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_indexes("votes"))
+    assert any(index["name"] == "uq_votes_battle_id" and index["unique"] for index in indexes)
+
+    session_id = await chatted_battle(client)
+    response = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "tie"})
+    assert response.status_code == 200, response.text
+
+    battle_id = verify_battle_token(session_id).battle_id
+    async with async_session_maker() as db:
+        db.add(Vote(
+            id=generate_uuid(), battle_id=battle_id, winner="model_a",
+            model_a_id=response.json()["model_a_id"], model_b_id=response.json()["model_b_id"],
+        ))
+        with pytest.raises(IntegrityError):
+            await db.commit()
+
+
+
+async def leaderboard_battles(client) -> Dict[str, int]:
+    response = await client.get("/api/leaderboard", params={"limit": 100})
+    return {entry["model_id"]: entry["total_battles"] for entry in response.json()["leaderboard"]}
+
+
+async def test_vote_invalidates_cached_leaderboard(client, monkeypatch):
+    monkeypatch.setattr(config, "LEADERBOARD_CACHE_TTL", 60)
+    session_id = await chatted_battle(client)
+    before = await leaderboard_battles(client)
+
+    vote = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "model_a"})
+    assert vote.status_code == 200, vote.text
+
+    # 缓存尚未过期，但投票后立即失效
+    model_a_id = vote.json()["model_a_id"]
+    assert (await leaderboard_battles(client))[model_a_id] == before.get(model_a_id, 0) + 1
@@ -0,0 +1,48 @@
+"""对战令牌：签名密钥的持久化，以及密钥更换后已写库的对战仍可访问"""
+import pytest
+
+import config
+from services import battle_token
+
+pytestmark = pytest.mark.anyio
+
+
+def test_generated_secret_is_persisted(tmp_path):
+    path = str(tmp_path / "secret")
+    first = battle_token._load_or_create_secret(path)
+    assert first
+    # 其他进程或重启后读到同一个密钥
+    assert battle_token._load_or_create_secret(path) == first
+    assert list(tmp_path.iterdir()) == [tmp_path / "secret"]
+
+
+def test_unset_secret_uses_secret_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "BATTLE_TOKEN_SECRET", "")
+    monkeypatch.setattr(config, "BATTLE_TOKEN_SECRET_FILE", str(tmp_path / "secret"))
+    monkeypatch.setattr(battle_token, "_file_secret", None)
+    token = battle_token.issue_battle_token("gpt-4o", "deepseek-chat")
+
+    # 模拟进程重启：内存中的密钥丢失，重新从文件读取
+    monkeypatch.setattr(battle_token, "_file_secret", None)
+    claims = battle_token.verify_battle_token(token)
+    assert (claims.model_a_id, claims.model_b_id) == ("gpt-4o", "deepseek-chat")
+
+
+async def test_stored_battle_survives_secret_change(client, monkeypatch):
+    session_id = (await client.post("/api/battle/start")).json()["session_id"]
+    response = await client.post("/api/battle/chat", json={"session_id": session_id, "message": "你好"})
+    assert response.status_code == 200, response.text
+    unsaved = (await client.post("/api/battle/start")).json()["session_id"]
+
+    monkeypatch.setattr(config, "BATTLE_TOKEN_SECRET", "rotated-secret")
+
+    response = await client.post("/api/battle/chat", json={"session_id": session_id, "message": "继续"})
+    assert response.status_code == 200, response.text
+    response = await client.post("/api/battle/vote", json={"session_id": session_id, "winner": "tie"})
+    assert response.status_code == 200, response.text
+    response = await client.get(f"/api/battle/reveal/{session_id}")
+    assert response.status_code == 200, response.text
+
+    # 尚未写库的对战不能凭签名不匹配的令牌创建
+    response = await client.post("/api/battle/chat", json={"session_id": unsaved, "message": "你好"})
+    assert response.status_code == 404
@@ -0,0 +1,79 @@
+"""Bradley–Terry 排行榜：拟合能还原已知强度，手动刷新不排队"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from services.bradley_terry import BradleyTerryLeaderboard, fit, pairwise_matrices
+
+pytestmark = pytest.mark.anyio
+
+
+TRUE_THETA = np.array([-1.2, -0.4, 0.0, 0.5, 1.1])
+
+
+def synthetic_votes(games_per_pair: int, seed: int = 0):
+    """按已知强度 TRUE_THETA 模拟每对模型 games_per_pair 场对战（不含平局）的胜负矩阵"""
+    rng = np.random.default_rng(seed)
+    n = len(TRUE_THETA)
+    wins = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            p = 1.0 / (1.0 + np.exp(TRUE_THETA[j] - TRUE_THETA[i]))
+            wins[i, j] = rng.binomial(games_per_pair, p)
+            wins[j, i] = games_per_pair - wins[i, j]
+    return wins, np.zeros_like(wins)
+
+
+def test_fit_recovers_known_strengths():
+    wins, ties = synthetic_votes(games_per_pair=5000)
+    theta, iterations = fit(wins, ties)
+    centered = theta - theta.mean()
+    assert np.abs(centered - (TRUE_THETA - TRUE_THETA.mean())).max() < 0.08
+    assert list(np.argsort(theta)) == list(range(len(TRUE_THETA)))
+    assert iterations < 20
+
+
+def test_warm_start_converges_in_few_steps():
+    wins, ties = synthetic_votes(games_per_pair=2000)
+    theta, _ = fit(wins, ties)
+    more_wins, _ = synthetic_votes(games_per_pair=50, seed=1)
+    _, iterations = fit(wins + more_wins, ties, theta)
+    assert iterations <= 3
+
+
+def test_ties_count_as_half_wins():
+    groups = {("x", "y", "tie"): 30, ("y", "z", "model_a"): 20, ("z", "y", "model_a"): 20}
+    wins, ties = pairwise_matrices(groups, ["x", "y", "z"])
+    theta, _ = fit(wins, ties)
+    # 只有平局或胜负各半的模型强度相同
+    assert np.allclose(theta, theta[0], atol=1e-6)
+
+
+def test_prior_keeps_undefeated_model_finite():
+    wins = np.array([[0.0, 10.0], [0.0, 0.0]])
+    theta, _ = fit(wins, np.zeros_like(wins))
+    assert np.all(np.isfinite(theta))
+    assert theta[0] > theta[1]
+
+
+async def _unexpected_load():
+    raise AssertionError("不应重新读取投票")
+
+
+async def test_refresh_returns_cached_summary_while_running():
+    leaderboard = BradleyTerryLeaderboard(rounds=4, workers=0)
+    leaderboard._load = _unexpected_load
+    async with leaderboard._lock:
+        summary = await asyncio.wait_for(leaderboard.refresh(), timeout=1)
+    assert summary is leaderboard.summary()
+
+
+async def test_refresh_respects_min_interval():
+    leaderboard = BradleyTerryLeaderboard(rounds=4, workers=0)
+    leaderboard._load = _unexpected_load
+    leaderboard._refreshed_at = time.monotonic()
+    assert await leaderboard.refresh(min_interval=60) is leaderboard.summary()
+    with pytest.raises(AssertionError):
+        await leaderboard.refresh(min_interval=0)
@@ -0,0 +1,80 @@
+"""透明压缩的文本列：读写往返、旧的未压缩数据、存量数据压缩"""
+import pytest
+from sqlalchemy import select, text
+
+from models.compression import ZLIB_HEADER, compress_existing, is_compressed
+from models.database import async_session_maker
+from models.schemas import Message
+
+pytestmark = pytest.mark.anyio
+
+SHORT = "短消息"
+LONG = "很长的回复。" * 500  # 远超 COMPRESS_MIN_BYTES
+
+
+async def write(session_id: str, contents) -> None:
+    async with async_session_maker() as db:
+        for turn, content in enumerate(contents):
+            db.add(Message(session_id=session_id, turn=turn, side="a", content=content))
+        await db.commit()
+
+
+async def read(session_id: str):
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Message.content).where(Message.session_id == session_id).order_by(Message.turn)
+        )
+        return list(result.scalars())
+
+
+async def raw(session_id: str):
+    """按列名读取原始值，不经过 CompressedText 的解压"""
+    async with async_session_maker() as db:
+        result = await db.execute(
+            text("SELECT content FROM messages WHERE session_id = :session_id ORDER BY turn"),
+            {"session_id": session_id},
+        )
+        return list(result.scalars())
+
+
+async def test_round_trip(client):
+    await write("compress-round-trip", [SHORT, LONG])
+
+    assert await read("compress-round-trip") == [SHORT, LONG]
+    short, long = await raw("compress-round-trip")
+    assert short == SHORT.encode("utf-8")
+    assert long.startswith(ZLIB_HEADER) and len(long) < len(LONG.encode("utf-8")) // 10
+
+
+async def test_legacy_plain_text_rows_are_readable(client):
+    async with async_session_maker() as db:
+        await db.execute(
+            text(
+                "INSERT INTO messages (session_id, turn, side, content) "
+                "VALUES ('compress-legacy', 0, 'a', :text), ('compress-legacy', 1, 'a', :data)"
+            ),
+            {"text": LONG, "data": SHORT.encode("utf-8")},
+        )
+        await db.commit()
+
+    assert await read("compress-legacy") == [LONG, SHORT]
+
+
+async def test_compress_existing_compresses_legacy_rows(client):
+    async with async_session_maker() as db:
+        await db.execute(
+            text(
+                "INSERT INTO messages (session_id, turn, side, content) "
+                "VALUES ('compress-existing', 0, 'a', :long), ('compress-existing', 1, 'a', :short)"
+            ),
+            {"long": LONG, "short": SHORT},
+        )
+        await db.commit()
+
+    assert await compress_existing(batch_size=2) >= 1
+    long, short = await raw("compress-existing")
+    assert is_compressed(long)
+    assert not is_compressed(short)
+    assert await read("compress-existing") == [LONG, SHORT]
+    # 可重复执行：已压缩的数据不再处理
+    assert await compress_existing(batch_size=2) == 0
@@ -0,0 +1,48 @@
+"""按模型自适应并发限制：慢启动与 AIMD"""
+import pytest
+from openai import APITimeoutError
+
+from services.concurrency import AdaptiveLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+def make_limiter(initial: int = 4, max_limit: int = 64) -> AdaptiveLimiter:
+    return AdaptiveLimiter(initial, min_limit=1, max_limit=max_limit, backoff=0.5, queue_timeout=1, max_queue=10)
+
+
+async def succeed(limiter: AdaptiveLimiter, times: int):
+    for _ in range(times):
+        async with limiter.acquire():
+            pass
+
+
+async def overload(limiter: AdaptiveLimiter):
+    with pytest.raises(APITimeoutError):
+        async with limiter.acquire():
+            raise APITimeoutError(request=None)
+
+
+async def test_slow_start_doubles_per_window():
+    limiter = make_limiter(initial=4)
+    await succeed(limiter, 4)
+    assert limiter.limit == 8
+    await succeed(limiter, 8)
+    assert limiter.limit == 16
+    assert limiter.stats()["slow_start"] is True
+
+
+async def test_slow_start_is_capped_by_max_limit():
+    limiter = make_limiter(initial=4, max_limit=10)
+    await succeed(limiter, 20)
+    assert limiter.limit == 10
+
+
+async def test_overload_ends_slow_start():
+    limiter = make_limiter(initial=16)
+    await overload(limiter)
+    assert limiter.limit == 8
+    assert limiter.slow_start is False
+    # 之后回到加性增长：一个窗口（约 8 次成功）上限才 +1
+    await succeed(limiter, 8)
+    assert 8.9 < limiter.limit < 9.0
@@ -0,0 +1,52 @@
+"""按上下文窗口裁剪对话历史"""
+import pytest
+
+from services.context import ContextWindowExceeded, completion_budget, fit_history
+import config
+
+MODEL = "test-model"  # 未配置窗口，使用 DEFAULT_CONTEXT_WINDOW
+SYSTEM = {"role": "system", "content": "系统"}  # 2 + 4 tokens
+
+
+def message(role: str, text: str):
+    return {"role": role, "content": text * 100}  # 每条 104 tokens
+
+
+HISTORY = [
+    SYSTEM,
+    message("user", "一"), message("assistant", "甲"),
+    message("user", "二"), message("assistant", "乙"),
+    message("user", "三"), message("assistant", "丙"),
+    message("user", "四"),
+]
+
+
+@pytest.fixture(autouse=True)
+def exact_window(monkeypatch):
+    monkeypatch.setattr(config, "CONTEXT_WINDOW_HEADROOM", 0.0)
+    monkeypatch.setattr(config, "CONTEXT_MIN_COMPLETION_TOKENS", 50)
+
+
+@pytest.mark.parametrize("window,kept", [
+    (9 + 104 * 7 + 200, HISTORY),
+    (9 + 104 * 5 + 200, [SYSTEM] + HISTORY[3:]),
+    (9 + 104 * 3 + 200, [SYSTEM] + HISTORY[5:]),
+    (9 + 104 * 3 + 199, [SYSTEM] + HISTORY[7:]),
+])
+def test_drops_oldest_whole_turns_and_keeps_system(monkeypatch, window, kept):
+    # 固定开销：system 6 + 回复引导 3
+    monkeypatch.setattr(config, "DEFAULT_CONTEXT_WINDOW", window)
+    assert fit_history(MODEL, HISTORY, max_tokens=200) == kept
+
+
+def test_current_turn_only_shrinks_reply(monkeypatch):
+    monkeypatch.setattr(config, "DEFAULT_CONTEXT_WINDOW", 9 + 104 + 60)
+    messages = fit_history(MODEL, HISTORY, max_tokens=200)
+    assert messages == [SYSTEM, HISTORY[-1]]
+    assert completion_budget(MODEL, messages, 200) == 60
+
+
+def test_rejects_message_that_does_not_fit(monkeypatch):
+    monkeypatch.setattr(config, "DEFAULT_CONTEXT_WINDOW", 9 + 104 + 49)
+    with pytest.raises(ContextWindowExceeded):
+        fit_history(MODEL, HISTORY, max_tokens=200)
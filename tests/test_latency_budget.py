@@ -0,0 +1,169 @@
+"""
+各端点自身开销的延迟预算（上游为零延迟的假 ModelService）
+
+这些用例只衡量平台自身的开销：路由、校验、数据库往返与序列化。
+新增一次数据库往返或一段昂贵的序列化，会同时体现在中位延迟和 SQL 语句数上。
+机器较慢时可以用 LATENCY_BUDGET_SCALE 整体放宽时间预算（如 2 表示放宽一倍），语句数预算不受影响。
+"""
+import os
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+SCALE = float(os.getenv("LATENCY_BUDGET_SCALE", "1"))
+WARMUP = 20
+SAMPLES = 200
+
+# 中位延迟预算（毫秒），按当前实现的实测值留约 50% 余量
+BUDGET_MS = {
+    "battle/start": 2,
+    "battle/chat": 7,
+    "battle/chat/stream": 8,
+    "battle/vote": 10,
+    "chat/sidebyside": 8,
+    "leaderboard": 4,
+}
+
+# 单次请求的 SQL 语句数上限
+MAX_QUERIES = {
+    "battle/start": 0,
+    "battle/chat": 3,
+    "battle/chat/followup": 2,
+    "battle/chat/stream": 3,
+    "battle/vote": 4,
+    "chat/sidebyside": 3,
+    "leaderboard": 1,
+}
+
+
+async def median_ms(call: Callable[[int], Awaitable[httpx.Response]], samples: int = SAMPLES) -> float:
+    """预热后逐个发出请求，返回中位延迟（毫秒）；第 i 次调用传入 i"""
+    for i in range(WARMUP):
+        response = await call(i)
+        assert response.status_code == 200, response.text
+    durations: List[float] = []
+    for i in range(WARMUP, WARMUP + samples):
+        started = time.perf_counter()
+        response = await call(i)
+        durations.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return statistics.median(durations) * 1000
+
+
+def assert_budget(endpoint: str, median: float):
+    budget = BUDGET_MS[endpoint] * SCALE
+    assert median <= budget, f"{endpoint} 中位延迟 {median:.2f} ms 超出预算 {budget:.2f} ms"
+
+
+def assert_queries(endpoint: str, count: int):
+    assert count <= MAX_QUERIES[endpoint], (
+        f"{endpoint} 执行了 {count} 条 SQL，超出预算 {MAX_QUERIES[endpoint]} 条"
+    )
+
+
+async def start_battle(client: httpx.AsyncClient) -> str:
+    response = await client.post("/api/battle/start")
+    assert response.status_code == 200, response.text
+    return response.json()["session_id"]
+
+
+async def test_battle_start(client, queries):
+    queries.count = 0
+    await start_battle(client)
+    assert_queries("battle/start", queries.count)
+
+    assert_budget("battle/start", await median_ms(lambda i: client.post("/api/battle/start")))
+
+
+async def test_battle_chat(client, queries):
+    session_id = await start_battle(client)
+    payload = {"session_id": session_id, "message": "你好"}
+
+    queries.count = 0
+    response = await client.post("/api/battle/chat", json=payload)
+    assert response.status_code == 200, response.text
+    assert response.json()["response_a"]
+    assert_queries("battle/chat", queries.count)
+
+    # 后续轮次只读一次消息表、写一条多行 INSERT，不再查对战表
+    queries.count = 0
+    response = await client.post("/api/battle/chat", json=payload)
+    assert response.status_code == 200, response.text
+    assert_queries("battle/chat/followup", queries.count)
+
+    # 每次都用新的对战，避免对话历史越来越长
+    session_ids = [await start_battle(client) for _ in range(WARMUP + SAMPLES)]
+    median = await median_ms(lambda i: client.post(
+        "/api/battle/chat", json={"session_id": session_ids[i], "message": "你好"}
+    ))
+    assert_budget("battle/chat", median)
+
+
+async def test_battle_chat_stream(client, queries):
+    async def chat_stream(session_id: str) -> httpx.Response:
+        payload = {"session_id": session_id, "message": "你好"}
+        async with client.stream("POST", "/api/battle/chat/stream", json=payload) as response:
+            body = await response.aread()
+        assert b"event: end" in body
+        return response
+
+    session_id = await start_battle(client)
+    queries.count = 0
+    await chat_stream(session_id)
+    assert_queries("battle/chat/stream", queries.count)
+
+    session_ids = [await start_battle(client) for _ in range(WARMUP + SAMPLES)]
+    assert_budget("battle/chat/stream", await median_ms(lambda i: chat_stream(session_ids[i])))
+
+
+async def test_battle_vote(client, queries):
+    session_ids = []
+    for _ in range(WARMUP + SAMPLES + 1):
+        session_id = await start_battle(client)
+        response = await client.post(
+            "/api/battle/chat", json={"session_id": session_id, "message": "你好"}
+        )
+        assert response.status_code == 200, response.text
+        session_ids.append(session_id)
+
+    queries.count = 0
+    response = await client.post(
+        "/api/battle/vote", json={"session_id": session_ids.pop(), "winner": "model_a"}
+    )
+    assert response.status_code == 200, response.text
+    assert_queries("battle/vote", queries.count)
+
+    winners = ["model_a", "model_b", "tie"]
+    median = await median_ms(lambda i: client.post(
+        "/api/battle/vote", json={"session_id": session_ids[i], "winner": winners[i % 3]}
+    ))
+    assert_budget("battle/vote", median)
+
+
+async def test_sidebyside_chat(client, queries):
+    models = (await client.get("/api/chat/models")).json()["models"]
+    payload = {"model_a_id": models[0]["id"], "model_b_id": models[1]["id"], "message": "你好"}
+
+    queries.count = 0
+    response = await client.post("/api/chat/sidebyside", json=payload)
+    assert response.status_code == 200, response.text
+    assert_queries("chat/sidebyside", queries.count)
+
+    assert_budget("chat/sidebyside", await median_ms(
+        lambda i: client.post("/api/chat/sidebyside", json=payload)
+    ))
+
+
+async def test_leaderboard(client, queries):
+    queries.count = 0
+    response = await client.get("/api/leaderboard")
+    assert response.status_code == 200, response.text
+    assert response.json()["total_models"] > 0
+    assert_queries("leaderboard", queries.count)
+
+    assert_budget("leaderboard", await median_ms(lambda i: client.get("/api/leaderboard")))
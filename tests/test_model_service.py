@@ -0,0 +1,333 @@
+"""ModelService 的端点注册表、故障转移、重试、熔断、自适应并发、对冲、流式输出与断开取消（上游为 benchmarks.fake_upstream 的假上游）"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from api.disconnect import ClientDisconnected, cancel_on_disconnect
+from benchmarks.fake_upstream import create_app
+from services.model_service import ModelCallFailed
+from services.registry import Endpoint, ProviderRegistry
+from services.retry import RetryPolicy
+import config
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+FAST = {"ttft_ms": 0, "tokens_per_second": 1e6, "output_tokens": 3}
+
+
+def healthy(seed: int = 1):
+    return create_app({"default": FAST}, seed=seed)
+
+
+def failing(seed: int = 1):
+    return create_app({"default": {**FAST, "error_500": 1.0}}, seed=seed)
+
+
+def slow(ttft_ms: float, seed: int = 1):
+    return create_app({"default": {**FAST, "ttft_ms": ttft_ms}}, seed=seed)
+
+
+def single_attempt(monkeypatch):
+    """不重试，每次调用只打一次上游"""
+    monkeypatch.setitem(config.RETRY_POLICIES, "openai", {
+        "max_attempts": 1, "base_delay": 0, "max_delay": 0, "deadline": 60,
+    })
+
+
+def counts(upstream_app, model_id: str = "gpt-4o"):
+    return upstream_app.state.upstream.stats.get(model_id, {})
+
+
+def test_registry_rejects_unknown_provider():
+    with pytest.raises(ValueError, match="provider"):
+        ProviderRegistry({"gw": {"provider": "anthropic", "base_url": "http://gw/v1", "api_key": "k"}}, {})
+
+
+def test_registry_rejects_unknown_model_endpoint():
+    endpoints = {"gw": {"provider": "openai", "base_url": "http://gw/v1", "api_key": "k"}}
+    with pytest.raises(ValueError, match="missing"):
+        ProviderRegistry(endpoints, {"gpt-4o": ["gw", "missing"]})
+
+
+async def test_unregistered_provider_uses_default_retry_policy(make_service):
+    service = make_service({"openai": ("openai", healthy())})
+    endpoint = Endpoint("custom", "custom", "http://custom/v1", "k")
+    try:
+        assert isinstance(service._retry_policy(endpoint), RetryPolicy)
+        assert service._retry_policy(endpoint) is service._default_retry_policy
+    finally:
+        await endpoint.client.close()
+
+
+async def test_failover_to_non_openai_provider(make_service):
+    broken, backup = failing(), healthy()
+    service = make_service(
+        {"gw-broken": ("openai", broken), "gw-deepseek": ("deepseek", backup)},
+        {"gpt-4o": ["gw-broken", "gw-deepseek"]},
+    )
+    # 两个端点都没有延迟样本时得分相同；先给 gw-deepseek 记一个较慢的延迟，确保第一次请求打到故障端点
+    service.registry.endpoints["gw-deepseek"].health("gpt-4o").record(True, 1.0)
+
+    reply = await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)
+
+    assert reply.strip().startswith("lorem")
+    assert broken.state.upstream.stats["gpt-4o"]["error_500"] == 1
+    assert backup.state.upstream.stats["gpt-4o"]["completed"] == 1
+    assert service.get_failover_stats() == {"gpt-4o": 1}
+
+
+def test_endpoint_stats_do_not_expose_urls_or_keys():
+    registry = ProviderRegistry(
+        {"gw": {"provider": "openai", "base_url": "http://secret-gateway/v1", "api_key": "sk-secret"}}, {}
+    )
+    text = str(registry.stats())
+    assert "secret-gateway" not in text and "sk-secret" not in text
+
+
+async def test_retry_honours_retry_after(make_service):
+    # seed=2 时 gpt-4o 的第 1 个请求命中 429、第 2 个成功
+    upstream = create_app({"default": {**FAST, "error_429": 0.5, "retry_after": 0.2}}, seed=2)
+    service = make_service({"openai": ("openai", upstream)})
+
+    started = time.monotonic()
+    reply = await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)
+
+    assert reply.strip().startswith("lorem")
+    assert time.monotonic() - started >= 0.2
+    assert counts(upstream)["error_429"] == 1
+    assert counts(upstream)["completed"] == 1
+    assert service.get_retry_stats() == {"gpt-4o": 1}
+
+
+async def test_breaker_opens_probes_and_closes(make_service, monkeypatch):
+    single_attempt(monkeypatch)
+    monkeypatch.setattr(config, "BREAKER_MIN_CALLS", 2)
+    monkeypatch.setattr(config, "BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(config, "BREAKER_OPEN_SECONDS", 0.2)
+    monkeypatch.setattr(config, "BREAKER_HALF_OPEN_PROBES", 1)
+    upstream = failing()
+    service = make_service({"openai": ("openai", upstream)})
+
+    for _ in range(2):
+        with pytest.raises(ModelCallFailed):
+            await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)
+    assert service.get_breaker_stats()["gpt-4o"]["state"] == "open"
+
+    # 熔断期间不再打上游
+    with pytest.raises(ModelCallFailed, match="熔断"):
+        await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)
+    assert counts(upstream)["requests"] == 2
+
+    upstream.state.upstream.default["error_500"] = 0.0
+    await asyncio.sleep(0.25)
+    assert service.get_breaker_stats()["gpt-4o"]["state"] == "half_open"
+    assert (await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)).strip().startswith("lorem")
+    assert service.get_breaker_stats()["gpt-4o"]["state"] == "closed"
+
+
+async def test_limiter_caps_in_flight_requests(make_service, monkeypatch):
+    monkeypatch.setattr(config, "MODEL_CONCURRENCY_INITIAL", 2)
+    upstream = slow(100)
+    service = make_service({"openai": ("openai", upstream)})
+
+    tasks = [
+        asyncio.create_task(service.get_completion("gpt-4o", MESSAGES, max_tokens=16))
+        for _ in range(4)
+    ]
+    await asyncio.sleep(0.05)
+    stats = service.get_concurrency_stats()["gpt-4o"]
+    assert (stats["in_flight"], stats["queued"]) == (2, 2)
+    assert all(reply.strip().startswith("lorem") for reply in await asyncio.gather(*tasks))
+
+
+async def test_limiter_shrinks_on_429_and_grows_on_success(make_service, monkeypatch):
+    single_attempt(monkeypatch)
+    monkeypatch.setattr(config, "MODEL_CONCURRENCY_INITIAL", 8)
+    upstream = create_app({"default": {**FAST, "error_429": 1.0}})
+    service = make_service({"openai": ("openai", upstream)})
+
+    with pytest.raises(ModelCallFailed):
+        await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)
+    stats = service.get_concurrency_stats()["gpt-4o"]
+    assert stats["limit"] == 4 and stats["slow_start"] is False
+
+    upstream.state.upstream.default["error_429"] = 0.0
+    for _ in range(4):
+        await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)
+    # 收缩后是加性增长：约一个窗口的成功只让上限 +1
+    assert 4.5 < service._limiters["gpt-4o"].limit < 5.0
+
+
+async def test_hedging_respects_budget(make_service, monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_BUDGET_RATIO", 0.5)
+    monkeypatch.setattr(config, "HEDGE_PERCENTILE", 0.5)
+    monkeypatch.setattr(config, "HEDGE_MIN_SAMPLES", 1)
+    primary, backup = slow(300), healthy()
+    service = make_service(
+        {"gw-primary": ("openai", primary), "gw-hedge": ("openai", backup)},
+        {"gpt-4o": ["gw-primary", "gw-hedge"]},
+    )
+    service.registry.endpoints["gw-hedge"].hedge_only = True
+    for _ in range(10):
+        service._latency.record("gpt-4o", 0.01)
+
+    for _ in range(4):
+        assert (await service.get_completion("gpt-4o", MESSAGES, max_tokens=16)).strip().startswith("lorem")
+    await asyncio.sleep(0.05)
+
+    # 额外请求最多占主请求的 50%：第 2、4 次调用发出备用请求并胜出，被超越的主请求随即取消
+    stats = service.get_hedge_stats()
+    assert (stats["requests"], stats["hedges"]) == (4, 2)
+    assert stats["models"]["gpt-4o"]["issued"] == 2 and stats["models"]["gpt-4o"]["won"] == 2
+    assert counts(backup)["completed"] == 2
+    assert counts(primary)["completed"] == 2 and counts(primary)["cancelled"] == 2
+
+
+async def test_hedge_avoids_endpoint_used_by_primary(make_service, monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_BUDGET_RATIO", 1.0)
+    monkeypatch.setattr(config, "HEDGE_PERCENTILE", 0.5)
+    monkeypatch.setattr(config, "HEDGE_MIN_SAMPLES", 1)
+    first, second = slow(500), healthy()
+    service = make_service(
+        {"gw-first": ("openai", first), "gw-second": ("openai", second)},
+        {"gpt-4o": ["gw-first", "gw-second"]},
+    )
+    service.registry.endpoints["gw-second"].health("gpt-4o").record(True, 1.0)
+    for _ in range(10):
+        service._latency.record("gpt-4o", 0.1)
+
+    call = asyncio.ensure_future(service.get_completion("gpt-4o", MESSAGES, max_tokens=16))
+    await asyncio.sleep(0.03)
+    # 主请求已发往 gw-first；此时排序翻转，重新排序会把 gw-second 误当作主请求所在的端点
+    service.registry.endpoints["gw-first"].health("gpt-4o").record(True, 10.0)
+
+    assert (await call).strip().startswith("lorem")
+    await asyncio.sleep(0.05)
+
+    stats = service.get_hedge_stats()["models"]["gpt-4o"]
+    assert stats["issued"] == 1 and stats["won"] == 1
+    assert counts(second)["completed"] == 1
+    assert counts(first)["requests"] == 1 and counts(first)["cancelled"] == 1
+
+
+async def collect(stream) -> str:
+    return "".join([delta async for delta in stream])
+
+
+async def test_stream_yields_deltas(make_service):
+    upstream = create_app({"default": {**FAST, "output_tokens": 5}}, seed=1)
+    service = make_service({"openai": ("openai", upstream)})
+
+    assert await collect(service.stream_completion("gpt-4o", MESSAGES, max_tokens=16)) == (
+        "lorem ipsum dolor sit amet "
+    )
+    assert counts(upstream)["completed"] == 1
+
+
+async def test_stream_retries_429_before_first_token(make_service):
+    # seed=2 时 gpt-4o 的第 1 个请求命中 429、第 2 个成功
+    upstream = create_app({"default": {**FAST, "error_429": 0.5, "retry_after": 0.2}}, seed=2)
+    service = make_service({"openai": ("openai", upstream)})
+
+    started = time.monotonic()
+    reply = await collect(service.stream_completion("gpt-4o", MESSAGES, max_tokens=16))
+
+    assert reply.strip().startswith("lorem")
+    assert time.monotonic() - started >= 0.2
+    assert counts(upstream)["error_429"] == 1 and counts(upstream)["completed"] == 1
+    assert service.get_retry_stats() == {"gpt-4o": 1}
+
+
+async def test_stream_does_not_retry_after_first_token(make_service):
+    # seed=6 时 gpt-4o 的第 1 个请求输出 1 个 token 后断开
+    upstream = create_app({"default": {**FAST, "output_tokens": 5, "drop": 1.0}}, seed=6)
+    service = make_service({"openai": ("openai", upstream)})
+
+    deltas = []
+    with pytest.raises(httpx.ReadError):
+        async for delta in service.stream_completion("gpt-4o", MESSAGES, max_tokens=16):
+            deltas.append(delta)
+
+    # 已输出的内容无法重放：不重试、不切换端点
+    assert deltas == ["lorem "]
+    assert counts(upstream)["requests"] == 1 and counts(upstream)["drop"] == 1
+    assert service.get_retry_stats() == {}
+
+
+async def test_stream_hedge_win_cancels_loser(make_service, monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_BUDGET_RATIO", 1.0)
+    monkeypatch.setattr(config, "HEDGE_PERCENTILE", 0.5)
+    monkeypatch.setattr(config, "HEDGE_MIN_SAMPLES", 1)
+    primary, backup = slow(500), healthy()
+    service = make_service(
+        {"gw-primary": ("openai", primary), "gw-hedge": ("openai", backup)},
+        {"gpt-4o": ["gw-primary", "gw-hedge"]},
+    )
+    service.registry.endpoints["gw-hedge"].hedge_only = True
+    for _ in range(10):
+        service._ttft.record("gpt-4o", 0.01)
+
+    started = time.monotonic()
+    reply = await collect(service.stream_completion("gpt-4o", MESSAGES, max_tokens=16))
+
+    # 备用请求先产出首个 token，主请求的上游流随即关闭，不必等它的首 token
+    assert reply == "lorem ipsum dolor "
+    assert time.monotonic() - started < 0.4
+    stats = service.get_hedge_stats()["models"]["gpt-4o"]
+    assert stats["issued"] == 1 and stats["won"] == 1
+    assert counts(backup)["completed"] == 1
+    assert counts(primary)["cancelled"] == 1 and "completed" not in counts(primary)
+
+
+async def test_dual_stream_reports_failing_side(make_service, monkeypatch):
+    single_attempt(monkeypatch)
+    upstream = create_app({"default": FAST, "models": {"gpt-4o-mini": {"error_500": 1.0}}}, seed=1)
+    service = make_service({"openai": ("openai", upstream)})
+
+    events = [
+        event async for event in service.stream_dual_completion(
+            "gpt-4o", "gpt-4o-mini", MESSAGES, MESSAGES, max_tokens=16
+        )
+    ]
+
+    # 一侧失败不影响另一侧：a 完整输出并结束，b 只有一个错误事件
+    assert "".join(payload for side, kind, payload in events if side == "a" and kind == "delta") == (
+        "lorem ipsum dolor "
+    )
+    assert [kind for side, kind, _ in events if side == "a" and kind != "delta"] == ["done"]
+    assert [kind for side, kind, _ in events if side == "b"] == ["error"]
+    assert counts(upstream, "gpt-4o")["completed"] == 1
+    assert counts(upstream, "gpt-4o-mini")["error_500"] == 1
+
+
+class DisconnectingRequest:
+    """is_disconnected() 在 after 秒后返回 True 的请求"""
+
+    def __init__(self, after: float):
+        self.deadline = time.monotonic() + after
+
+    async def is_disconnected(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+
+async def test_disconnect_cancels_upstream_calls(make_service, monkeypatch):
+    monkeypatch.setattr(config, "DISCONNECT_POLL_INTERVAL", 0.01)
+    upstream = slow(5000)
+    service = make_service({"openai": ("openai", upstream)})
+
+    started = time.monotonic()
+    with pytest.raises(ClientDisconnected):
+        await cancel_on_disconnect(
+            DisconnectingRequest(0.05),
+            service.get_dual_completion("gpt-4o", "gpt-4o-mini", MESSAGES, MESSAGES, max_tokens=16),
+        )
+
+    assert time.monotonic() - started < 1
+    assert counts(upstream, "gpt-4o")["cancelled"] == 1
+    assert counts(upstream, "gpt-4o-mini")["cancelled"] == 1
@@ -0,0 +1,80 @@
+"""RPM / TPM 令牌桶限流：先到先得的排队、取消时归还额度、按实际用量结算、超过等待上限时拒绝"""
+import asyncio
+import time
+
+import pytest
+
+from services.rate_limit import RateLimiter, RateLimitExceeded
+
+pytestmark = pytest.mark.anyio
+
+TPM = 6000  # 每秒补充 100 个 token
+
+
+def drained(max_wait: float = 10) -> RateLimiter:
+    """只限制 TPM、额度已用完的限流器"""
+    limiter = RateLimiter(rpm=0, tpm=TPM, max_wait=max_wait)
+    limiter.tokens.take(TPM)
+    return limiter
+
+
+async def test_waiters_are_served_in_arrival_order():
+    limiter = drained()
+    finished = []
+
+    async def request(name: str, tokens: int):
+        await limiter.acquire(tokens)
+        finished.append(name)
+
+    # 小请求后到，即使它单独排队只需 0.05 秒，也要排在先到的大请求之后
+    big = asyncio.create_task(request("big", 20))
+    await asyncio.sleep(0)
+    small = asyncio.create_task(request("small", 5))
+    await asyncio.sleep(0.01)
+    assert limiter.waiting == 2
+
+    await asyncio.gather(big, small)
+    assert finished == ["big", "small"]
+    assert limiter.waiting == 0
+
+
+async def test_cancelled_waiter_gives_back_its_reservation():
+    limiter = drained()
+    waiter = asyncio.create_task(limiter.acquire(50))
+    await asyncio.sleep(0.01)
+    assert limiter.estimate_wait(10) > 0.5
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    # 预约的 50 个 token 已归还：后来者只需等自己的份额
+    assert limiter.waiting == 0
+    assert limiter.estimate_wait(10) < 0.15
+
+
+async def test_settle_returns_unused_tokens():
+    limiter = RateLimiter(rpm=0, tpm=TPM, max_wait=10)
+    await limiter.acquire(1000)
+    assert limiter.tokens.tokens == pytest.approx(TPM - 1000, abs=5)
+
+    limiter.settle(1000, 200)
+    assert limiter.tokens.tokens == pytest.approx(TPM - 200, abs=5)
+
+    # 实际用量超过预约时不再额外扣除
+    limiter.settle(100, 300)
+    assert limiter.tokens.tokens == pytest.approx(TPM - 200, abs=5)
+
+
+async def test_wait_beyond_deadline_is_rejected_without_reserving():
+    limiter = drained(max_wait=0.1)
+
+    started = time.monotonic()
+    with pytest.raises(RateLimitExceeded) as raised:
+        await limiter.acquire(50)
+
+    assert time.monotonic() - started < 0.05
+    assert raised.value.retry_after == pytest.approx(0.5, abs=0.05)
+    assert limiter.rejected == 1
+    # 被拒绝的请求不占用额度
+    assert limiter.estimate_wait(5) < 0.1
@@ -0,0 +1,62 @@
+"""评分重建：从快照增量重放与全量重放的结果一致"""
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Tuple
+
+import pytest
+from sqlalchemy import select
+
+from models.database import async_session_maker
+from models.schemas import ModelRating, Vote, generate_uuid
+from services.rating_rebuild import rebuild_ratings, take_snapshot
+from services.rating_service import _COUNTER_COLUMNS
+import config
+
+pytestmark = pytest.mark.anyio
+
+MODELS = ["rebuild-a", "rebuild-b", "rebuild-c"]
+
+
+async def add_votes(count: int, created_at: datetime, seed: int):
+    rng = random.Random(seed)
+    async with async_session_maker() as db:
+        for _ in range(count):
+            model_a_id, model_b_id = rng.sample(MODELS, 2)
+            db.add(Vote(
+                id=generate_uuid(), battle_id=generate_uuid(),
+                winner=rng.choice(["model_a", "model_b", "tie"]),
+                model_a_id=model_a_id, model_b_id=model_b_id, created_at=created_at,
+            ))
+        await db.commit()
+
+
+async def ratings() -> Dict[str, Tuple]:
+    async with async_session_maker() as db:
+        result = await db.execute(select(ModelRating))
+        return {
+            rating.model_id: tuple(getattr(rating, column) for column in _COUNTER_COLUMNS)
+            for rating in result.scalars()
+        }
+
+
+async def test_incremental_rebuild_matches_full_rebuild(client, monkeypatch):
+    # 与 SQLite 的 CURRENT_TIMESTAMP 一致：UTC、不带时区
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    await add_votes(40, now - timedelta(hours=2), seed=1)
+    # 快照的高水位在一小时前：包含第一批投票
+    monkeypatch.setattr(config, "RATING_SNAPSHOT_LAG", 3600)
+    snapshot = await take_snapshot()
+
+    await add_votes(25, now - timedelta(minutes=30), seed=2)
+    monkeypatch.setattr(config, "RATING_SNAPSHOT_LAG", 0)
+    incremental = await rebuild_ratings()
+    assert incremental["mode"] == "incremental"
+    assert incremental["based_on"] == snapshot["snapshot_id"]
+    assert incremental["replayed_votes"] >= 25
+    after_incremental = await ratings()
+
+    full = await rebuild_ratings(full=True)
+    assert full["mode"] == "full"
+    assert full["total_votes"] == incremental["total_votes"]
+    assert await ratings() == after_incremental
+    assert sum(after_incremental[model_id][1] for model_id in MODELS) == 2 * 65
@@ -0,0 +1,75 @@
+"""评分分片：分片求和与不分片的结果一致，关闭分片后合并回 model_ratings"""
+import random
+from typing import Dict
+
+import pytest
+from sqlalchemy import func, select
+
+from models.database import async_session_maker
+from models.schemas import ModelRating, ModelRatingStripe
+from services.rating_service import RatingService, _COUNTER_COLUMNS, _ratings_query
+import config
+
+pytestmark = pytest.mark.anyio
+
+WINNERS = [random.Random(0).choice(["model_a", "model_b", "tie"]) for _ in range(60)]
+
+
+async def add_models(*model_ids: str):
+    async with async_session_maker() as db:
+        for model_id in model_ids:
+            db.add(ModelRating(model_id=model_id, model_name=model_id))
+        await db.commit()
+
+
+async def play(model_a_id: str, model_b_id: str):
+    """按 WINNERS 逐票更新评分，每票一个事务"""
+    for winner in WINNERS:
+        async with async_session_maker() as db:
+            await RatingService.update_ratings(db, model_a_id, model_b_id, winner)
+            await db.commit()
+
+
+async def totals(model_id: str) -> Dict[str, int]:
+    """读取路径上的评分与计数（model_ratings 加分片之和）"""
+    async with async_session_maker() as db:
+        row = (await db.execute(_ratings_query().where(ModelRating.model_id == model_id))).one()
+    return {column: int(getattr(row, column)) for column in _COUNTER_COLUMNS}
+
+
+async def stored(model_id: str) -> Dict[str, int]:
+    """只看 model_ratings 中的那一行"""
+    async with async_session_maker() as db:
+        row = (await db.execute(select(ModelRating).where(ModelRating.model_id == model_id))).scalar_one()
+    return {column: int(getattr(row, column)) for column in _COUNTER_COLUMNS}
+
+
+async def test_striped_sums_match_unstriped_totals_and_fold_back(client, monkeypatch):
+    await add_models("plain-a", "plain-b", "striped-a", "striped-b")
+    await play("plain-a", "plain-b")
+    expected = {"a": await totals("plain-a"), "b": await totals("plain-b")}
+    assert expected["a"]["total_battles"] == len(WINNERS)
+
+    monkeypatch.setattr(config, "RATING_STRIPES", 4)
+    await RatingService.init_stripes(["striped-a", "striped-b"])
+    await play("striped-a", "striped-b")
+
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(ModelRatingStripe.model_id, func.count())
+            .where(ModelRatingStripe.total_battles > 0)
+            .group_by(ModelRatingStripe.model_id)
+        )
+        used = dict(result.all())
+    # 投票确实分散到了多个分片，model_ratings 的那一行没有被更新
+    assert used["striped-a"] > 1 and used["striped-b"] > 1
+    assert (await stored("striped-a"))["total_battles"] == 0
+    assert {"a": await totals("striped-a"), "b": await totals("striped-b")} == expected
+
+    # 关闭分片后启动：分片计数合并回 model_ratings，分片行删除
+    monkeypatch.setattr(config, "RATING_STRIPES", 1)
+    await RatingService.init_stripes(["striped-a", "striped-b"])
+    async with async_session_maker() as db:
+        assert (await db.execute(select(func.count()).select_from(ModelRatingStripe))).scalar_one() == 0
+    assert {"a": await stored("striped-a"), "b": await stored("striped-b")} == expected
+    assert {"a": await totals("striped-a"), "b": await totals("striped-b")} == expected
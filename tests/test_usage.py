@@ -0,0 +1,115 @@
+"""用量账本的批量写入与汇总"""
+import asyncio
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from models.database import async_session_maker
+from models.schemas import UsageRecord
+from services.usage import UsageCall, UsageLedger, UsageService
+import config
+
+pytestmark = pytest.mark.anyio
+
+
+def call(model_id: str = "ledger-test") -> UsageCall:
+    return UsageCall(model_id, "openai", "openai", prompt_tokens=10)
+
+
+async def ledger_rows(model_id: str) -> int:
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(func.count()).select_from(UsageRecord).where(UsageRecord.model_id == model_id)
+        )
+        return result.scalar_one()
+
+
+async def test_rows_are_written_in_batches(client, monkeypatch):
+    ledger = UsageLedger(batch_size=3, flush_interval=0.05, max_pending=100)
+    batches = []
+    write = ledger.write_batch
+
+    async def record_batch(batch):
+        batches.append(len(batch))
+        await write(batch)
+
+    monkeypatch.setattr(ledger, "write_batch", record_batch)
+
+    for _ in range(7):
+        ledger.record(call("ledger-batches"))
+    await asyncio.sleep(0.1)
+    # 攒满 3 条立即写；最后不足一批的在 flush_interval 后写入
+    assert batches == [3, 3, 1]
+
+    await ledger.aclose()
+    assert await ledger_rows("ledger-batches") == 7
+    assert ledger.stats()["written"] == 7
+
+
+async def test_full_queue_drops_instead_of_blocking(client):
+    ledger = UsageLedger(batch_size=10, flush_interval=10, max_pending=2)
+    for _ in range(3):
+        ledger.record(call("ledger-full"))
+    assert ledger.stats()["dropped"] == 1
+
+    # 关闭时写完队列中剩余的记录，不等 flush_interval
+    await asyncio.wait_for(ledger.aclose(), timeout=1)
+    assert await ledger_rows("ledger-full") == 2
+
+
+async def test_failed_batch_is_retried_with_backoff(client, monkeypatch):
+    ledger = UsageLedger(batch_size=10, flush_interval=0.01, max_pending=100, retry_backoff=0.01)
+    attempts = []
+    write = ledger.write_batch
+
+    async def flaky(batch):
+        attempts.append(len(batch))
+        if len(attempts) < 3:
+            raise RuntimeError("database is locked")
+        await write(batch)
+
+    monkeypatch.setattr(ledger, "write_batch", flaky)
+    ledger.record(call("ledger-retry"))
+    await ledger.aclose()
+
+    assert attempts == [1, 1, 1]
+    assert await ledger_rows("ledger-retry") == 1
+    assert ledger.stats()["retries"] == 2
+    assert ledger.stats()["failed"] == 0
+
+
+class DecimalRows:
+    """按顺序返回预设结果的会话：模拟 MySQL 上 SUM / AVG 返回 Decimal"""
+
+    def __init__(self, *results):
+        self._results = list(results)
+
+    async def execute(self, query):
+        rows = self._results.pop(0)
+        return SimpleNamespace(all=lambda: rows, scalar_one=lambda: rows)
+
+
+def test_cost_accepts_decimal_sums(monkeypatch):
+    monkeypatch.setitem(config.MODEL_PRICING, "decimal-model", {"input": 2.0, "output": 8.0})
+    assert UsageService.cost("decimal-model", Decimal(1_000_000), Decimal(500_000)) == 6.0
+
+
+async def test_rollup_accepts_decimal_rows(monkeypatch):
+    monkeypatch.setitem(config.MODEL_PRICING, "decimal-model", {"input": 2.0, "output": 8.0})
+    db = DecimalRows(
+        [("decimal-model", 3, Decimal(1), Decimal(1_000_000), Decimal(500_000),
+          Decimal("0.25"), Decimal("1.5"), Decimal("42.04"))],
+        [("decimal-model", 2)],
+        [("other-model", 2)],
+        4,
+    )
+    rollup = await UsageService.rollup(db)
+    (model,) = rollup["models"]
+    assert model["cost"] == 6.0
+    assert model["cost_per_vote"] == 3.0
+    assert (model["errors"], model["prompt_tokens"], model["avg_ttft"], model["tokens_per_second"]) == (
+        1, 1_000_000, 0.25, 42.0
+    )
+    assert rollup["cost_per_vote"] == 1.5
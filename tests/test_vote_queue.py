@@ -0,0 +1,121 @@
+"""投票排队模式：批量应用、失败重试、尚未应用投票的定期补偿与排行榜缓存失效"""
+import asyncio
+from typing import Dict
+
+import pytest
+from sqlalchemy import select
+
+from models.database import async_session_maker
+from models.schemas import ModelRating, Vote, generate_uuid
+from services.rating_service import RatingService
+from services.vote_queue import VoteQueue
+import config
+
+pytestmark = pytest.mark.anyio
+
+
+async def unapplied_vote(model_a_id: str, model_b_id: str, winner: str = "model_a") -> str:
+    """直接写入一张评分尚未应用的投票，相当于投票后进程在应用前崩溃"""
+    vote_id = generate_uuid()
+    async with async_session_maker() as db:
+        db.add(Vote(
+            id=vote_id, battle_id=generate_uuid(), winner=winner,
+            model_a_id=model_a_id, model_b_id=model_b_id, rating_applied=0,
+        ))
+        await db.commit()
+    return vote_id
+
+
+async def rating_applied(vote_id: str) -> int:
+    async with async_session_maker() as db:
+        return (await db.execute(select(Vote.rating_applied).where(Vote.id == vote_id))).scalar_one()
+
+
+async def wins(*model_ids: str) -> Dict[str, int]:
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(ModelRating.model_id, ModelRating.wins).where(ModelRating.model_id.in_(model_ids))
+        )
+        return dict(result.all())
+
+
+async def test_submitted_votes_are_applied_in_one_batch(client):
+    queue = VoteQueue(batch_size=10, flush_interval=0.01)
+    for _ in range(3):
+        queue.submit(await unapplied_vote("queue-a", "queue-b"))
+    await queue.aclose()
+
+    assert await wins("queue-a", "queue-b") == {"queue-a": 3, "queue-b": 0}
+    assert queue.stats()["batches"] == 1
+
+
+async def test_periodic_recovery_picks_up_unapplied_vote(client):
+    queue = VoteQueue(batch_size=10, flush_interval=0.01)
+    # 进程内队列不知道这张投票，只能由定期补偿找到
+    vote_id = await unapplied_vote("recover-a", "recover-b", winner="model_b")
+    task = asyncio.create_task(queue.run_periodic_recovery(0.02))
+    try:
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if await rating_applied(vote_id):
+                break
+    finally:
+        task.cancel()
+
+    assert await rating_applied(vote_id) == 1
+    assert await wins("recover-a", "recover-b") == {"recover-a": 0, "recover-b": 1}
+    assert queue.stats()["recovered"] >= 1
+
+
+async def test_failed_batch_is_retried_without_double_counting(client, monkeypatch):
+    queue = VoteQueue(batch_size=10, flush_interval=0.01, retry_backoff=0.01)
+    apply_deltas = RatingService.apply_deltas
+    calls = []
+
+    async def fail_once(db, deltas):
+        calls.append(deltas)
+        await apply_deltas(db, deltas)
+        if len(calls) == 1:
+            raise RuntimeError("deadlock found")
+
+    monkeypatch.setattr(RatingService, "apply_deltas", fail_once)
+    vote_id = await unapplied_vote("retry-a", "retry-b")
+    queue.submit(vote_id)
+    await queue.aclose()
+
+    # 第一次的累加随事务回滚，重试后只计一票
+    assert len(calls) == 2
+    assert await rating_applied(vote_id) == 1
+    assert await wins("retry-a", "retry-b") == {"retry-a": 1, "retry-b": 0}
+    assert queue.stats()["retries"] == 1
+    assert queue.stats()["failed"] == 0
+
+
+async def test_vote_applied_elsewhere_is_not_counted_twice(client):
+    queue = VoteQueue(batch_size=10, flush_interval=0.01)
+    vote_id = await unapplied_vote("twice-a", "twice-b")
+    assert await queue.recover() == 1
+    # 队列里的同一张票（例如另一实例已补偿）不会再累加
+    queue.submit(vote_id)
+    await queue.aclose()
+
+    assert await wins("twice-a", "twice-b") == {"twice-a": 1, "twice-b": 0}
+
+
+async def test_applied_batch_invalidates_cached_leaderboard(client, monkeypatch):
+    monkeypatch.setattr(config, "LEADERBOARD_CACHE_TTL", 60)
+    queue = VoteQueue(batch_size=10, flush_interval=0.01)
+    queue.submit(await unapplied_vote("cache-a", "cache-b"))
+    await queue.aclose()
+    async with async_session_maker() as db:
+        cached = await RatingService.get_leaderboard_cached(db, limit=100)
+
+    queue = VoteQueue(batch_size=10, flush_interval=0.01)
+    queue.submit(await unapplied_vote("cache-a", "cache-b"))
+    await queue.aclose()
+    async with async_session_maker() as db:
+        leaderboard = await RatingService.get_leaderboard_cached(db, limit=100)
+
+    # 缓存尚未过期，但应用投票后立即失效
+    assert leaderboard is not cached
+    assert {entry["model_id"]: entry["wins"] for entry in leaderboard}["cache-a"] == 2